@@ -16,6 +16,7 @@ from globaleaks.utils.utility import datetime_now, datetime_null, get_disk_space
 from globaleaks.utils.log import log
 
 ANOMALY_MAP = {
+    'created_tokens': 100,
     'started_submissions': 100,
     'completed_submissions': 20,
     'failed_submissions': 5,
@@ -117,9 +118,7 @@ class Alarm(object):
 
         self.event_matrix.clear()
 
-        for event in State.tenant_state[tid].RecentEventQ:
-            self.event_matrix.setdefault(event.event_type, 0)
-            self.event_matrix[event.event_type] += 1
+        self.event_matrix.update(State.tenant_state[tid].RecentEventQ.counts())
 
         for event_name, threshold in ANOMALY_MAP.items():
             if event_name in self.event_matrix:
@@ -147,6 +146,10 @@ class Alarm(object):
                          (previous_activity_sl,
                          self.alarm_levels['activity']))
 
+        # the level is sent at every check so that also the API workers
+        # started after its change apply the captcha and the proof of work
+        State.notify_alarm(tid, self.alarm_levels['activity'])
+
         if State.tenant_cache[1].notification.disable_admin_notification_emails:
             return
 
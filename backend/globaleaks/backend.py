@@ -17,14 +17,23 @@ import globaleaks.mocks.twisted_mocks # pylint: disable=W0611
 from globaleaks.db import create_db, init_db, update_db, \
     sync_refresh_memory_variables, sync_clean_untracked_files
 from globaleaks.rest.api import APIResourceWrapper
+from globaleaks.sessions import Sessions
 from globaleaks.settings import Settings
 from globaleaks.state import State
 from globaleaks.utils.process import disable_swap
 from globaleaks.utils.sock import listen_tcp_on_sock, reserve_port_for_ip
+from globaleaks.utils.token import TokenList
 from globaleaks.utils.utility import fix_file_permissions, drop_privileges
 from globaleaks.utils.log import timedLogFormatter, LogObserver, log
 from globaleaks.workers.supervisor import ProcessSupervisor
 
+# settings forwarded to the API workers
+api_worker_settings = [
+    'devel_mode', 'working_path', 'client_path', 'api_prefix', 'orm_debug',
+    'storage_url', 'store_url', 'socks_host', 'socks_port', 'key_bits',
+    'acme_directory_url', 'enable_api_cache'
+]
+
 
 def fail_startup(excep):
     log.err("ERROR: Cannot start GlobaLeaks. Please manually examine the exception.")
@@ -92,10 +101,16 @@ class Service(service.Service):
 
             self._shutdown = True
             self.state.orm_tp.stop()
+            self.state.secure_delete_tp.stop()
+            self.state.export_tp.stop()
+            self.state.compress_tp.stop()
+            self.state.store_tp.stop()
+            self.state.hashing_pool.stop()
             d.callback(None)
 
         reactor.callLater(30, _shutdown, None)
 
+        self.state.process_supervisor.shutdown_api_workers()
         self.state.process_supervisor.shutdown()
 
         self.stop_jobs().addBoth(_shutdown)
@@ -141,7 +156,17 @@ class Service(service.Service):
         sync_clean_untracked_files()
         sync_refresh_memory_variables()
 
+        Sessions.set_store_url(Settings.store_url, self.state.store_tp)
+        TokenList.set_store_url(Settings.store_url, self.state.store_tp)
+        self.state.TempUploadFiles.set_store_url(Settings.store_url, self.state.store_tp)
+        self.state.AcmeChallenges.set_store_url(Settings.store_url, self.state.store_tp)
+
+        self.state.hashing_pool.start()
         self.state.orm_tp.start()
+        self.state.secure_delete_tp.start()
+        self.state.export_tp.start()
+        self.state.compress_tp.start()
+        self.state.store_tp.start()
 
         reactor.addSystemEventTrigger('before', 'shutdown', self.shutdown)
 
@@ -154,6 +179,11 @@ class Service(service.Service):
 
         self.state.process_supervisor.maybe_launch_https_workers()
 
+        if Settings.api_workers:
+            self.state.process_supervisor.launch_api_workers(self.state.http_socks,
+                                                             {k: getattr(Settings, k) for k in api_worker_settings},
+                                                             Settings.api_workers)
+
         self.start_jobs()
 
         self.print_listening_interfaces()
@@ -94,13 +94,13 @@ def update_db():
 
 def db_get_tracked_files(session):
     """
-    returns a list the basenames of files tracked by InternalFile and ReceiverFile.
+    returns the set of the basenames of files tracked by InternalFile, ReceiverFile and WhistleblowerFile.
     """
-    ifiles = [x[0] for x in session.query(models.InternalFile.filename)]
-    rfiles = [x[0] for x in session.query(models.ReceiverFile.filename)]
-    wbfiles = [x[0] for x in session.query(models.WhistleblowerFile.filename)]
+    tracked_files = set(x[0] for x in session.query(models.InternalFile.filename))
+    tracked_files.update(x[0] for x in session.query(models.ReceiverFile.filename))
+    tracked_files.update(x[0] for x in session.query(models.WhistleblowerFile.filename))
 
-    return [files for files in list(set(ifiles + rfiles + wbfiles))]
+    return tracked_files
 
 
 @transact_sync
@@ -110,14 +110,17 @@ def sync_clean_untracked_files(session):
     tracked by InternalFile/ReceiverFile.
     """
     tracked_files = db_get_tracked_files(session)
-    for filesystem_file in os.listdir(Settings.attachments_path):
-        if filesystem_file not in tracked_files:
-            file_to_remove = os.path.join(Settings.attachments_path, filesystem_file)
-            try:
-                log.debug('Removing untracked file: %s', file_to_remove)
-                security.overwrite_and_remove(file_to_remove)
-            except OSError:
-                log.err('Failed to remove untracked file', file_to_remove)
+
+    State.attachments_inventory.scan()
+
+    for filesystem_file in State.attachments_inventory.untracked(tracked_files):
+        file_to_remove = State.attachments_inventory.get_path(filesystem_file)
+        try:
+            log.debug('Removing untracked file: %s', file_to_remove)
+            security.overwrite_and_remove(file_to_remove)
+            State.attachments_inventory.discard(filesystem_file)
+        except OSError:
+            log.err('Failed to remove untracked file', file_to_remove)
 
 
 def db_set_cache_exception_delivery_list(session, tenant_cache):
@@ -7,29 +7,6 @@ from globaleaks.utils.utility import datetime_now, datetime_to_ISO8601
 # follow the checker, they are executed from handlers/base.py
 # by prepare() and/or flush()
 
-def file_upload_check(uri):
-    # /submission/ + token_id + /file  = 59 bytes
-    return (len(uri) == 59 and uri.endswith(b'/file')) or uri == b'/wbtip/upload'
-
-
-def submission_check(uri):
-    # Precise len checks are needed to match only submission urls and not file ones
-    # that are like /submission/0SjnzrUhuKx89hePh5Tw9eR3D18ftFZVQG6MaiK1Dy/file
-    return uri.startswith(b'/submission') and (len(uri) == 54 or len(uri) == 11)
-
-
-def login_check(uri):
-    return uri == b'/authentication'
-
-
-def message_check(uri):
-    return uri.startswith(b'/wbtip/messages/') or uri.startswith(b'/rtip/messages/')
-
-
-def comment_check(uri):
-    return uri == b'/wbtip/comments' or uri.startswith(b'/rtip/comments')
-
-
 def failure_status_check(http_code):
     # if code is missing is a failure because an Exception is raise before set
     # the status.
@@ -51,54 +28,77 @@ def updated_status_check(http_code):
 events_monitored = [
     {
         'name': 'failed_logins',
-        'handler_check': login_check,
-        'method': 'POST',
+        'handler': 'globaleaks.handlers.authentication.AuthenticationHandler',
+        'method': b'POST',
         'status_check': failure_status_check,
     },
     {
         'name': 'successful_logins',
-        'handler_check': login_check,
-        'method': 'POST',
+        'handler': 'globaleaks.handlers.authentication.AuthenticationHandler',
+        'method': b'POST',
         'status_check': ok_status_check
     },
+    {
+        'name': 'created_tokens',
+        'handler': 'globaleaks.handlers.token.TokenCreate',
+        'method': b'POST',
+        'status_check': created_status_check
+    },
     {
         'name': 'started_submissions',
-        'handler_check': submission_check,
-        'method': 'POST',
+        'handler': 'globaleaks.handlers.submission.SubmissionInstance',
+        'method': b'POST',
         'status_check': created_status_check
     },
     {
         'name': 'completed_submissions',
-        'handler_check': submission_check,
-        'method': 'PUT',
+        'handler': 'globaleaks.handlers.submission.SubmissionInstance',
+        'method': b'PUT',
         'status_check': updated_status_check
     },
     {
         'name': 'failed_submissions',
-        'handler_check': submission_check,
-        'method': 'PUT',
+        'handler': 'globaleaks.handlers.submission.SubmissionInstance',
+        'method': b'PUT',
         'status_check': failure_status_check
     },
     {
         'name': 'comments',
-        'handler_check': comment_check,
-        'method': 'POST',
+        'handler': 'globaleaks.handlers.wbtip.WBTipCommentCollection',
+        'method': b'POST',
         'status_check': created_status_check
     },
     {
         'name': 'messages',
-        'handler_check': message_check,
-        'method': 'POST',
+        'handler': 'globaleaks.handlers.wbtip.WBTipMessageCollection',
+        'method': b'POST',
         'status_check': created_status_check
     },
     {
         'name': 'files',
-        'handler_check': file_upload_check,
-        'method': 'POST',
+        'handler': 'globaleaks.handlers.attachment.SubmissionAttachment',
+        'method': b'POST',
         'status_check': ok_status_check
     }
 ]
 
+# (method, handler class) -> events monitored on the requests served by the handler
+events_table = {}
+
+
+def register_handler(handler):
+    """
+    Index the events monitored on the requests served by a handler class;
+    invoked by the router for each handler at its initialization
+    """
+    name = '%s.%s' % (handler.__module__, handler.__name__)
+
+    for event in events_monitored:
+        if event['handler'] == name:
+            events = events_table.setdefault((event['method'], handler), [])
+            if event not in events:
+                events.append(event)
+
 
 class Event(object):
     """
@@ -122,14 +122,29 @@ class Event(object):
         }
 
 
+def add_event(tid, e):
+    if tid in State.tenant_state:
+        State.tenant_state[tid].RecentEventQ.append(e)
+        State.tenant_state[tid].EventQ.append(e)
+
+
 def track_handler(handler):
+    events = events_table.get((handler.request.method, handler.__class__))
+    if events is None:
+        return
+
     tid = handler.request.tid
 
-    for event in events_monitored:
-        if event['handler_check'](handler.request.uri) and \
-           event['method'] == handler.request.method and \
-           event['status_check'](handler.request.code):
-            e = Event(event, handler.request.execution_time)
-            State.tenant_state[tid].RecentEventQ.append(e)
-            State.tenant_state[tid].EventQ.append(e)
+    for event in events:
+        if event['status_check'](handler.request.code):
+            if State.control is not None:
+                # the events tracked by the API workers are accounted by the
+                # main process running the statistics and the anomaly detection
+                State.control.send({'command': 'event',
+                                    'tid': tid,
+                                    'event': event['name'],
+                                    'duration': handler.request.execution_time.total_seconds()})
+            else:
+                add_event(tid, Event(event, handler.request.execution_time))
+
             break
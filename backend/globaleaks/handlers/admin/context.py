@@ -13,15 +13,16 @@ from globaleaks.handlers.base import BaseHandler
 from globaleaks.handlers.operation import OperationHandler
 from globaleaks.orm import transact
 from globaleaks.rest import requests, errors
-from globaleaks.utils.structures import fill_localized_keys, get_localized_values
+from globaleaks.utils.structures import fill_localized_keys, get_localized_values, load_localized
 
 
-def admin_serialize_context(session, context, language):
+def admin_serialize_context(session, context, language, l10n=None):
     """
     Serialize the specified context
 
     :param session: the session on which perform queries.
     :param language: the language in which to localize data.
+    :param l10n: the localized values loaded by load_localized
     :return: a dictionary representing the serialization of the context.
     """
     receivers = [r[0] for r in session.query(models.ReceiverContext.receiver_id) \
@@ -51,6 +52,10 @@ def admin_serialize_context(session, context, language):
         'picture': picture
     }
 
+    if l10n is not None and context.id in l10n:
+        ret_dict.update(l10n[context.id])
+        return ret_dict
+
     return get_localized_values(ret_dict, context, context.localized_keys, language)
 
 
@@ -63,8 +68,11 @@ def get_context_list(session, tid, language):
     :param language: the language in which to localize data.
     :return: a dictionary representing the serialization of the contexts.
     """
-    return sorted([admin_serialize_context(session, context, language)
-                      for context in session.query(models.Context).filter(models.Context.tid == tid)],
+    l10n = {}
+    contexts = load_localized(session.query(models.Context).filter(models.Context.tid == tid),
+                              models.Context, language, l10n)
+
+    return sorted([admin_serialize_context(session, context, language, l10n) for context in contexts],
                   key=lambda x: x['presentation_order'])
 
 
@@ -81,7 +81,7 @@ class FileInstance(BaseHandler):
         yield self.permission_check(id)
 
         if id != 'custom':
-            sf = self.state.get_tmp_file_by_name(self.uploaded_file['filename'])
+            sf = yield self.state.TempUploadFiles.run(self.state.get_tmp_file_by_name, self.uploaded_file['filename'])
             with sf.open('r') as encrypted_file:
                 data = encrypted_file.read()
 
@@ -297,6 +297,7 @@ class CsrFileRes(FileResource):
 
 class FileHandler(BaseHandler):
     check_roles = 'admin'
+    invalidate_cache = True
 
     mapped_file_resources = {
         'priv_key': PrivKeyFileRes,
@@ -395,6 +396,7 @@ def reset_https_config(session, tid):
 
 class ConfigHandler(BaseHandler):
     check_roles = 'admin'
+    invalidate_cache = True
 
     def get(self):
         return serialize_https_config_summary(self.request.tid)
@@ -518,14 +520,12 @@ def db_acme_cert_issuance(session, tid):
 
     priv_key = priv_fact.get_val(u'https_priv_key')
 
-    tmp_chall_dict = State.tenant_state[tid].acme_tmp_chall_dict
-
     # Run ACME registration all the way to resolution
     cert_str, chain_str = letsencrypt.run_acme_reg_to_finish(hostname,
                                                              accnt_key,
                                                              priv_key,
                                                              hostname,
-                                                             tmp_chall_dict,
+                                                             State.AcmeChallenges,
                                                              Settings.acme_directory_url)
 
     priv_fact.set_val(u'https_cert', cert_str)
@@ -541,6 +541,7 @@ def acme_cert_issuance(session, tid):
 
 class AcmeHandler(BaseHandler):
     check_roles='admin'
+    invalidate_cache = True
 
     @inlineCallbacks
     def post(self):
@@ -563,10 +564,11 @@ class AcmeChallengeHandler(BaseHandler):
     check_roles = 'unauthenticated'
     bypass_basic_auth = True
 
+    @inlineCallbacks
     def get(self, token):
-        tmp_chall_dict = State.tenant_state[self.request.tid].acme_tmp_chall_dict
-        if token in tmp_chall_dict:
+        chall = yield State.AcmeChallenges.run(State.AcmeChallenges.get, token)
+        if chall is not None:
             log.info('Responding to valid .well-known request [%d]', self.request.tid)
-            return tmp_chall_dict[token].tok
+            returnValue(chall.tok)
 
         raise errors.ResourceNotFound
@@ -2,6 +2,8 @@
 # API handling upload/delete of users/contexts picture
 import base64
 
+from twisted.internet.defer import inlineCallbacks, returnValue
+
 from globaleaks import models
 from globaleaks.handlers.base import BaseHandler
 from globaleaks.orm import transact
@@ -48,12 +50,15 @@ class ModelImgInstance(BaseHandler):
     invalidate_cache = True
     upload_handler = True
 
+    @inlineCallbacks
     def post(self, obj_key, obj_id):
-        sf = self.state.get_tmp_file_by_name(self.uploaded_file['filename'])
+        sf = yield self.state.TempUploadFiles.run(self.state.get_tmp_file_by_name, self.uploaded_file['filename'])
         with sf.open('r') as encrypted_file:
             data = encrypted_file.read()
 
-        return add_model_img(self.request.tid, obj_key, obj_id, data)
+        result = yield add_model_img(self.request.tid, obj_key, obj_id, data)
+
+        returnValue(result)
 
     def delete(self, obj_key, obj_id):
         return del_model_img(self.request.tid, obj_key, obj_id)
@@ -1,6 +1,5 @@
 # -*- coding: utf-8
 # Implementation of admin statistics handlers
-import operator
 from datetime import timedelta
 
 from globaleaks.event import events_monitored
@@ -153,25 +152,20 @@ class RecentEventsCollection(BaseHandler):
     """
     check_roles = 'admin'
 
-    def get_summary(self, templist):
+    def get_summary(self, counts):
         eventmap = dict()
         for event in events_monitored:
             eventmap.setdefault(event['name'], 0)
 
-        for e in templist:
-            eventmap[e['event']] += 1
+        eventmap.update(counts)
 
         return eventmap
 
     def get(self, kind):
-        templist = [e.serialize() for e in State.tenant_state[self.request.tid].EventQ]
-
-        templist.sort(key=operator.itemgetter('creation_date'))
-
         if kind == 'details':
-            return templist
+            return State.tenant_state[self.request.tid].EventQ.serialize()
 
-        return self.get_summary(templist)
+        return self.get_summary(State.tenant_state[self.request.tid].EventQ.counts())
 
 
 class JobsTiming(BaseHandler):
@@ -186,7 +180,8 @@ class JobsTiming(BaseHandler):
         for job in State.jobs:
             response.append({
               'name': job.name,
-              'timings': job.last_executions
+              'timings': job.last_executions,
+              'metrics': job.get_metrics()
             })
 
         return response
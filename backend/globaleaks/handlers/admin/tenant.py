@@ -7,6 +7,8 @@
 import base64
 import os
 
+from twisted.internet.defer import inlineCallbacks
+
 from globaleaks import models
 from globaleaks.db import db_refresh_memory_variables
 from globaleaks.db.appdata import load_appdata
@@ -14,6 +16,7 @@ from globaleaks.handlers.admin import file
 from globaleaks.handlers.base import BaseHandler
 from globaleaks.orm import transact
 from globaleaks.rest import requests
+from globaleaks.sessions import Sessions
 from globaleaks.utils.log import log
 from globaleaks.settings import Settings
 from globaleaks.state import State
@@ -183,6 +186,7 @@ class TenantInstance(BaseHandler):
 
         return update(tenant_id, request)
 
+    @inlineCallbacks
     def delete(self, tenant_id):
         """
         Delete the specified tenant.
@@ -191,4 +195,6 @@ class TenantInstance(BaseHandler):
 
         log.info('Removing tenant with id: %d', tenant_id, tid=self.request.tid)
 
-        return delete(tenant_id)
+        yield delete(tenant_id)
+
+        yield Sessions.run(Sessions.revoke_tenant, tenant_id)
@@ -5,6 +5,7 @@
 # Implementation of the User model functionalities
 #
 from six import text_type
+from twisted.internet.defer import inlineCallbacks
 
 from globaleaks import models
 from globaleaks.db import db_refresh_memory_variables
@@ -15,6 +16,7 @@ from globaleaks.handlers.user import parse_pgp_options, \
 
 from globaleaks.orm import transact
 from globaleaks.rest import requests, errors
+from globaleaks.sessions import Sessions
 from globaleaks.state import State
 from globaleaks.utils import security
 from globaleaks.utils.structures import fill_localized_keys, get_localized_values
@@ -250,11 +252,14 @@ class UserInstance(BaseHandler):
 
         return admin_update_user(self.state, self.request.tid, user_id, request, self.request.language)
 
+    @inlineCallbacks
     def delete(self, user_id):
         """
         Delete the specified user.
         """
-        return delete_user(self.request.tid, user_id)
+        yield delete_user(self.request.tid, user_id)
+
+        yield Sessions.run(Sessions.revoke, user_id)
 
 
 class UserTenantCollection(BaseHandler):
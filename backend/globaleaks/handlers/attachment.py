@@ -39,12 +39,13 @@ class SubmissionAttachment(BaseHandler):
     check_roles = 'unauthenticated'
     upload_handler = True
 
+    @inlineCallbacks
     def post(self, token_id):
-        token = TokenList.get(token_id)
+        token = yield TokenList.run(TokenList.get, token_id)
 
         self.uploaded_file['submission'] = True
 
-        token.associate_file(self.uploaded_file)
+        yield TokenList.run(token.associate_file, self.uploaded_file)
 
 
 class PostSubmissionAttachment(SubmissionAttachment):
@@ -8,7 +8,6 @@ from six import text_type, binary_type
 from sqlalchemy import and_, or_
 from twisted.internet.defer import inlineCallbacks, returnValue
 
-from globaleaks.utils import security
 from globaleaks.handlers.base import BaseHandler
 from globaleaks.models import InternalTip, User, UserTenant, WhistleblowerTip
 from globaleaks.orm import transact
@@ -50,11 +49,10 @@ def random_login_delay():
 
 
 @transact
-def login_whistleblower(session, tid, receipt, client_using_tor):
+def login_whistleblower_by_receipt_hash(session, tid, hashed_receipt, client_using_tor):
     """
-    login_whistleblower returns a session
+    login_whistleblower_by_receipt_hash returns a session
     """
-    hashed_receipt = security.hash_password(receipt, State.tenant_cache[tid].receipt_salt)
     result = session.query(WhistleblowerTip, InternalTip) \
                     .filter(WhistleblowerTip.receipt_hash == text_type(hashed_receipt, 'utf-8'),
                             WhistleblowerTip.tid == tid,
@@ -63,7 +61,6 @@ def login_whistleblower(session, tid, receipt, client_using_tor):
 
     if result is None:
         log.debug("Whistleblower login: Invalid receipt")
-        Settings.failed_login_attempts += 1
         raise errors.InvalidAuthentication
 
     wbtip, itip = result[0], result[1]
@@ -77,25 +74,51 @@ def login_whistleblower(session, tid, receipt, client_using_tor):
     return Sessions.new(tid, wbtip.id, 'whistleblower', False)
 
 
+@inlineCallbacks
+def login_whistleblower(tid, receipt, client_using_tor):
+    """
+    login_whistleblower returns a session
+
+    The receipt is hashed before opening the transaction in order to not
+    keep the database busy during the computation of scrypt.
+    """
+    hashed_receipt = yield State.hashing_pool.hash_password(receipt, State.tenant_cache[tid].receipt_salt)
+
+    try:
+        session = yield login_whistleblower_by_receipt_hash(tid, hashed_receipt, client_using_tor)
+    except errors.InvalidAuthentication:
+        State.track_failed_login()
+        raise
+
+    returnValue(session)
+
+
 @transact
-def login(session, tid, username, password, client_using_tor, client_ip):
+def get_login_candidates(session, tid, username):
     """
-    login returns a session
+    Return the id, the salt and the password hash of the users
+    that could authenticate with the given username
     """
-    user = None
+    tenant_condition = and_(UserTenant.user_id == User.id, UserTenant.tenant_id == tid)
+
+    return [(u.id, u.salt, u.password) for u in session.query(User).filter(User.username == username,
+                                                                          User.state != u'disabled',
+                                                                          tenant_condition).distinct()]
 
+
+@transact
+def login_user(session, tid, user_id, client_using_tor, client_ip):
+    """
+    login_user returns a session for a user whose password has been verified
+    """
     tenant_condition = and_(UserTenant.user_id == User.id, UserTenant.tenant_id == tid)
 
-    users = session.query(User).filter(User.username == username,
-                                       User.state != u'disabled',
-                                       tenant_condition).distinct()
-    for u in users:
-        if security.check_password(password, u.salt, u.password):
-            user = u
+    user = session.query(User).filter(User.id == user_id,
+                                      User.state != u'disabled',
+                                      tenant_condition).one_or_none()
 
     if user is None:
         log.debug("Login: Invalid credentials")
-        Settings.failed_login_attempts += 1
         raise errors.InvalidAuthentication
 
     if not client_using_tor and not State.tenant_cache[tid]['https_' + user.role]:
@@ -130,6 +153,37 @@ def login(session, tid, username, password, client_using_tor, client_ip):
     return Sessions.new(tid, user.id, user.role, user.password_change_needed)
 
 
+@inlineCallbacks
+def login(tid, username, password, client_using_tor, client_ip):
+    """
+    login returns a session
+
+    The passwords are verified before opening the transaction updating
+    the user in order to not keep the database busy during the
+    computation of scrypt.
+    """
+    user_id = None
+
+    candidates = yield get_login_candidates(tid, username)
+    for candidate_id, salt, password_hash in candidates:
+        valid = yield State.hashing_pool.check_password(password, salt, password_hash)
+        if valid:
+            user_id = candidate_id
+
+    if user_id is None:
+        log.debug("Login: Invalid credentials")
+        State.track_failed_login()
+        raise errors.InvalidAuthentication
+
+    try:
+        session = yield login_user(tid, user_id, client_using_tor, client_ip)
+    except errors.InvalidAuthentication:
+        State.track_failed_login()
+        raise
+
+    returnValue(session)
+
+
 @transact
 def check_tenant_auth_switch(session, current_user, tid):
     # check that the user can really access the tenant requested
@@ -193,12 +247,12 @@ class TokenAuthHandler(BaseHandler):
         if tid == 0:
              tid = self.request.tid
 
-        session = Sessions.get(request['token'])
+        session = yield Sessions.run(Sessions.get, request['token'])
         if session is None or session.tid != tid:
-            Settings.failed_login_attempts += 1
+            State.track_failed_login()
             raise errors.InvalidAuthentication
 
-        session = Sessions.regenerate(session.id)
+        session = yield Sessions.run(Sessions.regenerate, session.id)
 
         log.debug("Login: Success (%s)" % session.user_role)
 
@@ -246,11 +300,12 @@ class SessionHandler(BaseHandler):
         """
         return self.current_user.serialize()
 
+    @inlineCallbacks
     def delete(self):
         """
         Logout
         """
-        del Sessions[self.current_user.id]
+        yield Sessions.run(Sessions.pop, self.current_user.id, None)
 
 
 class TenantAuthSwitchHandler(BaseHandler):
@@ -263,7 +318,7 @@ class TenantAuthSwitchHandler(BaseHandler):
     def get(self, tid):
         check = yield check_tenant_auth_switch(self.current_user, tid)
         if check:
-            session = Sessions.new(tid, self.current_user.user_id, self.current_user.user_role, self.current_user.pcn)
+            session = yield Sessions.run(Sessions.new, tid, self.current_user.user_id, self.current_user.user_role, self.current_user.pcn)
 
         returnValue({
             'redirect': 'https://%s/#/login?token=%s' % (State.tenant_cache[tid].hostname, session.id)
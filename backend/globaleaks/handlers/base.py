@@ -3,6 +3,7 @@
 # Base class for all the handlers
 import base64
 import collections
+import errno
 import json
 import mimetypes
 import os
@@ -11,12 +12,13 @@ import re
 from datetime import datetime
 from cryptography.hazmat.primitives import constant_time
 from six import text_type, binary_type
-from twisted.internet import defer
+from twisted.internet import defer, tcp
 from twisted.internet.defer import inlineCallbacks, returnValue
+from twisted.web import http
 
 from globaleaks.event import track_handler
 from globaleaks.rest import errors, requests
-from globaleaks.utils.securetempfile import SecureTemporaryFile
+from globaleaks.utils.securetempfile import SecureTemporaryUploadFile
 from globaleaks.utils.security import sha512
 from globaleaks.sessions import Sessions
 from globaleaks.settings import Settings
@@ -30,6 +32,8 @@ mimetypes.add_type('application/x-font-ttf', '.ttf')
 mimetypes.add_type('application/woff', '.woff')
 mimetypes.add_type('application/woff2', '.woff2')
 
+range_regexp = re.compile(r'^bytes=(\d*)-(\d*)$')
+
 
 class FileProducer(object):
     """
@@ -37,11 +41,17 @@ class FileProducer(object):
 
     @ivar request: The L{IRequest} to write the contents of the file to.
     @ivar fileObject: The file the contents of which to write to the request.
+    @ivar offset: The position of the file from which to start writing.
+    @ivar length: The number of bytes to write or None to write up to the end of the file.
     """
-    def __init__(self, request, fo):
+    def __init__(self, request, fo, offset=0, length=None):
         self.finish = defer.Deferred()
         self.request = request
         self.fo = fo
+        self.remaining = length
+
+        if offset:
+            self.fo.seek(offset)
 
     def start(self):
         self.request.registerProducer(self, False)
@@ -50,8 +60,15 @@ class FileProducer(object):
     def resumeProducing(self):
         try:
             if self.request is not None:
-                data = self.fo.read(Settings.file_chunk_size)
+                size = Settings.file_chunk_size
+                if self.remaining is not None:
+                    size = min(size, self.remaining)
+
+                data = self.fo.read(size) if size else b''
                 if data:
+                    if self.remaining is not None:
+                        self.remaining -= len(data)
+
                     self.request.write(data)
                 else:
                     self.stopProducing()
@@ -72,6 +89,135 @@ class FileProducer(object):
         self.fo.close()
 
 
+class SendfileProducer(object):
+    """
+    Streaming producer writing files by means of os.sendfile
+
+    The content of the file is copied by the kernel directly to the socket of
+    the connection avoiding its copy through the userspace; this is possible
+    only on plain TCP connections like the ones of the local ports used by
+    the HTTPS workers and by the Tor onion service.
+
+    The file is sent only while the buffer of the transport is empty: the
+    slices written through the transport are larger than its buffer and so
+    the transport pauses the producer and resumes it once they are flushed.
+    """
+    chunk_size = 1024 * 1024
+    slices_per_turn = 8
+
+    def __init__(self, request, fo, offset, length):
+        self.finish = defer.Deferred()
+        self.request = request
+        self.fo = fo
+        self.offset = offset
+        self.remaining = length
+        self.paused = False
+
+    @staticmethod
+    def can_send(request, fo):
+        if not hasattr(os, 'sendfile'):
+            return False
+
+        # the body of the responses to HEAD requests is discarded by
+        # request.write() while os.sendfile would write it to the socket
+        if request.method == b'HEAD':
+            return False
+
+        transport = getattr(request, 'transport', None)
+        if not isinstance(transport, tcp.Connection) or getattr(transport, 'TLS', False):
+            return False
+
+        try:
+            fo.fileno()
+        except Exception:
+            return False
+
+        return True
+
+    def start(self):
+        self.request.notifyFinish().addErrback(self.connectionLost)
+        self.request.registerProducer(self, True)
+
+        # the headers and the first slice of the file are written through
+        # the transport; the rest is sent once they are flushed
+        self.write()
+
+        return self.finish
+
+    def write(self):
+        """
+        Write the next slice of the file through the transport
+        """
+        while self.request is not None and self.remaining and not self.paused:
+            self.fo.seek(self.offset)
+            data = self.fo.read(min(self.remaining, self.chunk_size))
+            if not data:
+                # the file has been truncated
+                self.request.transport.abortConnection()
+                return self.stop()
+
+            self.offset += len(data)
+            self.remaining -= len(data)
+            self.request.write(data)
+
+        if self.request is not None and not self.remaining:
+            self.stopProducing()
+
+    def pauseProducing(self):
+        self.paused = True
+
+    def resumeProducing(self):
+        # the transport resumes the producer once its buffer is flushed
+        if self.request is None or not self.paused:
+            return
+
+        self.paused = False
+
+        transport = self.request.transport
+
+        try:
+            for _ in range(self.slices_per_turn):
+                if not self.remaining:
+                    break
+
+                sent = os.sendfile(transport.fileno(),
+                                   self.fo.fileno(),
+                                   self.offset,
+                                   min(self.remaining, self.chunk_size))
+                if not sent:
+                    # the file has been truncated
+                    transport.abortConnection()
+                    return self.stop()
+
+                self.offset += sent
+                self.remaining -= sent
+        except OSError as e:
+            if e.errno not in (errno.EAGAIN, errno.EWOULDBLOCK):
+                transport.abortConnection()
+                return self.stop()
+
+        # the socket is full or the producer used its share of the reactor:
+        # the next slice is buffered by the transport that pauses the producer
+        # until the socket is writable again
+        self.write()
+
+    def connectionLost(self, _):
+        self.stop()
+
+    def stop(self):
+        if self.request is not None:
+            self.request = None
+            self.fo.close()
+            self.finish.callback(None)
+
+    def stopProducing(self):
+        if self.request is not None:
+            request = self.request
+            request.unregisterProducer()
+            self.stop()
+            request.finish()
+
+
 class BaseHandler(object):
     check_roles = 'admin'
     handler_exec_time_threshold = 120
@@ -136,6 +282,29 @@ class BaseHandler(object):
 
         return wrapper
 
+    @staticmethod
+    def decorator_notify_change(f):
+        """
+        Decorator notifying the other processes serving the API of the
+        change of the configuration
+        """
+        def wrapper(self, *args, **kwargs):
+            def callback(data):
+                if self.invalidate_cache and self.request.tid != 1:
+                    self.state.notify_change(self.request.tid)
+                else:
+                    self.state.notify_change(None)
+
+                return data
+
+            ret = f(self, *args, **kwargs)
+            if isinstance(ret, defer.Deferred):
+                return ret.addCallback(callback)
+
+            return callback(ret)
+
+        return wrapper
+
     def basic_auth(self):
         msg = None
         if b"authorization" in self.request.headers:
@@ -329,6 +498,8 @@ class BaseHandler(object):
         return open(filepath, 'rb')
 
     def write_file_fo(self, filename, fo):
+        # the validators and the ranges refer to the file actually sent,
+        # i.e. to the compressed variant when a .gz file is served
         if filename.endswith('.gz'):
             self.request.setHeader(b'Content-encoding', b'gzip')
             filename = filename[:-3]
@@ -337,18 +508,132 @@ class BaseHandler(object):
         if mime_type:
             self.request.setHeader(b'Content-Type', mime_type)
 
-        return FileProducer(self.request, fo).start()
+        return self.send_file(fo)
 
     def write_file(self, filename, filepath):
         fo = self.open_file(filepath)
         return self.write_file_fo(filename, fo)
 
+    def get_range(self, size):
+        """
+        Return the (start, end) byte range of a file of the given size
+        requested with a Range header, or None to send the whole file.
+
+        Only single ranges are honored; multiple or malformed ranges are
+        ignored as permitted by RFC 7233.
+        """
+        header = self.request.getHeader(b'range')
+        if header is None:
+            return None
+
+        if isinstance(header, binary_type):
+            header = header.decode('utf-8', 'ignore')
+
+        match = range_regexp.match(header.strip())
+        if match is None or match.group(1) == match.group(2) == '':
+            return None
+
+        start, end = match.group(1), match.group(2)
+        if start == '':
+            # suffix range: the last bytes of the file
+            start, end = max(0, size - int(end)), size - 1
+        else:
+            start = int(start)
+            end = min(int(end), size - 1) if end else size - 1
+
+        if start >= size or start > end:
+            self.request.setHeader(b'Content-Range', 'bytes */%d' % size)
+            raise errors.RangeNotSatisfiable
+
+        return start, end
+
+    def get_header(self, name):
+        value = self.request.getHeader(name)
+        if isinstance(value, binary_type):
+            value = value.decode('utf-8', 'ignore')
+
+        return value
+
+    def is_not_modified(self, last_modified, etag):
+        """
+        Evaluate the If-None-Match and If-Modified-Since conditions
+        """
+        if_none_match = self.get_header(b'if-none-match')
+        if if_none_match is not None:
+            tags = [t.strip() for t in if_none_match.split(',')]
+            return '*' in tags or etag in tags or 'W/' + etag in tags
+
+        if_modified_since = self.get_header(b'if-modified-since')
+        if if_modified_since is not None:
+            try:
+                return last_modified <= http.stringToDatetime(if_modified_since.encode())
+            except ValueError:
+                pass
+
+        return False
+
+    def is_range_valid(self, last_modified, etag):
+        """
+        Evaluate the If-Range condition; the Range is honored only if the
+        representation is still the one that the client partially received
+        """
+        if_range = self.get_header(b'if-range')
+        if if_range is None:
+            return True
+
+        if_range = if_range.strip()
+        if if_range.startswith(('"', 'W/')):
+            return if_range == etag
+
+        try:
+            return last_modified == http.stringToDatetime(if_range.encode())
+        except ValueError:
+            return False
+
+    def send_file(self, fo):
+        """
+        Write the content of a file honoring the conditional and the
+        Range requests of the client
+        """
+        try:
+            stat = os.fstat(fo.fileno())
+        except Exception:
+            return FileProducer(self.request, fo).start()
+
+        size = stat.st_size
+        last_modified = int(stat.st_mtime)
+        etag = '"%x-%x"' % (last_modified, size)
+
+        self.request.setHeader(b'Accept-Ranges', b'bytes')
+        self.request.setHeader(b'Last-Modified', http.datetimeToString(last_modified))
+        self.request.setHeader(b'ETag', etag)
+
+        if self.is_not_modified(last_modified, etag):
+            fo.close()
+            self.request.setResponseCode(304)
+            return
+
+        offset, length = 0, size
+
+        byte_range = self.get_range(size) if self.is_range_valid(last_modified, etag) else None
+        if byte_range is not None:
+            offset, length = byte_range[0], byte_range[1] - byte_range[0] + 1
+            self.request.setResponseCode(206)
+            self.request.setHeader(b'Content-Range', 'bytes %d-%d/%d' % (byte_range[0], byte_range[1], size))
+
+        self.request.setHeader(b'Content-Length', '%d' % length)
+
+        if SendfileProducer.can_send(self.request, fo):
+            return SendfileProducer(self.request, fo, offset, length).start()
+
+        return FileProducer(self.request, fo, offset, length).start()
+
     def write_file_as_download_fo(self, filename, fo):
         self.request.setHeader(b'X-Download-Options', b'noopen')
         self.request.setHeader(b'Content-Type', b'application/octet-stream')
         self.request.setHeader(b'Content-Disposition', 'attachment; filename="%s"' % filename)
 
-        return FileProducer(self.request, fo).start()
+        return self.send_file(fo)
 
     def write_file_as_download(self, filename, filepath):
         fo = self.open_file(filepath)
@@ -381,6 +666,13 @@ class BaseHandler(object):
 
         return self._current_user
 
+    @inlineCallbacks
+    def load_current_user(self):
+        """
+        Load the session of the request running the lookup off the reactor
+        """
+        self._current_user = yield Sessions.run(self.get_current_user)
+
     def get_api_session(self):
         token = ''
         if b'api-token' in self.request.args:
@@ -400,28 +692,64 @@ class BaseHandler(object):
         if constant_time.bytes_eq(sha512(token), stored_token_hash):
             return self.state.api_token_session
 
+    def get_file_upload_params(self):
+        try:
+            return (self.request.args[b'flowIdentifier'][0],
+                    int(self.request.args[b'flowChunkNumber'][0]),
+                    int(self.request.args[b'flowChunkSize'][0]),
+                    int(self.request.args[b'flowTotalChunks'][0]),
+                    int(self.request.args[b'flowTotalSize'][0]))
+        except (KeyError, ValueError):
+            raise errors.InputValidationError("Invalid file upload parameters")
+
+    @inlineCallbacks
+    def check_file_upload(self, *args):
+        """
+        Answers the flow.js requests testing the presence of a chunk
+        in order to permit to resume an interrupted upload.
+        """
+        flow_identifier, chunk_number, _, _, _ = self.get_file_upload_params()
+
+        f = yield self.state.TempUploadFiles.run(self.state.TempUploadFiles.get, flow_identifier)
+        if f is None or not f.has_chunk(chunk_number):
+            # flow.js uploads the chunks for which the test does not succeed
+            self.request.setResponseCode(204)
+
     def process_file_upload(self):
         if b'flowFilename' not in self.request.args:
             return
 
-        total_file_size = int(self.request.args[b'flowTotalSize'][0])
-        flow_identifier = self.request.args[b'flowIdentifier'][0]
+        flow_identifier, chunk_number, chunk_size, total_chunks, total_file_size = self.get_file_upload_params()
 
-        chunk_size = len(self.request.args[b'file'][0])
-        if ((chunk_size / (1024 * 1024)) > self.state.tenant_cache[self.request.tid].maximum_filesize or
+        data = self.request.args[b'file'][0]
+        if ((len(data) / (1024 * 1024)) > self.state.tenant_cache[self.request.tid].maximum_filesize or
             (total_file_size / (1024 * 1024)) > self.state.tenant_cache[self.request.tid].maximum_filesize):
             log.err("File upload request rejected: file too big", tid=self.request.tid)
             raise errors.FileTooBig(self.state.tenant_cache[self.request.tid].maximum_filesize)
 
-        if flow_identifier not in self.state.TempUploadFiles:
-            self.state.TempUploadFiles.set(flow_identifier, SecureTemporaryFile(Settings.tmp_path))
+        f = self.state.TempUploadFiles.get(flow_identifier)
+        if f is None:
+            f = SecureTemporaryUploadFile(Settings.tmp_path, total_file_size, total_chunks, chunk_size)
+
+        if not f.match(total_file_size, total_chunks, chunk_size) or \
+           not f.valid_chunk(chunk_number, len(data)):
+            raise errors.InputValidationError("Invalid file upload chunk")
+
+        if f.completed:
+            # the chunk is a retransmission of an upload already processed
+            return
+
+        f = self.state.TempUploadFiles.setdefault(flow_identifier, f)
 
-        f = self.state.TempUploadFiles[flow_identifier]
         with f.open('w') as f:
-            f.write(self.request.args[b'file'][0])
+            f.write_chunk(chunk_number, data)
 
-            if self.request.args[b'flowChunkNumber'][0] == self.request.args[b'flowTotalChunks'][0]:
-                f.finalize_write()
+        # the chunks could be received in parallel by different processes
+        # and so are registered with an atomic update of the shared file
+        f = self.state.TempUploadFiles.update(flow_identifier, lambda upload: upload.chunks.add(chunk_number)) or f
+
+        if not f.completed:
+            return
 
         mime_type, _ = mimetypes.guess_type(text_type(self.request.args[b'flowFilename'][0], 'utf-8'))
         if mime_type is None:
@@ -437,6 +765,15 @@ class BaseHandler(object):
             'description': self.request.args.get(b'description', [''])[0]
         }
 
+    def write_upload_plaintext(self, plaintext_file):
+        with self.uploaded_file['body'].open('r') as encrypted_file:
+            while True:
+                chunk = encrypted_file.read(4096)
+                if not chunk:
+                    break
+
+                plaintext_file.write(chunk)
+
     def write_upload_plaintext_to_disk(self, destination):
         """
         @param uploaded_file: uploaded_file data struct
@@ -446,17 +783,22 @@ class BaseHandler(object):
         try:
             log.debug('Creating file %s with %d bytes', destination, self.uploaded_file['size'])
 
-            with self.uploaded_file['body'].open('r') as encrypted_file, open(destination, 'wb') as plaintext_file:
-                while True:
-                    chunk = encrypted_file.read(4096)
-                    if not chunk:
-                        break
-
-                    plaintext_file.write(chunk)
+            with open(destination, 'wb') as plaintext_file:
+                self.write_upload_plaintext(plaintext_file)
 
         finally:
             self.uploaded_file['path'] = destination
 
+    def write_upload_plaintext_to_storage(self, storage, name):
+        """
+        @param storage: the storage driver
+        @param name: the name of the file in the storage
+        """
+        log.debug('Storing file %s with %d bytes', name, self.uploaded_file['size'])
+
+        with storage.open(name, 'wb') as plaintext_file:
+            self.write_upload_plaintext(plaintext_file)
+
     def execution_check(self):
         self.request.execution_time = datetime.now() - self.request.start_time
 
@@ -1,10 +1,12 @@
 # -*- coding: utf-8 -*-
 #
 # API handling export of submissions
-import os
+from functools import partial
 
 from io import BytesIO
 from six import binary_type, text_type
+from six.moves.queue import Queue, Empty, Full
+from twisted.internet import reactor
 from twisted.internet.defer import Deferred, inlineCallbacks
 
 from globaleaks import models
@@ -14,14 +16,22 @@ from globaleaks.handlers.admin.notification import db_get_notification
 from globaleaks.handlers.base import BaseHandler
 from globaleaks.handlers.rtip import db_access_rtip, serialize_rtip
 from globaleaks.handlers.user import user_serialize_user
-from globaleaks.orm import transact
+from globaleaks.orm import transact, transact_sync
+from globaleaks.rest import requests
 from globaleaks.settings import Settings
+from globaleaks.state import State
 from globaleaks.utils.templating import Templating
 from globaleaks.utils.utility import msdos_encode, datetime_now
 from globaleaks.utils.zipstream import ZipStream
 
-@transact
-def get_tip_export(session, tid, user_id, rtip_id, language):
+def db_get_tip_export(session, tid, user_id, rtip_id, language, serialized):
+    """
+    Return the description of the files composing the export of a tip.
+
+    The serializations of the node, the notification settings, the user and
+    the contexts are stored in the dictionary serialized and reused across
+    the exports of multiple tips.
+    """
     rtip, itip = db_access_rtip(session, tid, user_id, rtip_id)
 
     user, context = session.query(models.User, models.Context) \
@@ -31,15 +41,25 @@ def get_tip_export(session, tid, user_id, rtip_id, language):
                                    models.UserTenant.user_id == models.User.id,
                                    models.UserTenant.tenant_id == tid).one()
 
+    if 'node' not in serialized:
+        serialized['node'] = db_admin_serialize_node(session, tid, language)
+        serialized['notification'] = db_get_notification(session, tid, language)
+
+    if user.id not in serialized:
+        serialized[user.id] = user_serialize_user(session, user, language)
+
+    if context.id not in serialized:
+        serialized[context.id] = admin_serialize_context(session, context, language)
+
     rtip_dict = serialize_rtip(session, rtip, itip, language)
 
     export_dict = {
         'type': u'export_template',
-        'node': db_admin_serialize_node(session, tid, language),
-        'notification': db_get_notification(session, tid, language),
+        'node': serialized['node'],
+        'notification': serialized['notification'],
         'tip': rtip_dict,
-        'user': user_serialize_user(session, user, language),
-        'context': admin_serialize_context(session, context, language),
+        'user': serialized[user.id],
+        'context': serialized[context.id],
         'comments': rtip_dict['comments'],
         'messages': rtip_dict['messages'],
         'files': []
@@ -51,12 +71,14 @@ def get_tip_export(session, tid, user_id, rtip_id, language):
 
     export_dict['files'].append({'fo': BytesIO(export_template), 'name': "data.txt"})
 
-    for rfile in session.query(models.ReceiverFile).filter(models.ReceiverFile.receivertip_id == rtip_id):
+    for rfile in session.query(models.ReceiverFile).filter(models.ReceiverFile.receivertip_id == rtip.id):
         rfile.last_access = datetime_now()
         rfile.downloads += 1
         file_dict = models.serializers.serialize_rfile(session, tid, rfile)
+        if rfile.status == u'encrypted':
+            file_dict['content_type'] = u'application/pgp-encrypted'
         file_dict['name'] = 'files/' + file_dict['name']
-        file_dict['path'] = os.path.join(Settings.attachments_path, file_dict['filename'])
+        file_dict['open'] = partial(State.storage.stream, file_dict['filename'])
         export_dict['files'].append(file_dict)
 
     for wf in session.query(models.WhistleblowerFile).filter(models.WhistleblowerFile.receivertip_id == models.ReceiverTip.id,
@@ -64,31 +86,119 @@ def get_tip_export(session, tid, user_id, rtip_id, language):
                                                              models.InternalTip.id == rtip.internaltip_id):
         file_dict = models.serializers.serialize_wbfile(session, tid, wf)
         file_dict['name'] = 'files_from_recipients/' + file_dict['name']
-        file_dict['path'] = os.path.join(Settings.attachments_path, file_dict['filename'])
+        file_dict['open'] = partial(State.storage.stream, file_dict['filename'])
         export_dict['files'].append(file_dict)
 
     return export_dict
 
 
+@transact
+def get_tip_export(session, tid, user_id, rtip_id, language):
+    return db_get_tip_export(session, tid, user_id, rtip_id, language, {})
+
+
+@transact_sync
+def sync_get_tip_export(session, tid, user_id, rtip_id, language, serialized):
+    return db_get_tip_export(session, tid, user_id, rtip_id, language, serialized)
+
+
+@transact
+def check_tips_access(session, tid, user_id, rtip_ids):
+    """
+    Check the access of the user to the tips and return their ids without duplicates
+    """
+    checked = set()
+    ret = []
+
+    for rtip_id in rtip_ids:
+        if rtip_id in checked:
+            continue
+
+        db_access_rtip(session, tid, user_id, rtip_id)
+        checked.add(rtip_id)
+        ret.append(rtip_id)
+
+    return ret
+
+
+def get_tips_export(tid, user_id, rtip_ids, language):
+    """
+    Generate the files composing the export of multiple tips, each one
+    contained in a folder named after the progressive number of the tip.
+
+    The generator is consumed by the thread producing the archive and each
+    tip is loaded in its own transaction only when the archive reaches it,
+    so that the data of only the tips being compressed is kept in memory.
+    """
+    serialized = {}
+
+    for rtip_id in rtip_ids:
+        export_dict = sync_get_tip_export(tid, user_id, rtip_id, language, serialized)
+
+        folder = 'submission-%d/' % export_dict['tip']['progressive']
+        for file_dict in export_dict['files']:
+            file_dict['name'] = folder + file_dict['name']
+            yield file_dict
+
+
 class ZipStreamProducer(object):
-    """Streaming producter for ZipStream"""
+    """
+    Streaming producer for ZipStream
+
+    The archive is generated in a thread of the export pool that feeds a
+    bounded queue of chunks consumed by the reactor as the client reads the
+    output, so that the compression never blocks the event loop.
+    """
     bufferSize = Settings.file_chunk_size
+    prefetch = 8
 
     def __init__(self, handler, zipstreamObject):
         self.finish = Deferred()
         self.handler = handler
         self.zipstreamObject = zipstreamObject
+        self.queue = Queue(self.prefetch)
+        self.waiting = False
 
     def start(self):
+        self.handler.state.export_tp.callInThread(self.feed)
+
         self.handler.request.registerProducer(self, False)
         return self.finish
 
+    def feed(self):
+        for data in self.zip_chunks():
+            while self.handler is not None:
+                try:
+                    self.queue.put(data, timeout=1)
+                    break
+                except Full:
+                    pass
+
+            if self.handler is None:
+                break
+
+            reactor.callFromThread(self.wakeup)
+
+    def wakeup(self):
+        if self.waiting:
+            self.resumeProducing()
+
     def resumeProducing(self):
         try:
             if not self.handler:
                 return
 
-            data = self.zip_chunk()
+            try:
+                data = self.queue.get_nowait()
+            except Empty:
+                self.waiting = True
+                return
+
+            self.waiting = False
+
+            if isinstance(data, Exception):
+                raise data
+
             if data:
                 self.handler.request.write(data)
             else:
@@ -98,29 +208,55 @@ class ZipStreamProducer(object):
             raise
 
     def stopProducing(self):
+        if not self.handler:
+            return
+
+        self.zipstreamObject.close()
         self.handler.request.unregisterProducer()
         self.handler.request.finish()
         self.handler = None
         self.finish.callback(None)
 
-    def zip_chunk(self):
+    def zip_chunks(self):
         chunk = []
         chunk_size = 0
 
-        for data in self.zipstreamObject:
-            if data:
+        try:
+            for data in self.zipstreamObject:
                 chunk_size += len(data)
                 chunk.append(data)
-                if chunk_size >= Settings.file_chunk_size:
-                    return b''.join(chunk)
+                if chunk_size >= self.bufferSize:
+                    yield b''.join(chunk)
+                    chunk = []
+                    chunk_size = 0
+
+            yield b''.join(chunk)
+        except Exception as e:
+            yield e
+            return
 
-        return b''.join(chunk)
+        # the end of the archive
+        yield b''
 
 
-class ExportHandler(BaseHandler):
+class BaseExportHandler(BaseHandler):
     check_roles = 'receiver'
     handler_exec_time_threshold = 3600
 
+    # number of files of an export compressed in parallel
+    zip_workers = 4
+
+    def write_zip(self, filename, files):
+        self.request.setHeader(b'X-Download-Options', b'noopen')
+        self.request.setHeader(b'Content-Type', b'application/octet-stream')
+        self.request.setHeader(b'Content-Disposition', 'attachment; filename="%s"' % filename)
+
+        self.zip_stream = ZipStream(files, self.state.compress_tp, workers=self.zip_workers)
+
+        return ZipStreamProducer(self, self.zip_stream).start()
+
+
+class ExportHandler(BaseExportHandler):
     @inlineCallbacks
     def get(self, rtip_id):
         tip_export = yield get_tip_export(self.request.tid,
@@ -128,10 +264,25 @@ class ExportHandler(BaseHandler):
                                           rtip_id,
                                           self.request.language)
 
-        self.request.setHeader(b'X-Download-Options', b'noopen')
-        self.request.setHeader(b'Content-Type', b'application/octet-stream')
-        self.request.setHeader(b'Content-Disposition', b'attachment; filename="submission.zip"')
+        yield self.write_zip('submission.zip', tip_export['files'])
+
+
+class TipsExportHandler(BaseExportHandler):
+    """
+    This interface streams a single archive containing the export of
+    the list of tips provided.
+    """
+    @inlineCallbacks
+    def post(self):
+        request = self.validate_message(self.request.content.read(), requests.ReceiverTipsExportDesc)
+
+        rtip_ids = yield check_tips_access(self.request.tid,
+                                           self.current_user.user_id,
+                                           request['rtips'])
 
-        self.zip_stream = iter(ZipStream(tip_export['files']))
+        files = get_tips_export(self.request.tid,
+                                self.current_user.user_id,
+                                rtip_ids,
+                                self.request.language)
 
-        yield ZipStreamProducer(self, self.zip_stream).start()
+        yield self.write_zip('submissions.zip', files)
@@ -11,7 +11,7 @@ from globaleaks.models.config import ConfigFactory, NodeL10NFactory
 from globaleaks.orm import transact
 from globaleaks.state import State
 from globaleaks.utils.sets import merge_dicts
-from globaleaks.utils.structures import get_localized_values
+from globaleaks.utils.structures import defer_localized_columns, get_localized_values, load_localized
 
 special_fields = ['whistleblower_identity']
 
@@ -34,13 +34,14 @@ def db_prepare_contexts_serialization(session, contexts):
     return data
 
 
-def db_prepare_receivers_serialization(session, receivers):
-    data = {'users': {}, 'imgs': {}}
+def db_prepare_receivers_serialization(session, receivers, language):
+    data = {'users': {}, 'imgs': {}, 'l10n': {}}
 
     receivers_ids = [r.id for r in receivers]
 
     if receivers_ids:
-        for o in session.query(models.User).filter(models.User.id.in_(receivers_ids)):
+        for o in load_localized(session.query(models.User).filter(models.User.id.in_(receivers_ids)),
+                                models.User, language, data['l10n']):
             data['users'][o.id] = o
 
         for o in session.query(models.UserImg).filter(models.UserImg.id.in_(receivers_ids)):
@@ -49,12 +50,13 @@ def db_prepare_receivers_serialization(session, receivers):
     return data
 
 
-def db_prepare_fields_serialization(session, fields):
+def db_prepare_fields_serialization(session, fields, language):
     ret = {
         'fields': {},
         'attrs': {},
         'options': {},
-        'triggers': {}
+        'triggers': {},
+        'l10n': {}
     }
 
     fields_ids = []
@@ -65,7 +67,8 @@ def db_prepare_fields_serialization(session, fields):
 
     tmp = copy.deepcopy(fields_ids)
     while tmp:
-        fs = session.query(models.Field).filter(models.Field.fieldgroup_id.in_(tmp))
+        fs = load_localized(session.query(models.Field).filter(models.Field.fieldgroup_id.in_(tmp)),
+                            models.Field, language, ret['l10n'])
 
         tmp = []
         for f in fs:
@@ -86,15 +89,17 @@ def db_prepare_fields_serialization(session, fields):
                 ret['attrs'][obj.field_id] = []
             ret['attrs'][obj.field_id].append(obj)
 
-        objs = session.query(models.FieldOption)\
-                    .filter(models.FieldOption.field_id.in_(fields_ids)) \
-                    .order_by(models.FieldOption.presentation_order)
+        objs = load_localized(session.query(models.FieldOption) \
+                                     .filter(models.FieldOption.field_id.in_(fields_ids)) \
+                                     .order_by(models.FieldOption.presentation_order),
+                              models.FieldOption, language, ret['l10n'])
         for obj in objs:
             if obj.field_id not in ret['options']:
                 ret['options'][obj.field_id] = []
             ret['options'][obj.field_id].append(obj)
 
-        objs = session.query(models.FieldOption).filter(models.FieldOption.trigger_field.in_(fields_ids))
+        objs = session.query(models.FieldOption).filter(models.FieldOption.trigger_field.in_(fields_ids)) \
+                                                .options(*defer_localized_columns(models.FieldOption))
         for obj in objs:
             if obj.field_id not in ret['triggers']:
                 ret['triggers'][obj.field_id] = []
@@ -181,6 +186,10 @@ def serialize_context(session, context, language, data=None):
         'picture': data['imgs'].get(context.id, '')
     }
 
+    if context.id in data['l10n']:
+        ret_dict.update(data['l10n'][context.id])
+        return ret_dict
+
     return get_localized_values(ret_dict, context, context.localized_keys, language)
 
 
@@ -206,12 +215,13 @@ def serialize_questionnaire(session, tid, questionnaire, language, serialize_tem
     return get_localized_values(ret_dict, questionnaire, questionnaire.localized_keys, language)
 
 
-def serialize_field_option(option, language):
+def serialize_field_option(option, language, data=None):
     """
     Serialize a field option, localizing its content depending on the language.
 
     :param option: the field option object to be serialized
     :param language: the language in which to localize data
+    :param data: the data loaded by db_prepare_fields_serialization
     :return: a serialization of the object
     """
     ret_dict = {
@@ -221,6 +231,10 @@ def serialize_field_option(option, language):
         'trigger_field': option.trigger_field if option.trigger_field else ''
     }
 
+    if data is not None and option.id in data['l10n']:
+        ret_dict.update(data['l10n'][option.id])
+        return ret_dict
+
     return get_localized_values(ret_dict, option, option.localized_keys, language)
 
 
@@ -256,7 +270,7 @@ def serialize_field(session, tid, field, language, data=None, serialize_template
     :return: a serialization of the object
     """
     if data is None:
-        data = db_prepare_fields_serialization(session, [field])
+        data = db_prepare_fields_serialization(session, [field], language)
 
     f_to_serialize = field
     if field.template_id is not None and serialize_templates is True:
@@ -292,10 +306,14 @@ def serialize_field(session, tid, field, language, data=None, serialize_template
         'width': field.width,
         'triggered_by_score': field.triggered_by_score,
         'triggered_by_options':  triggered_by_options,
-        'options': [serialize_field_option(o, language) for o in data['options'].get(f_to_serialize.id, [])],
-        'children': [serialize_field(session, tid, f, language) for f in data['fields'].get(f_to_serialize.id, [])]
+        'options': [serialize_field_option(o, language, data) for o in data['options'].get(f_to_serialize.id, [])],
+        'children': [serialize_field(session, tid, f, language, data) for f in data['fields'].get(f_to_serialize.id, [])]
     }
 
+    if field.id in data['l10n']:
+        ret_dict.update(data['l10n'][field.id])
+        return ret_dict
+
     return get_localized_values(ret_dict, field, field.localized_keys, language)
 
 
@@ -307,9 +325,12 @@ def serialize_step(session, tid, step, language, serialize_templates=True):
     :param language: the language in which to localize data
     :return: a serialization of the object
     """
-    children = session.query(models.Field).filter(models.Field.step_id == step.id)
+    l10n = {}
+    children = load_localized(session.query(models.Field).filter(models.Field.step_id == step.id),
+                              models.Field, language, l10n)
 
-    data = db_prepare_fields_serialization(session, children)
+    data = db_prepare_fields_serialization(session, children, language)
+    data['l10n'].update(l10n)
 
     ret_dict = {
         'id': step.id,
@@ -332,7 +353,7 @@ def serialize_receiver(session, receiver, language, data=None):
     :return: a serializtion of the object
     """
     if data is None:
-        data = db_prepare_receivers_serialization(session, [receiver])
+        data = db_prepare_receivers_serialization(session, [receiver], language)
 
     user = data['users'][receiver.id]
 
@@ -349,16 +370,22 @@ def serialize_receiver(session, receiver, language, data=None):
     }
 
     # description and eventually other localized strings should be taken from user model
-    get_localized_values(ret_dict, user, ['description'], language)
+    if user.id in data['l10n']:
+        ret_dict.update(data['l10n'][user.id])
+    else:
+        get_localized_values(ret_dict, user, ['description'], language)
 
     return get_localized_values(ret_dict, receiver, receiver.localized_keys, language)
 
 
 def db_get_public_context_list(session, tid, language):
-    contexts = session.query(models.Context).filter(models.Context.id == models.ReceiverContext.context_id,
-                                                    models.Context.tid == tid)
+    l10n = {}
+    contexts = load_localized(session.query(models.Context).filter(models.Context.id == models.ReceiverContext.context_id,
+                                                                   models.Context.tid == tid),
+                              models.Context, language, l10n)
 
     data = db_prepare_contexts_serialization(session, contexts)
+    data['l10n'] = l10n
 
     return [serialize_context(session, context, language, data) for context in contexts]
 
@@ -378,7 +405,7 @@ def db_get_public_receiver_list(session, tid, language):
                                                       models.UserTenant.user_id == models.User.id,
                                                       models.UserTenant.tenant_id == tid)
 
-    data = db_prepare_receivers_serialization(session, receivers)
+    data = db_prepare_receivers_serialization(session, receivers, language)
 
     ret = []
     for receiver in receivers:
@@ -15,8 +15,6 @@ from globaleaks.handlers.submission import serialize_usertip
 from globaleaks.models import serializers
 from globaleaks.orm import transact
 from globaleaks.rest import errors, requests
-from globaleaks.settings import Settings
-from globaleaks.utils.security import directory_traversal_check
 from globaleaks.state import State
 from globaleaks.utils.utility import get_expiration, datetime_now, datetime_never, \
     datetime_to_ISO8601
@@ -243,14 +241,11 @@ def db_get_rtip(session, tid, user_id, rtip_id, language):
 
 
 def db_mark_file_for_secure_deletion(session, relpath):
-    abspath = os.path.join(Settings.attachments_path, relpath)
-
-    if not os.path.isfile(abspath):
-        log.err("Tried to permanently delete a non existent file: %s" % abspath)
-        return
-
+    # the existence of the file is not checked here in order to not access
+    # the storage within the transaction; the deletion of missing files is
+    # handled by the drivers
     secure_file_delete = models.SecureFileDelete()
-    secure_file_delete.filepath = abspath
+    secure_file_delete.filepath = relpath
     session.add(secure_file_delete)
 
 
@@ -520,14 +515,10 @@ class WhistleblowerFileHandler(BaseHandler):
 
         rtip = yield get_rtip(self.request.tid, self.current_user.user_id, tip_id, self.request.language)
 
-        # First: dump the file in the filesystem
+        # First: dump the file in the storage
         filename = str.split(os.path.basename(self.uploaded_file['filename']), '.aes')[0] + '.plain'
 
-        dst = os.path.join(Settings.attachments_path, filename)
-
-        directory_traversal_check(Settings.attachments_path, dst)
-
-        yield threads.deferToThread(self.write_upload_plaintext_to_disk, dst)
+        yield threads.deferToThread(self.write_upload_plaintext_to_storage, self.state.storage, filename)
 
         self.uploaded_file['filename'] = filename
         self.uploaded_file['creation_date'] = datetime_now()
@@ -566,11 +557,9 @@ class WBFileHandler(BaseHandler):
     def get(self, wbfile_id):
         wbfile = yield self.download_wbfile(self.request.tid, wbfile_id)
 
-        filelocation = os.path.join(Settings.attachments_path, wbfile['filename'])
-
-        directory_traversal_check(Settings.attachments_path, filelocation)
+        fo = yield threads.deferToThread(self.state.storage.open, wbfile['filename'])
 
-        yield self.write_file_as_download(wbfile['name'], filelocation)
+        yield self.write_file_as_download_fo(wbfile['name'], fo)
 
 
 class RTipWBFileHandler(WBFileHandler):
@@ -630,11 +619,9 @@ class ReceiverFileDownload(BaseHandler):
     def get(self, rfile_id):
         rfile = yield self.download_rfile(self.request.tid, self.current_user.user_id, rfile_id)
 
-        filelocation = os.path.join(Settings.attachments_path, rfile['filename'])
-
-        directory_traversal_check(Settings.attachments_path, filelocation)
+        fo = yield threads.deferToThread(self.state.storage.open, rfile['filename'])
 
-        yield self.write_file_as_download(rfile['name'], filelocation)
+        yield self.write_file_as_download_fo(rfile['name'], fo)
 
 
 class IdentityAccessRequestsCollection(BaseHandler):
@@ -5,6 +5,7 @@ import copy
 import json
 
 from six import text_type
+from twisted.internet.defer import inlineCallbacks, returnValue
 
 from globaleaks import models
 from globaleaks.handlers.admin.questionnaire import db_get_questionnaire
@@ -13,7 +14,7 @@ from globaleaks.handlers.admin.submission_statuses import db_get_id_for_system_s
 from globaleaks.handlers.base import BaseHandler
 from globaleaks.orm import transact
 from globaleaks.rest import errors, requests
-from globaleaks.utils.security import hash_password, sha256, generateRandomReceipt
+from globaleaks.utils.security import sha256, generateRandomReceipt
 from globaleaks.state import State
 from globaleaks.utils.structures import get_localized_values
 from globaleaks.utils.token import TokenList
@@ -259,7 +260,7 @@ def db_create_receivertip(session, receiver, internaltip):
     session.add(receivertip)
 
 
-def db_create_submission(session, tid, request, uploaded_files, client_using_tor):
+def db_create_submission(session, tid, request, uploaded_files, client_using_tor, receipt_hash):
     answers = request['answers']
 
     context, questionnaire = session.query(models.Context, models.Questionnaire) \
@@ -315,12 +316,10 @@ def db_create_submission(session, tid, request, uploaded_files, client_using_tor
     session.add(submission)
     session.flush()
 
-    receipt = text_type(generateRandomReceipt())
-
     wbtip = models.WhistleblowerTip()
     wbtip.id = submission.id
     wbtip.tid = submission.tid
-    wbtip.receipt_hash = hash_password(receipt, State.tenant_cache[tid].receipt_salt)
+    wbtip.receipt_hash = receipt_hash
     session.add(wbtip)
 
     db_save_questionnaire_answers(session, tid, submission.id, answers)
@@ -360,12 +359,22 @@ def db_create_submission(session, tid, request, uploaded_files, client_using_tor
 
     log.debug("The finalized submission had created %d models.ReceiverTip(s)", rtips_count)
 
-    return {'receipt': receipt}
-
 
 @transact
-def create_submission(session, tid, request, uploaded_files, client_using_tor):
-    return db_create_submission(session, tid, request, uploaded_files, client_using_tor)
+def store_submission(session, tid, request, uploaded_files, client_using_tor, receipt_hash):
+    return db_create_submission(session, tid, request, uploaded_files, client_using_tor, receipt_hash)
+
+
+@inlineCallbacks
+def create_submission(tid, request, uploaded_files, client_using_tor):
+    # The receipt is hashed before opening the transaction in order to not
+    # keep the database busy during the computation of scrypt
+    receipt = text_type(generateRandomReceipt())
+    receipt_hash = yield State.hashing_pool.hash_password(receipt, State.tenant_cache[tid].receipt_salt)
+
+    yield store_submission(tid, request, uploaded_files, client_using_tor, receipt_hash)
+
+    returnValue({'receipt': receipt})
 
 
 class SubmissionInstance(BaseHandler):
@@ -374,6 +383,7 @@ class SubmissionInstance(BaseHandler):
     """
     check_roles = 'unauthenticated'
 
+    @inlineCallbacks
     def put(self, token_id):
         """
         Finalize the submission
@@ -381,15 +391,15 @@ class SubmissionInstance(BaseHandler):
         request = self.validate_message(self.request.content.read(), requests.SubmissionDesc)
 
         # The get and use method will raise if the token is invalid
-        token = TokenList.get(token_id)
-        token.use()
+        token = yield TokenList.run(TokenList.get, token_id)
+        yield TokenList.run(token.use)
 
-        submission = create_submission(self.request.tid,
-                                       request,
-                                       token.uploaded_files,
-                                       self.request.client_using_tor)
+        submission = yield create_submission(self.request.tid,
+                                             request,
+                                             token.uploaded_files,
+                                             self.request.client_using_tor)
 
         # Delete the token only when a valid submission has been stored in the DB
-        TokenList.delete(token_id)
+        yield TokenList.run(TokenList.delete, token_id)
 
-        return submission
+        returnValue(submission)
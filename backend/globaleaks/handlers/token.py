@@ -1,6 +1,8 @@
 # -*- coding: utf-8
 #
 # Handler implementing pre/post submission tokens for implementing rate limiting on whistleblower operations
+from twisted.internet.defer import inlineCallbacks, returnValue
+
 from globaleaks.handlers.base import BaseHandler
 from globaleaks.rest import errors, requests
 from globaleaks.utils.token import Token, TokenList
@@ -12,6 +14,7 @@ class TokenCreate(BaseHandler):
     """
     check_roles = 'unauthenticated'
 
+    @inlineCallbacks
     def post(self):
         """
         This API create a Token, a temporary memory only object able to keep
@@ -27,15 +30,16 @@ class TokenCreate(BaseHandler):
         if request['type'] == 'submission' and not self.state.accept_submissions:
             raise errors.SubmissionDisabled
 
-        token = Token(self.request.tid, request['type'])
+        token = yield TokenList.run(Token, self.request.tid, request['type'])
 
         if not self.request.client_using_tor and (self.request.client_proto == 'http' and
                                                   self.request.hostname not in ['127.0.0.1', 'localhost']):
             # Due to https://github.com/globaleaks/GlobaLeaks/issues/2088 the proof of work if currently
             # implemented only over Tor and HTTPS that are the production conditions.
             token.proof_of_work['solved'] = True
+            yield TokenList.run(TokenList.save, token.id, token)
 
-        return token.serialize()
+        returnValue(token.serialize())
 
 
 class TokenInstance(BaseHandler):
@@ -44,13 +48,14 @@ class TokenInstance(BaseHandler):
     """
     check_roles = 'unauthenticated'
 
+    @inlineCallbacks
     def put(self, token_id):
         request = self.validate_message(self.request.content.read(), requests.TokenAnswerDesc)
 
-        token = TokenList.get(token_id)
+        token = yield TokenList.run(TokenList.get, token_id)
         if token is None or self.request.tid != token.tid:
             raise errors.InvalidAuthentication
 
-        token.update(request)
+        yield TokenList.run(token.update, request)
 
-        return token.serialize()
+        returnValue(token.serialize())
@@ -86,6 +86,9 @@ class BaseJob(task.LoopingCall):
     def get_start_time(self):
         return 0
 
+    def get_metrics(self):
+        return {}
+
     def on_error(self, excep):
         log.err("Exception while running %s" % self.name)
         log.exception(excep)
@@ -3,12 +3,16 @@
 import datetime
 import fnmatch
 import os
+import time
 from datetime import timedelta
 
-from sqlalchemy import not_
+from sqlalchemy import and_, not_, or_
 from sqlalchemy.sql.expression import func
 
-from twisted.internet.defer import inlineCallbacks
+from twisted.internet import reactor
+from twisted.internet.defer import gatherResults, inlineCallbacks
+from twisted.internet.task import deferLater
+from twisted.internet.threads import deferToThreadPool
 
 from globaleaks import models
 from globaleaks.handlers.admin.node import db_admin_serialize_node
@@ -18,7 +22,7 @@ from globaleaks.handlers.user import user_serialize_user
 from globaleaks.jobs.base import LoopingJob
 from globaleaks.orm import transact
 from globaleaks.state import State
-from globaleaks.utils.security import overwrite_and_remove
+from globaleaks.utils.log import log
 from globaleaks.utils.templating import Templating
 from globaleaks.utils.utility import datetime_now, datetime_to_ISO8601, is_expired
 
@@ -30,92 +34,204 @@ class Daily(LoopingJob):
     interval = 24 * 3600
     monitor_interval = 5 * 60
 
+    # number of files securely deleted in parallel before committing
+    # the removal of the corresponding SecureFileDelete entries
+    secure_deletion_batch_size = 100
+
+    # number of expired tips deleted per transaction and seconds
+    # of pause between two transactions
+    expiration_batch_size = 100
+    expiration_batch_interval = 0.1
+
+    # metrics about the progress of the expiration of the tips
+    expired_itips_deleted = 0
+    expired_itips_pending = 0
+
+    # metrics about the last secure deletion run
+    secure_deletion_files = 0
+    secure_deletion_bytes = 0
+    secure_deletion_throughput = 0
+
+    # execution time in milliseconds of each phase of the last run
+    phases_timings = {}
+
+    def get_metrics(self):
+        return {
+            'expired_itips_deleted': self.expired_itips_deleted,
+            'expired_itips_pending': self.expired_itips_pending,
+            'secure_deletion_files': self.secure_deletion_files,
+            'secure_deletion_bytes': self.secure_deletion_bytes,
+            'secure_deletion_throughput': self.secure_deletion_throughput,
+            'phases_timings': self.phases_timings
+        }
+
+    def record_phase_timing(self, name, start_time):
+        self.phases_timings[name] = int((time.time() - start_time) * 1000)
+
     def get_start_time(self):
         current_time = datetime_now()
         return (3600 * 24) - (current_time.hour * 3600) - (current_time.minute * 60) - current_time.second
 
+    def get_tenants_thresholds(self, get_threshold):
+        """
+        Group the tenants by the threshold returned by get_threshold(tenant_cache)
+
+        :return: a list of (threshold, tids) tuples; tenants for which the
+                 threshold is None are skipped
+        """
+        thresholds = {}
+        for tid in self.state.tenant_state:
+            threshold = get_threshold(State.tenant_cache[tid])
+            if threshold is not None:
+                thresholds.setdefault(threshold, []).append(tid)
+
+        return list(thresholds.items())
+
     def db_clean_expired_wbtips(self, session):
         """
         This function checks all the InternalTips and deletes the receipt if the delete threshold is exceeded
         """
-        for tid in self.state.tenant_state:
-            threshold = datetime_now() - timedelta(days=State.tenant_cache[tid].wbtip_timetolive)
+        now = datetime_now()
+
+        thresholds = self.get_tenants_thresholds(lambda x: now - timedelta(days=x.wbtip_timetolive))
+        if not thresholds:
+            return
 
-            wbtips_ids = [r[0] for r in session.query(models.InternalTip.id) \
-                                               .filter(models.InternalTip.tid == tid,
-                                                       models.InternalTip.wb_last_access < threshold)]
+        subquery = session.query(models.InternalTip.id) \
+                          .filter(or_(*[and_(models.InternalTip.tid.in_(tids),
+                                             models.InternalTip.wb_last_access < threshold) for threshold, tids in thresholds])) \
+                          .subquery()
 
-            if wbtips_ids:
-                session.query(models.WhistleblowerTip).filter(models.WhistleblowerTip.id.in_(wbtips_ids)).delete(synchronize_session = 'fetch')
+        session.query(models.WhistleblowerTip).filter(models.WhistleblowerTip.id.in_(subquery)).delete(synchronize_session=False)
+
+    @transact
+    def count_expired_itips(self, session):
+        return session.query(models.InternalTip.id) \
+                      .filter(models.InternalTip.expiration_date < datetime_now()).count()
 
-    def db_clean_expired_itips(self, session):
+    @transact
+    def clean_expired_itips(self, session, limit):
         """
-        This function, checks all the InternalTips and their expiration date.
-        if expired InternalTips are found, it removes that along with
+        This function deletes up to `limit` expired InternalTips along with
         all the related DB entries comment and tip related.
+
+        :return: the number of deleted InternalTips
         """
-        itips_ids = [id[0] for id in session.query(models.InternalTip.id).filter(models.InternalTip.expiration_date < datetime_now())]
+        itips_ids = [id[0] for id in session.query(models.InternalTip.id) \
+                                            .filter(models.InternalTip.expiration_date < datetime_now()) \
+                                            .order_by(models.InternalTip.expiration_date) \
+                                            .limit(limit)]
         if itips_ids:
             db_delete_itips(session, itips_ids)
 
+        return len(itips_ids)
+
+    @inlineCallbacks
+    def perform_expiration_of_itips(self):
+        """
+        Delete the expired InternalTips in bounded batches, each one committed
+        in its own transaction, pausing between batches so that the database
+        stays available to the other requests.
+
+        The job is resumable: if interrupted, the next run restarts from the
+        tips that are still expired.
+        """
+        self.expired_itips_deleted = 0
+        self.expired_itips_pending = yield self.count_expired_itips()
+
+        while self.expired_itips_pending and not self.state.shutdown:
+            count = yield self.clean_expired_itips(self.expiration_batch_size)
+
+            self.expired_itips_deleted += count
+            self.expired_itips_pending = max(self.expired_itips_pending - count, 0)
+
+            log.debug("Deleted %d expired submissions (%d pending)",
+                      self.expired_itips_deleted, self.expired_itips_pending)
+
+            if count < self.expiration_batch_size:
+                self.expired_itips_pending = 0
+                break
+
+            if self.expired_itips_pending:
+                yield deferLater(reactor, self.expiration_batch_interval, lambda: None)
+
     def db_check_for_expiring_submissions(self, session):
-        for tid in self.state.tenant_state:
-            threshold = datetime_now() + timedelta(hours=State.tenant_cache[tid].notification.tip_expiration_threshold)
-
-            for user in session.query(models.User).filter(models.User.role == u'receiver',
-                                                          models.UserTenant.user_id == models.User.id,
-                                                          models.UserTenant.tenant_id == tid):
-                itip_ids = [id[0] for id in session.query(models.InternalTip.id) \
-                                                 .filter(models.InternalTip.tid == tid,
-                                                         models.ReceiverTip.internaltip_id == models.InternalTip.id,
-                                                         models.InternalTip.expiration_date < threshold,
-                                                         models.ReceiverTip.receiver_id == models.Receiver.id,
-                                                         models.Receiver.id == user.id)]
-
-                if not len(itip_ids):
-                    continue
-
-                earliest_expiration_date = session.query(func.min(models.InternalTip.expiration_date)) \
-                                                .filter(models.InternalTip.id.in_(itip_ids)).one()[0]
-
-                user_desc = user_serialize_user(session, user, user.language)
-
-                data = {
-                   'type': u'tip_expiration_summary',
-                   'node': db_admin_serialize_node(session, tid, user.language),
-                   'notification': db_get_notification(session, tid, user.language),
-                   'user': user_desc,
-                   'expiring_submission_count': len(itip_ids),
-                   'earliest_expiration_date': datetime_to_ISO8601(earliest_expiration_date)
-                }
-
-                subject, body = Templating().get_mail_subject_and_body(data)
-
-                session.add(models.Mail({
-                    'tid': tid,
-                    'address': user_desc['mail_address'],
-                    'subject': subject,
-                    'body': body
-                 }))
+        now = datetime_now()
+
+        thresholds = self.get_tenants_thresholds(lambda x: now + timedelta(hours=x.notification.tip_expiration_threshold))
+        if not thresholds:
+            return
+
+        results = session.query(models.InternalTip.tid,
+                                models.ReceiverTip.receiver_id,
+                                func.count(models.InternalTip.id),
+                                func.min(models.InternalTip.expiration_date)) \
+                         .filter(models.ReceiverTip.internaltip_id == models.InternalTip.id,
+                                 models.UserTenant.user_id == models.ReceiverTip.receiver_id,
+                                 models.UserTenant.tenant_id == models.InternalTip.tid,
+                                 or_(*[and_(models.InternalTip.tid.in_(tids),
+                                            models.InternalTip.expiration_date < threshold) for threshold, tids in thresholds])) \
+                         .group_by(models.InternalTip.tid, models.ReceiverTip.receiver_id).all()
+
+        if not results:
+            return
+
+        users = {}
+        for user in session.query(models.User).filter(models.User.id.in_(set(x[1] for x in results)),
+                                                      models.User.role == u'receiver'):
+            users[user.id] = user
+
+        serializations = {}
+
+        for tid, user_id, count, earliest_expiration_date in results:
+            user = users.get(user_id)
+            if user is None:
+                continue
+
+            if (tid, user.language) not in serializations:
+                serializations[(tid, user.language)] = (db_admin_serialize_node(session, tid, user.language),
+                                                        db_get_notification(session, tid, user.language))
+
+            node, notification = serializations[(tid, user.language)]
+
+            user_desc = user_serialize_user(session, user, user.language)
+
+            data = {
+               'type': u'tip_expiration_summary',
+               'node': node,
+               'notification': notification,
+               'user': user_desc,
+               'expiring_submission_count': count,
+               'earliest_expiration_date': datetime_to_ISO8601(earliest_expiration_date)
+            }
+
+            subject, body = Templating().get_mail_subject_and_body(data)
+
+            session.add(models.Mail({
+                'tid': tid,
+                'address': user_desc['mail_address'],
+                'subject': subject,
+                'body': body
+             }))
 
     def db_expire_old_passwords(self, session):
         """
         Expires passwords if past the last change date
         """
-        for tid in self.state.tenant_state:
-            # if the expiration threshold is 0, ignore it
-            if State.tenant_cache[tid].password_change_period == 0:
-                continue
+        now = datetime_now()
 
-            threshold = datetime_now() - timedelta(days=State.tenant_cache[tid].password_change_period)
+        # if the expiration threshold is 0, ignore it
+        thresholds = self.get_tenants_thresholds(lambda x: now - timedelta(days=x.password_change_period) if x.password_change_period else None)
+        if not thresholds:
+            return
 
-            ids = [r[0] for r in session.query(models.User.id) \
-                                        .join(models.UserTenant) \
-                                        .filter(models.User.password_change_date < threshold,
-                                                models.UserTenant.user_id == models.User.id,
-                                                models.UserTenant.tenant_id == tid)]
+        subquery = session.query(models.User.id) \
+                          .filter(models.UserTenant.user_id == models.User.id,
+                                  or_(*[and_(models.UserTenant.tenant_id.in_(tids),
+                                             models.User.password_change_date < threshold) for threshold, tids in thresholds])) \
+                          .subquery()
 
-            session.query(models.User).filter(models.User.id.in_(ids)).update({'password_change_needed': True}, synchronize_session='fetch')
+        session.query(models.User).filter(models.User.id.in_(subquery)).update({'password_change_needed': True}, synchronize_session=False)
 
     def db_clean(self, session):
         # delete stats older than 1 year
@@ -140,20 +256,39 @@ class Daily(LoopingJob):
     @inlineCallbacks
     def perform_secure_deletion_of_files(self):
         # Delete files that are marked for secure deletion
+        start_time = time.time()
+        count = 0
+
         files_to_delete = yield self.get_files_to_secure_delete()
-        for file_to_delete in files_to_delete:
-            overwrite_and_remove(file_to_delete)
+        for i in range(0, len(files_to_delete), self.secure_deletion_batch_size):
+            batch = files_to_delete[i:i + self.secure_deletion_batch_size]
+
+            # entries created before the introduction of the storage
+            # drivers hold the absolute path of the files
+            results = yield gatherResults([deferToThreadPool(reactor,
+                                                             self.state.secure_delete_tp,
+                                                             self.state.storage.delete,
+                                                             os.path.basename(file_to_delete)) for file_to_delete in batch])
+
+            count += sum(results)
 
-        if files_to_delete:
-            yield self.commit_files_deletion(files_to_delete)
+            yield self.commit_files_deletion(batch)
+
+        elapsed_time = time.time() - start_time
+
+        self.secure_deletion_files = len(files_to_delete)
+        self.secure_deletion_bytes = count
+        self.secure_deletion_throughput = int(count / elapsed_time) if elapsed_time else 0
 
         # Delete the outdated AES files older than 1 day
-        files_to_remove = [f for f in os.listdir(self.state.settings.attachments_path) if fnmatch.fnmatch(f, '*.aes')]
-        for f in files_to_remove:
-            path = os.path.join(self.state.settings.attachments_path, f)
-            timestamp = datetime.datetime.fromtimestamp(os.path.getmtime(path))
-            if is_expired(timestamp, days=1):
+        threshold = time.time() - 24 * 3600
+        self.state.attachments_inventory.scan()
+        for f in self.state.attachments_inventory.older_than(threshold):
+            path = self.state.attachments_inventory.get_path(f)
+            # the cached timestamp could be outdated for files still being written
+            if fnmatch.fnmatch(f, '*.aes') and os.path.getmtime(path) < threshold:
                 os.remove(path)
+                self.state.attachments_inventory.discard(f)
 
         # Delete the backups older than 15 days
         for f in os.listdir(self.state.settings.backups_path):
@@ -164,19 +299,25 @@ class Daily(LoopingJob):
 
     @transact
     def daily_clean(self, session):
-        self.db_clean_expired_wbtips(session)
-
-        self.db_clean_expired_itips(session)
-
-        self.db_check_for_expiring_submissions(session)
-
-        self.db_expire_old_passwords(session)
-
-        self.db_clean(session)
+        for phase in [self.db_clean_expired_wbtips,
+                      self.db_check_for_expiring_submissions,
+                      self.db_expire_old_passwords,
+                      self.db_clean]:
+            start_time = time.time()
+            phase(session)
+            self.record_phase_timing(phase.__name__, start_time)
 
     @inlineCallbacks
     def operation(self):
+        self.phases_timings = {}
+
+        start_time = time.time()
+        yield self.perform_expiration_of_itips()
+        self.record_phase_timing('perform_expiration_of_itips', start_time)
+
         yield self.daily_clean()
 
+        start_time = time.time()
         yield self.perform_secure_deletion_of_files()
+        self.record_phase_timing('perform_secure_deletion_of_files', start_time)
 
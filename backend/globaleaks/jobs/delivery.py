@@ -5,8 +5,6 @@
 #
 # Call also the FileProcess working point, in order to verify which
 # kind of file has been submitted.
-import os
-
 from twisted.internet.defer import inlineCallbacks
 
 from globaleaks import models
@@ -14,7 +12,7 @@ from globaleaks.jobs.base import LoopingJob
 from globaleaks.orm import transact
 from globaleaks.utils.pgp import PGPContext
 from globaleaks.utils.security import generateRandomKey
-from globaleaks.settings import Settings
+from globaleaks.utils.storage import get_sharded_path
 from globaleaks.utils.log import log
 
 __all__ = ['Delivery']
@@ -106,11 +104,15 @@ def fsops_pgp_encrypt(state, sf, key, fingerprint):
 
     pgpctx.load_key(key)
 
+    encrypted_file_name = "pgp_encrypted-%s" % generateRandomKey(16)
+    encrypted_file_path = get_sharded_path(state.settings.tmp_path, encrypted_file_name, True)
+
     with sf.open('rb') as f:
-        encrypted_file_path = os.path.abspath(os.path.join(state.settings.attachments_path, "pgp_encrypted-%s" % generateRandomKey(16)))
         _, encrypted_file_size = pgpctx.encrypt_file(fingerprint, f, encrypted_file_path)
 
-    return os.path.basename(encrypted_file_path), encrypted_file_size
+    state.storage.put_file(encrypted_file_name, encrypted_file_path)
+
+    return encrypted_file_name, encrypted_file_size
 
 
 def process_files(state, receiverfiles_maps):
@@ -121,7 +123,6 @@ def process_files(state, receiverfiles_maps):
     for ifile_id, receiverfiles_map in receiverfiles_maps.items():
         ifile_name = receiverfiles_map['ifile_name']
         plain_name = "%s.plain" % ifile_name.split('.')[0]
-        plain_path = os.path.abspath(os.path.join(Settings.attachments_path, plain_name))
 
         sf = state.get_tmp_file_by_name(ifile_name)
 
@@ -157,7 +158,7 @@ def process_files(state, receiverfiles_maps):
                       ifile_name, plain_name)
 
             try:
-                with sf.open('rb') as encrypted_file, open(plain_path, "a+b") as plaintext_file:
+                with sf.open('rb') as encrypted_file, state.storage.open(plain_name, 'wb') as plaintext_file:
                     while True:
                         chunk = encrypted_file.read(4096)
                         if not chunk:
@@ -166,7 +167,7 @@ def process_files(state, receiverfiles_maps):
 
                 receiverfiles_map['ifile_name'] = plain_name
             except Exception as excep:
-                log.err("Unable to create plaintext file %s: %s", plain_path, excep)
+                log.err("Unable to create plaintext file %s: %s", plain_name, excep)
         else:
             log.debug("All receivers support PGP or the system denies plaintext version of files: marking internalfile as removed")
 
@@ -204,5 +205,6 @@ class Delivery(LoopingJob):
         """
         receiverfiles_maps = yield receiverfile_planning()
         if receiverfiles_maps:
-            process_files(self.state, receiverfiles_maps)
+            # the files are popped from the store of the uploads off the reactor
+            yield self.state.TempUploadFiles.run(process_files, self.state, receiverfiles_maps)
             yield update_internalfile_and_store_receiverfiles(receiverfiles_maps)
@@ -1,20 +1,24 @@
 #######i -*- coding: utf-8 -*-
 # Implement the notification of new submissions
-import copy
+import random
+from datetime import timedelta
 
+from sqlalchemy.sql.expression import case, func
 from twisted.internet import defer
 
 from globaleaks import models
 from globaleaks.handlers.admin.context import admin_serialize_context
 from globaleaks.handlers.admin.node import db_admin_serialize_node
 from globaleaks.handlers.admin.notification import db_get_notification
-from globaleaks.handlers.rtip import serialize_rtip, serialize_message, serialize_comment
+from globaleaks.handlers.rtip import serialize_message, serialize_comment
+from globaleaks.handlers.submission import serialize_usertip
 from globaleaks.handlers.user import user_serialize_user
 from globaleaks.jobs.base import NetLoopingJob
 from globaleaks.orm import transact
 from globaleaks.utils.pgp import PGPContext
 from globaleaks.utils.templating import Templating
 from globaleaks.utils.log import log
+from globaleaks.utils.utility import datetime_now
 
 trigger_template_map = {
     'ReceiverTip': u'tip',
@@ -37,9 +41,21 @@ def gen_cache_key(*args):
 
 
 class MailGenerator(object):
+    """
+    Generates the mails related to the events (new tips, comments, messages
+    and files) registered since the last run.
+
+    The events are prefetched in bulk with a query per event type joining the
+    recipients involved; the serializations of the tips, the contexts, the users
+    and the configurations are cached per language and shared by all the events
+    and the recipients that need them, so that the cost of every event is linear
+    in the number of its recipients and independent of the size of the tip.
+    """
     def __init__(self, state):
         self.state = state
         self.cache = {}
+        self.pgpctx = None
+        self.fingerprints = {}
 
     def serialize_config(self, session, key, tid, language):
         cache_key = gen_cache_key(key, tid, language)
@@ -66,9 +82,6 @@ class MailGenerator(object):
                 cache_obj = user_serialize_user(session, obj, language)
             elif key == 'context':
                 cache_obj = admin_serialize_context(session, obj, language)
-            elif key == 'tip':
-                itip = session.query(models.InternalTip).filter(models.InternalTip.id == obj.internaltip_id).one()
-                cache_obj = serialize_rtip(session, obj, itip, language)
             elif key == 'message':
                 cache_obj = serialize_message(session, obj)
             elif key == 'comment':
@@ -80,81 +93,94 @@ class MailGenerator(object):
 
         return self.cache[cache_key]
 
-    def process_ReceiverTip(self, session, rtip, data):
-        user, context = session.query(models.User, models.Context) \
-                               .filter(models.User.id == rtip.receiver_id,
-                                       models.InternalTip.id == rtip.internaltip_id,
-                                       models.Context.id == models.InternalTip.context_id).one()
+    def serialize_tip(self, session, rtip, itip, language):
+        """
+        Serialize the tip of a recipient reusing the serialization of the
+        internaltip shared by all the recipients with the same language and
+        the same access to the whistleblower identity.
+        """
+        cache_key = gen_cache_key('tip', itip.tid, itip.id, language, rtip.can_access_whistleblower_identity)
 
-        tid = context.tid
-
-        data['user'] = self.serialize_obj(session, 'user', user, tid, user.language)
-        data['tip'] = self.serialize_obj(session, 'tip', rtip, tid, user.language)
-        data['context'] = self.serialize_obj(session, 'context', context, tid, user.language)
-
-        self.process_mail_creation(session, tid, data)
-
-    def process_Message(self, session, message, data):
-        # if the message was created by a receiver do not generate mails
-        if message.type == u"receiver":
-            return
-
-        user, context, rtip = session.query(models.User, models.Context, models.ReceiverTip) \
-                                     .filter(models.User.id == models.ReceiverTip.receiver_id,
-                                             models.ReceiverTip.id == models.Message.receivertip_id,
-                                             models.Context.id == models.InternalTip.context_id,
-                                             models.InternalTip.id == models.ReceiverTip.internaltip_id,
-                                             models.Message.id == message.id).one()
-
-        tid = context.tid
-
-        data['user'] = self.serialize_obj(session, 'user', user, tid, user.language)
-        data['tip'] = self.serialize_obj(session, 'tip', rtip, tid, user.language)
-        data['context'] = self.serialize_obj(session, 'context', context, tid, user.language)
-        data['message'] = self.serialize_obj(session, 'message', message, tid, user.language)
-
-        self.process_mail_creation(session, tid, data)
+        if cache_key not in self.cache:
+            self.cache[cache_key] = serialize_usertip(session, rtip, itip, language)
+
+        ret = dict(self.cache[cache_key])
+        ret['id'] = rtip.id
+        ret['receiver_id'] = rtip.receiver_id
+        ret['label'] = rtip.label
+        ret['enable_notifications'] = bool(rtip.enable_notifications)
+        return ret
+
+    def encrypt_body(self, pgp_key_public, body):
+        if self.pgpctx is None:
+            self.pgpctx = PGPContext(self.state.settings.tmp_path)
+
+        if pgp_key_public not in self.fingerprints:
+            self.fingerprints[pgp_key_public] = self.pgpctx.load_key(pgp_key_public)['fingerprint']
+
+        return self.pgpctx.encrypt_message(self.fingerprints[pgp_key_public], body)
+
+    def prefetch_ReceiverTip(self, session):
+        for rtip, itip, user, context in session.query(models.ReceiverTip, models.InternalTip, models.User, models.Context) \
+                                                .filter(models.ReceiverTip.new == True,
+                                                        models.InternalTip.id == models.ReceiverTip.internaltip_id,
+                                                        models.User.id == models.ReceiverTip.receiver_id,
+                                                        models.Context.id == models.InternalTip.context_id):
+            yield rtip, rtip, itip, user, context, None
+
+    def prefetch_Message(self, session):
+        for message, rtip, itip, user, context in session.query(models.Message, models.ReceiverTip, models.InternalTip, models.User, models.Context) \
+                                                         .filter(models.Message.new == True,
+                                                                 models.ReceiverTip.id == models.Message.receivertip_id,
+                                                                 models.InternalTip.id == models.ReceiverTip.internaltip_id,
+                                                                 models.User.id == models.ReceiverTip.receiver_id,
+                                                                 models.Context.id == models.InternalTip.context_id):
+            # if the message was created by a receiver do not generate mails
+            if message.type == u'receiver':
+                continue
 
-    def process_Comment(self, session, comment, data):
-        for user, context, rtip in session.query(models.User, models.Context, models.ReceiverTip) \
-                                          .filter(models.User.id == models.ReceiverTip.receiver_id,
-                                                  models.ReceiverTip.internaltip_id == comment.internaltip_id,
-                                                  models.Context.id == models.InternalTip.context_id,
-                                                  models.InternalTip.id == comment.internaltip_id,
-                                                  models.ReceiverTip.internaltip_id == comment.internaltip_id):
-            tid = context.tid
+            yield message, rtip, itip, user, context, message
 
+    def prefetch_Comment(self, session):
+        for comment, rtip, itip, user, context in session.query(models.Comment, models.ReceiverTip, models.InternalTip, models.User, models.Context) \
+                                                         .filter(models.Comment.new == True,
+                                                                 models.ReceiverTip.internaltip_id == models.Comment.internaltip_id,
+                                                                 models.InternalTip.id == models.Comment.internaltip_id,
+                                                                 models.User.id == models.ReceiverTip.receiver_id,
+                                                                 models.Context.id == models.InternalTip.context_id):
             # avoid to send emails to the receiver that written the comment
             if comment.author_id == rtip.receiver_id:
                 continue
 
-            umsg = copy.deepcopy(data)
-            umsg['user'] = self.serialize_obj(session, 'user', user, tid, user.language)
-            umsg['tip'] = self.serialize_obj(session, 'tip', rtip, tid, user.language)
-            umsg['context'] = self.serialize_obj(session, 'context', context, tid, user.language)
-            umsg['comment'] = self.serialize_obj(session, 'comment', comment, tid, user.language)
-
-            self.process_mail_creation(session, tid, umsg)
+            yield comment, rtip, itip, user, context, comment
+
+    def prefetch_ReceiverFile(self, session):
+        for rfile, ifile, rtip, itip, user, context in session.query(models.ReceiverFile, models.InternalFile, models.ReceiverTip, models.InternalTip, models.User, models.Context) \
+                                                              .filter(models.ReceiverFile.new == True,
+                                                                      models.InternalFile.id == models.ReceiverFile.internalfile_id,
+                                                                      models.ReceiverTip.id == models.ReceiverFile.receivertip_id,
+                                                                      models.InternalTip.id == models.ReceiverTip.internaltip_id,
+                                                                      models.User.id == models.ReceiverTip.receiver_id,
+                                                                      models.Context.id == models.InternalTip.context_id):
+            # avoid sending an email for the files that have been loaded during the initial submission
+            if ifile.submission:
+                continue
 
-    def process_ReceiverFile(self, session, rfile, data):
-        user, context, rtip, ifile = session.query(models.User, models.Context, models.ReceiverTip, models.InternalFile) \
-                                            .filter(models.User.id == models.ReceiverTip.receiver_id,
-                                                    models.InternalFile.id == rfile.internalfile_id,
-                                                    models.InternalTip.id == models.InternalFile.internaltip_id,
-                                                    models.ReceiverTip.id == rfile.receivertip_id,
-                                                    models.Context.id == models.InternalTip.context_id).one()
+            yield rfile, rtip, itip, user, context, ifile
 
+    def process_event(self, session, trigger, rtip, itip, user, context, obj):
         tid = context.tid
 
-        # avoid sending an email for the files that have been loaded during the initial submission
-        if ifile.submission:
-            return
+        data = {
+            'type': trigger_template_map[trigger]
+        }
 
         data['user'] = self.serialize_obj(session, 'user', user, tid, user.language)
-        data['tip'] = self.serialize_obj(session, 'tip', rtip, tid, user.language)
-        data['user'] = self.serialize_obj(session, 'user', user, tid, user.language)
+        data['tip'] = self.serialize_tip(session, rtip, itip, user.language)
         data['context'] = self.serialize_obj(session, 'context', context, tid, user.language)
-        data['file'] = self.serialize_obj(session, 'file', ifile, tid, user.language)
+
+        if obj is not None:
+            data[data['type']] = self.serialize_obj(session, data['type'], obj, tid, user.language)
 
         self.process_mail_creation(session, tid, data)
 
@@ -200,9 +226,7 @@ class MailGenerator(object):
 
         # If the receiver has encryption enabled encrypt the mail body
         if data['user']['pgp_key_public']:
-            pgpctx = PGPContext(self.state.settings.tmp_path)
-            fingerprint = pgpctx.load_key(data['user']['pgp_key_public'])['fingerprint']
-            body = pgpctx.encrypt_message(fingerprint, body)
+            body = self.encrypt_body(data['user']['pgp_key_public'], body)
 
         session.add(models.Mail({
             'address': data['user']['mail_address'],
@@ -213,56 +237,93 @@ class MailGenerator(object):
 
     @transact
     def generate(self, session):
+        silent_tids = set(tid for tid, cache_item in self.state.tenant_cache.items()
+                          if cache_item.notification.disable_receiver_notification_emails)
+
         for trigger in ['ReceiverTip', 'Comment', 'Message', 'ReceiverFile']:
             model = trigger_model_map[trigger]
 
-            silent_tids = []
-            for tid, cache_item in self.state.tenant_cache.items():
-                if cache_item.notification.disable_receiver_notification_emails:
-                    silent_tids.append(tid)
-
-            if len(silent_tids):
-                for x in session.query(models.ReceiverTip).filter(models.ReceiverTip.internaltip_id == models.InternalTip.id,
-                                                                  models.InternalTip.tid.in_(silent_tids)):
-                    x.new = False
-
-                for x in session.query(models.Comment).filter(models.Comment.internaltip_id == models.InternalTip.id,
-                                                              models.InternalTip.tid.in_(silent_tids)):
-                    x.new = False
-
-                for x in session.query(models.Message).filter(models.Message.receivertip_id == models.ReceiverTip.id,
-                                                              models.ReceiverTip.internaltip_id == models.InternalTip.id,
-                                                              models.InternalTip.tid.in_(silent_tids)):
-                    x.new = False
+            # the elements are loaded before the events so that the elements
+            # created in the meantime are left for the next run
+            elements = set(session.query(model).filter(model.new == True))
+            if not elements:
+                continue
 
-                for x in session.query(models.ReceiverFile).filter(models.ReceiverFile.receivertip_id == models.ReceiverTip.id,
-                                                                   models.ReceiverTip.internaltip_id == models.InternalTip.id,
-                                                                   models.InternalTip.tid.in_(silent_tids)):
-                    x.new = False
+            events = [event for event in getattr(self, 'prefetch_%s' % trigger)(session) if event[0] in elements]
 
-            for element in session.query(model).filter(model.new == True):
+            for element in elements:
                 element.new = False
 
-                data = {
-                    'type': trigger_template_map[trigger]
-                }
+            for _, rtip, itip, user, context, obj in events:
+                if itip.tid not in silent_tids:
+                    self.process_event(session, trigger, rtip, itip, user, context, obj)
 
-                getattr(self, 'process_%s' % trigger)(session, element, data)
 
 @transact
 def delete_sent_mails(session, mail_ids):
     session.query(models.Mail).filter(models.Mail.id.in_(mail_ids)).delete(synchronize_session='fetch')
 
 
-@transact
-def get_mails_from_the_pool(session):
-    session.query(models.Mail).filter(models.Mail.processing_attempts > 9).delete(synchronize_session='fetch')
-    session.query(models.Mail).update({'processing_attempts': models.Mail.processing_attempts + 1})
+def get_mail_retry_delay(attempts):
+    """
+    Return the delay before the next delivery attempt of a mail
+    exponentially backing off with the attempts already performed.
+
+    The delay is jittered in order to spread over time the retries of
+    mails that failed together (e.g. during an outage of the SMTP server).
+    """
+    delay = min(Notification.retry_base_delay * (2 ** (attempts - 1)),
+                Notification.retry_max_delay)
+
+    return timedelta(seconds=delay * random.uniform(0.5, 1.0))
 
-    ret = []
 
-    for mail in session.query(models.Mail).order_by(models.Mail.creation_date):
-        ret.append({
+@transact
+def get_mails_from_the_pool(session, limit):
+    now = datetime_now()
+
+    # mails that exhausted their delivery attempts are discarded as soon as
+    # the backoff of their last attempt expires
+    session.query(models.Mail).filter(models.Mail.processing_attempts >= Notification.max_attempts,
+                                      models.Mail.next_attempt_at <= now).delete(synchronize_session='fetch')
+
+    stats = session.query(func.count(models.Mail.id),
+                          func.min(models.Mail.creation_date)).one()
+
+    ret = {
+        'queue_depth': stats[0],
+        'queue_oldest_date': stats[1],
+        'mails': []
+    }
+
+    leased = session.query(models.Mail.id, models.Mail.processing_attempts) \
+                    .filter(models.Mail.next_attempt_at <= now) \
+                    .order_by(models.Mail.next_attempt_at, models.Mail.creation_date) \
+                    .limit(limit).all()
+
+    if not leased:
+        return ret
+
+    # the lease of each mail lasts up to its next scheduled attempt, so that
+    # mails not deleted after a successful delivery are retried with backoff;
+    # the batch is leased with a single update computing the next attempt
+    # of each mail from its current number of attempts
+    next_attempts = {attempts: now + get_mail_retry_delay(attempts + 1) for attempts in set(x[1] for x in leased)}
+
+    session.query(models.Mail).filter(models.Mail.id.in_([x[0] for x in leased])) \
+           .update({'processing_attempts': models.Mail.processing_attempts + 1,
+                    'next_attempt_at': case(next_attempts, value=models.Mail.processing_attempts)},
+                   synchronize_session=False)
+
+    # mail bodies are loaded only for the leased mails
+    for mail in session.query(models.Mail.id,
+                              models.Mail.tid,
+                              models.Mail.address,
+                              models.Mail.subject,
+                              models.Mail.body) \
+                       .filter(models.Mail.id.in_([x[0] for x in leased])) \
+                       .order_by(models.Mail.creation_date):
+        ret['mails'].append({
             'id': mail.id,
             'address': mail.address,
             'subject': mail.subject,
@@ -278,17 +339,63 @@ class Notification(NetLoopingJob):
     monitor_interval = 3 * 60
     mails_to_delete = []
 
+    # maximum number of tenants whose mails are delivered concurrently
+    concurrent_spools = 10
+
+    # maximum number of mails delivered over a single SMTP session
+    mails_per_session = 50
+
+    # maximum number of mails leased from the pool at every run
+    mails_per_run = 500
+
+    # retry schedule of mails whose delivery failed; with the default values
+    # a mail is retried for most of a day before being discarded
+    retry_base_delay = 60
+    retry_max_delay = 3600
+    max_attempts = 30
+
+    # metrics about the mails pending in the pool
+    queue_depth = 0
+    queue_oldest_age = 0
+
+    def get_metrics(self):
+        return {
+            'queue_depth': self.queue_depth,
+            'queue_oldest_age': self.queue_oldest_age
+        }
+
     @defer.inlineCallbacks
-    def sendmail(self, mail):
-        success = yield self.state.sendmail(mail['tid'], mail['address'], mail['subject'], mail['body'])
-        if success:
-            self.mails_to_delete.append(mail['id'])
+    def sendmails(self, tid, mails):
+        results = yield self.state.sendmails(tid, mails)
+        for mail, success in zip(mails, results):
+            if success:
+                self.mails_to_delete.append(mail['id'])
+
+    @defer.inlineCallbacks
+    def spool_tenant_emails(self, tid, mails):
+        for i in range(0, len(mails), self.mails_per_session):
+            yield self.sendmails(tid, mails[i:i + self.mails_per_session])
 
     @defer.inlineCallbacks
     def spool_emails(self):
-        mails = yield get_mails_from_the_pool()
+        pool = yield get_mails_from_the_pool(self.mails_per_run)
+
+        self.queue_depth = pool['queue_depth']
+        self.queue_oldest_age = 0
+        if pool['queue_oldest_date'] is not None:
+            self.queue_oldest_age = int((datetime_now() - pool['queue_oldest_date']).total_seconds())
+
+        mails = pool['mails']
+
+        mails_by_tid = {}
         for mail in mails:
-            yield self.sendmail(mail)
+            mails_by_tid.setdefault(mail['tid'], []).append(mail)
+
+        # the mails of each tenant are delivered over their own SMTP sessions
+        # so that the failure or the slowness of a server does not block the others
+        semaphore = defer.DeferredSemaphore(self.concurrent_spools)
+        yield defer.DeferredList([semaphore.run(self.spool_tenant_emails, tid, tenant_mails)
+                                  for tid, tenant_mails in mails_by_tid.items()], consumeErrors=True)
 
         if self.mails_to_delete:
             yield delete_sent_mails(self.mails_to_delete)
@@ -17,3 +17,4 @@ class SessionManagement(LoopingJob):
         """
         self.state.settings.failed_login_attempts = 0
         self.state.api_token_session_suspended = False
+        self.state.notify_login_state()
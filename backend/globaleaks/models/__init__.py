@@ -680,7 +680,9 @@ class _InternalTip(Model):
 
     @declared_attr
     def __table_args__(cls): # pylint: disable=no-self-argument
-        return (ForeignKeyConstraint(['tid'], ['tenant.id'], ondelete='CASCADE', deferrable=True, initially='DEFERRED'),)
+        return (ForeignKeyConstraint(['tid'], ['tenant.id'], ondelete='CASCADE', deferrable=True, initially='DEFERRED'),
+                Index('internaltip_tid_expiration_date', 'tid', 'expiration_date'),
+                Index('internaltip_tid_wb_last_access', 'tid', 'wb_last_access'))
 
 
 class _Mail(Model):
@@ -698,12 +700,14 @@ class _Mail(Model):
     subject = Column(UnicodeText, nullable=False)
     body = Column(UnicodeText, nullable=False)
     processing_attempts = Column(Integer, default=0, nullable=False)
+    next_attempt_at = Column(DateTime, default=datetime_now, nullable=False)
 
     unicode_keys = ['address', 'subject', 'body']
 
     @declared_attr
     def __table_args__(cls): # pylint: disable=no-self-argument
-        return (ForeignKeyConstraint(['tid'], ['tenant.id'], ondelete='CASCADE', deferrable=True, initially='DEFERRED'),)
+        return (ForeignKeyConstraint(['tid'], ['tenant.id'], ondelete='CASCADE', deferrable=True, initially='DEFERRED'),
+                Index('mail_next_attempt_at', 'next_attempt_at'))
 
 
 class _Message(Model):
@@ -16,7 +16,7 @@ from twisted.internet.abstract import isIPAddress, isIPv6Address
 from twisted.web.resource import Resource
 from twisted.web.server import NOT_DONE_YET
 
-from globaleaks import LANGUAGES_SUPPORTED_CODES
+from globaleaks import LANGUAGES_SUPPORTED_CODES, event
 from globaleaks.handlers import custodian, \
                                 email_validation, \
                                 exception, \
@@ -109,6 +109,7 @@ api_spec = [
     (r'/receiver/preferences', receiver.ReceiverInstance),
     (r'/receiver/tips', receiver.TipsCollection),
     (r'/rtip/operations', receiver.TipsOperations),
+    (r'/rtip/export', export.TipsExportHandler),
 
     (r'/custodian/identityaccessrequests', custodian.IdentityAccessRequestsCollection),
     (r'/custodian/identityaccessrequest/' + uuid_regexp, custodian.IdentityAccessRequestInstance),
@@ -200,13 +201,17 @@ def decorate_method(h, method):
             if h.cache_resource:
                 f = apicache.decorator_cache_get(f)
 
-        else:
+        elif method in ['put', 'post', 'delete']:
             if h.invalidate_global_cache or h.invalidate_cache:
                 f = apicache.decorator_cache_invalidate(f)
 
             if h.invalidate_tenant_state:
                f = getattr(h, 'decorator_invalidate_tenant_state')(f)
 
+    if method in ['put', 'post', 'delete']:
+        if h.invalidate_global_cache or h.invalidate_cache:
+            f = getattr(h, 'decorator_notify_change')(f)
+
     f = getattr(h, 'decorator_authentication')(f, value)
 
     setattr(h, method, f)
@@ -241,6 +246,11 @@ class APIResourceWrapper(Resource):
                     if hasattr(handler, m):
                         decorate_method(handler, m)
 
+                if handler.upload_handler:
+                    decorate_method(handler, 'check_file_upload')
+
+            event.register_handler(handler)
+
             self._registry.append((re.compile(pattern), handler, args))
 
     def should_redirect_https(self, request):
@@ -413,11 +423,15 @@ class APIResourceWrapper(Resource):
             # mapping the HEAD method on the GET method.
             method = 'get'
 
-        if method not in self.method_map.keys() or not hasattr(handler, method):
+        if method == 'get' and handler.upload_handler and b'flowChunkNumber' in request.args:
+            # flow.js requests testing the presence of an uploaded chunk
+            f = getattr(handler, 'check_file_upload')
+        elif method in self.method_map.keys() and hasattr(handler, method):
+            f = getattr(handler, method)
+        else:
             self.handle_exception(errors.MethodNotImplemented(), request)
             return b''
 
-        f = getattr(handler, method)
         groups = [text_type(g) for g in match.groups()]
 
         self.handler = handler(State, request, **args)
@@ -428,10 +442,20 @@ class APIResourceWrapper(Resource):
             self.handle_exception(errors.ForbiddenOperation(), request)
             return b''
 
-        if self.handler.upload_handler and method == 'post':
-            self.handler.process_file_upload()
-            if self.handler.uploaded_file is None:
-               return b''
+        @defer.inlineCallbacks
+        def handle():
+            # the session and the uploads could be kept in a shared store
+            # that is queried off the reactor
+            yield self.handler.load_current_user()
+
+            if self.handler.upload_handler and method == 'post':
+                yield State.TempUploadFiles.run(self.handler.process_file_upload)
+                if self.handler.uploaded_file is None:
+                    return
+
+            ret = yield f(self.handler, *groups)
+
+            defer.returnValue(ret)
 
         @defer.inlineCallbacks
         def concludeHandlerFailure(err):
@@ -464,7 +488,7 @@ class APIResourceWrapper(Resource):
 
                 request.finish()
 
-        defer.maybeDeferred(f, self.handler, *groups).addCallbacks(concludeHandlerSuccess, concludeHandlerFailure)
+        handle().addCallbacks(concludeHandlerSuccess, concludeHandlerFailure)
 
         return NOT_DONE_YET
 
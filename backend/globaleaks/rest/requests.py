@@ -176,6 +176,10 @@ ReceiverOperationDesc = {
     'rtips': [uuid_regexp]
 }
 
+ReceiverTipsExportDesc = {
+    'rtips': [uuid_regexp]
+}
+
 CommentDesc = {
     'content': text_type
 }
@@ -2,7 +2,7 @@
 
 from globaleaks.settings import Settings
 from globaleaks.utils.security import generateRandomKey
-from globaleaks.utils.tempdict import TempDict
+from globaleaks.utils.store import StoredItems
 
 class Session(object):
     def __init__(self, tid, user_id, user_role, pcn):
@@ -11,10 +11,10 @@ class Session(object):
         self.user_id = user_id
         self.user_role = user_role
         self.pcn = pcn
-        self.expireCall = None
+        self.expireTime = 0
 
     def getTime(self):
-        return self.expireCall.getTime() if self.expireCall else 0
+        return self.expireTime
 
     def serialize(self):
         return {
@@ -26,12 +26,18 @@ class Session(object):
         }
 
 
-class SessionsFactory(TempDict):
-    """Extends TempDict to provide session management functions ontop of temp session keys"""
+class SessionsFactory(StoredItems):
+    """Provides session management functions ontop of a store of temp session keys"""
+    namespace = 'sessions'
+    indexes = ('user_id', 'tid')
+
     def revoke(self, user_id):
-        for k, v in list(self.items()):
-            if v.user_id == user_id:
-                del self[k]
+        for session_id in self.lookup('user_id', user_id):
+            self.pop(session_id, None)
+
+    def revoke_tenant(self, tid):
+        for session_id in self.lookup('tid', tid):
+            self.pop(session_id, None)
 
     def new(self, tid, user_id, user_role, pcn):
         session = Session(tid, user_id, user_role, pcn)
@@ -170,6 +170,15 @@ class SettingsClass(object):
 
         self.enable_api_cache = True
 
+        # storage of the attachments; None for the local attachments directory
+        self.storage_url = None
+
+        # store of the sessions, tokens and uploads; None for the memory of the process
+        self.store_url = None
+
+        # number of the processes serving the API in addition to the main process
+        self.api_workers = 0
+
     def eval_paths(self):
         self.config_file_path = '/etc/globaleaks'
         self.pidfile_path = os.path.join(self.pid_path, 'globaleaks.pid')
@@ -256,6 +265,27 @@ class SettingsClass(object):
 
         self.api_prefix = self.cmdline_options.api_prefix
 
+        self.storage_url = self.cmdline_options.storage_url
+
+        self.store_url = self.cmdline_options.store_url
+
+        if self.store_url and self.store_url.startswith('sqlite://'):
+            from globaleaks.utils.store import is_on_memory_filesystem
+
+            if not is_on_memory_filesystem(self.store_url[len('sqlite://'):]):
+                self.print_msg("Error: the store contains secrets and it must be on a memory filesystem (e.g. tmpfs)")
+                sys.exit(1)
+
+        if self.cmdline_options.api_workers < 0:
+            self.print_msg("Invalid number of API workers")
+            sys.exit(1)
+
+        if self.cmdline_options.api_workers and self.store_url is None:
+            self.print_msg("Error: API workers require a store shared among the processes")
+            sys.exit(1)
+
+        self.api_workers = self.cmdline_options.api_workers
+
         if self.cmdline_options.client_path:
             self.client_path = os.path.abspath(os.path.join(self.src_path, self.cmdline_options.client_path))
 
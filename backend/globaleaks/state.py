@@ -14,16 +14,21 @@ from twisted.python.threadpool import ThreadPool
 from globaleaks import __version__, orm, models
 from globaleaks.transactions import schedule_email
 from globaleaks.utils.agent import get_tor_agent, get_web_agent
-from globaleaks.utils.mail import sendmail
+from globaleaks.utils.eventqueue import EventQueue
+from globaleaks.utils.inventory import FileInventory
+from globaleaks.utils.letsencrypt import AcmeChallengesClass
+from globaleaks.utils.storage import get_storage
+from globaleaks.utils.mail import sendmails
 from globaleaks.utils.objectdict import ObjectDict
 from globaleaks.utils.singleton import Singleton
 from globaleaks.utils.templating import Templating
 from globaleaks.utils.tor_exit_set import TorExitSet
 from globaleaks.utils.pgp import PGPContext
+from globaleaks.utils.securetempfile import TempUploadFilesClass
 from globaleaks.utils.security import sha256
 from globaleaks.utils.utility import datetime_now
 from globaleaks.utils.log import log
-from globaleaks.utils.tempdict import TempDict
+from globaleaks.workers.hashing import HashingPool
 
 def getAlarm(state):
     from globaleaks.anomaly import Alarm
@@ -32,13 +37,10 @@ def getAlarm(state):
 
 class TenantState(object):
     def __init__(self, state):
-        self.RecentEventQ = []
-        self.EventQ = []
+        self.RecentEventQ = EventQueue()
+        self.EventQ = EventQueue()
         self.AnomaliesQ = []
 
-        # An ACME challenge will have 5 minutes to resolve
-        self.acme_tmp_chall_dict = TempDict(300)
-
         self.Alarm = getAlarm(state)
 
 
@@ -51,6 +53,10 @@ class StateClass(ObjectDict):
         self.settings = Settings
 
         self.process_supervisor = None
+
+        # control channel of the API workers with the main process
+        self.control = None
+
         self.tor_exit_set = TorExitSet()
 
         self.https_socks = []
@@ -62,6 +68,7 @@ class StateClass(ObjectDict):
         self.onion_service_job = None
 
         self.api_token_session = None
+        self.api_token_session_suspended = False
 
         self.exceptions = {}
         self.exceptions_email_count = 0
@@ -74,8 +81,19 @@ class StateClass(ObjectDict):
         self.tenant_cache = {}
         self.tenant_hostname_id_map = {}
 
+        self.attachments_inventory = None
+        self.storage = None
+
         self.set_orm_tp(ThreadPool(4, 16))
-        self.TempUploadFiles = TempDict(timeout=3600)
+        self.secure_delete_tp = ThreadPool(0, 4, 'secure_delete')
+        self.export_tp = ThreadPool(0, 8, 'export')
+        self.compress_tp = ThreadPool(0, 4, 'compress')
+        self.store_tp = ThreadPool(0, 4, 'store')
+        self.hashing_pool = HashingPool()
+        self.TempUploadFiles = TempUploadFilesClass(timeout=3600)
+
+        # An ACME challenge will have 5 minutes to resolve
+        self.AcmeChallenges = AcmeChallengesClass(timeout=300)
 
         self.shutdown = False
 
@@ -84,6 +102,8 @@ class StateClass(ObjectDict):
         os.umask(0o77)
         self.settings.eval_paths()
         self.create_directories()
+        self.attachments_inventory = FileInventory(self.settings.attachments_path)
+        self.storage = get_storage(self.settings.storage_url, self.settings.attachments_path)
         self.cleaning_dead_files()
 
     def set_orm_tp(self, orm_tp):
@@ -137,28 +157,32 @@ class StateClass(ObjectDict):
         temporally_encrypted_dir
         """
         # temporary .aes files must be simply deleted
-        for f in os.listdir(self.settings.tmp_path):
-            path = os.path.join(self.settings.tmp_path, f)
-            log.debug("Removing old temporary file: %s", path)
+        for dirpath, _, filenames in os.walk(self.settings.tmp_path):
+            for f in filenames:
+                path = os.path.join(dirpath, f)
+                log.debug("Removing old temporary file: %s", path)
 
-            try:
-                os.remove(path)
-            except OSError as excep:
-                log.debug("Error while evaluating removal for %s: %s", path, excep.strerror)
+                try:
+                    os.remove(path)
+                except OSError as excep:
+                    log.debug("Error while evaluating removal for %s: %s", path, excep.strerror)
 
         # temporary .aes files with lost keys can be deleted
         # while temporary .aes files with valid current key
         # will be automagically handled by delivery sched.
         keypath = os.path.join(self.settings.tmp_path, self.settings.AES_keyfile_prefix)
 
-        for f in os.listdir(self.settings.attachments_path):
-            path = os.path.join(self.settings.attachments_path, f)
+        self.attachments_inventory.scan(incremental=False)
+
+        for f in self.attachments_inventory.names():
+            path = self.attachments_inventory.get_path(f)
             try:
                 result = self.settings.AES_file_regexp_comp.match(f)
                 if result is not None:
                     if not os.path.isfile("%s%s" % (keypath, result.group(1))):
                         log.debug("Removing old encrypted file (lost key): %s", path)
                         os.remove(path)
+                        self.attachments_inventory.discard(f)
             except Exception as excep:
                 log.debug("Error while evaluating removal for %s: %s", path, excep)
 
@@ -179,29 +203,41 @@ class StateClass(ObjectDict):
         self.stats_collection_start_time = datetime_now()
 
     def sendmail(self, tid, to_address, subject, body):
+        mail = {
+            'address': to_address,
+            'subject': subject,
+            'body': body
+        }
+
+        return self.sendmails(tid, [mail]).addCallback(lambda results: results[0])
+
+    def sendmails(self, tid, mails):
        if self.settings.testing:
            # during unit testing do not try to send the mail
-           return defer.succeed(True)
+           return defer.succeed([True] * len(mails))
 
        if self.tenant_cache[tid].mode == u'whistleblowing.it':
            tid = 1
 
-       return sendmail(tid,
-                       self.tenant_cache[tid].notification.smtp_server,
-                       self.tenant_cache[tid].notification.smtp_port,
-                       self.tenant_cache[tid].notification.smtp_security,
-                       self.tenant_cache[tid].notification.smtp_authentication,
-                       self.tenant_cache[tid].notification.smtp_username,
-                       self.tenant_cache[tid].notification.smtp_password,
-                       self.tenant_cache[tid].notification.smtp_source_name,
-                       self.tenant_cache[tid].notification.smtp_source_email,
-                       to_address,
-                       self.tenant_cache[tid].name + ' - ' + subject,
-                       body,
-                       self.tenant_cache[1].anonymize_outgoing_connections,
-                       self.settings.socks_host,
-                       self.settings.socks_port)
-
+       mails = [{
+           'address': mail['address'],
+           'subject': self.tenant_cache[tid].name + ' - ' + mail['subject'],
+           'body': mail['body']
+       } for mail in mails]
+
+       return sendmails(tid,
+                        self.tenant_cache[tid].notification.smtp_server,
+                        self.tenant_cache[tid].notification.smtp_port,
+                        self.tenant_cache[tid].notification.smtp_security,
+                        self.tenant_cache[tid].notification.smtp_authentication,
+                        self.tenant_cache[tid].notification.smtp_username,
+                        self.tenant_cache[tid].notification.smtp_password,
+                        self.tenant_cache[tid].notification.smtp_source_name,
+                        self.tenant_cache[tid].notification.smtp_source_email,
+                        mails,
+                        self.tenant_cache[1].anonymize_outgoing_connections,
+                        self.settings.socks_host,
+                        self.settings.socks_port)
 
     def schedule_exception_email(self, exception_text, *args):
         if not hasattr(self.tenant_cache[1], 'notification'):
@@ -258,6 +294,62 @@ class StateClass(ObjectDict):
 
         self.process_supervisor.maybe_launch_https_workers()
 
+    def notify_change(self, tid=None):
+        """
+        Notify the other processes serving the API of the change of the
+        configuration of a tenant, or of all the tenants if tid is None
+        """
+        message = {'command': 'refresh', 'tid': tid}
+
+        if self.control is not None:
+            self.control.send(message)
+        elif self.process_supervisor is not None:
+            self.process_supervisor.broadcast(message)
+
+    def notify_alarm(self, tid, activity):
+        """
+        Inform the API workers of the activity alarm level of a tenant
+        """
+        if self.control is None and self.process_supervisor is not None:
+            self.process_supervisor.broadcast({'command': 'alarm', 'tid': tid, 'activity': activity})
+
+    def track_failed_login(self):
+        """
+        Count a failed login attempt
+
+        The attempts are counted by the main process that resets them
+        periodically and informs the API workers of their number.
+        """
+        if self.control is not None:
+            self.control.send({'command': 'failed_login'})
+            return
+
+        self.settings.failed_login_attempts += 1
+        self.notify_login_state()
+
+    def get_login_state_message(self):
+        return {'command': 'login_state',
+                'failed_login_attempts': self.settings.failed_login_attempts,
+                'api_token_session_suspended': self.api_token_session_suspended}
+
+    def notify_login_state(self):
+        """
+        Inform the API workers of the failed login attempts and of the
+        suspension of the session of the API token
+        """
+        if self.control is None and self.process_supervisor is not None:
+            self.process_supervisor.broadcast(self.get_login_state_message())
+
+    def get_tor_exit_set_message(self):
+        return {'command': 'tor_exit_set', 'ips': sorted(self.tor_exit_set)}
+
+    def notify_tor_exit_set(self):
+        """
+        Inform the API workers of the addresses of the Tor exit nodes
+        """
+        if self.control is None and self.process_supervisor is not None:
+            self.process_supervisor.broadcast(self.get_tor_exit_set_message())
+
     def format_and_send_mail(self, session, tid, user_desc, template_vars):
         subject, body = Templating().get_mail_subject_and_body(template_vars)
 
@@ -274,9 +366,12 @@ class StateClass(ObjectDict):
         }))
 
     def get_tmp_file_by_name(self, filename):
-        for k, v in self.TempUploadFiles.items():
-            if os.path.basename(v.filepath) == filename:
-                return self.TempUploadFiles.pop(k)
+        for key in self.TempUploadFiles.lookup('filename', filename):
+            sf = self.TempUploadFiles.pop(key, None)
+            if sf is not None:
+                # the file is now owned by the caller and removed with the object
+                sf.persistent = False
+                return sf
 
 
 def mail_exception_handler(etype, value, tback):
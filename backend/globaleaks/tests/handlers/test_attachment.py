@@ -5,6 +5,7 @@ from globaleaks.handlers import attachment
 from globaleaks.rest import errors
 from globaleaks.tests import helpers
 from globaleaks.utils import token
+from globaleaks.utils.storage import get_attachment_path, get_sharded_path
 from twisted.internet.defer import inlineCallbacks
 
 
@@ -31,18 +32,18 @@ class TestSubmissionAttachment(helpers.TestHandlerWithPopulatedDB):
         token.TokenList.reactor.pump([1] * (token.TokenList.get_timeout() - 1))
 
         for f in self.dummyToken.uploaded_files:
-            path = os.path.abspath(os.path.join(self.state.settings.tmp_path, f['filename']))
+            path = get_sharded_path(self.state.settings.tmp_path, f['filename'])
             self.assertTrue(os.path.exists(path))
 
         token.TokenList.reactor.advance(1)
 
         for f in self.dummyToken.uploaded_files:
-            path = os.path.abspath(os.path.join(self.state.settings.attachments_path, f['filename']))
+            path = get_attachment_path(f['filename'])
             yield self.assertFalse(os.path.exists(path))
 
     def test_post_file_on_unexistent_submission(self):
         handler = self.request()
-        self.assertRaises(errors.TokenFailure, handler.post, u'unexistent_submission')
+        return self.assertFailure(handler.post(u'unexistent_submission'), errors.TokenFailure)
 
 
 class TestPostSubmissionAttachment(helpers.TestHandlerWithPopulatedDB):
@@ -1,10 +1,15 @@
 # -*- coding: utf-8 -*-
 import json
+import os
 
 from six import text_type
+from twisted.internet import defer, protocol, reactor
+from twisted.internet.defer import inlineCallbacks
+from twisted.web import resource, server
 
-from globaleaks.handlers.base import BaseHandler
+from globaleaks.handlers.base import BaseHandler, SendfileProducer
 from globaleaks.rest.errors import InputValidationError
+from globaleaks.state import State
 from globaleaks.tests import helpers
 
 FUTURE = 100
@@ -16,6 +21,19 @@ class BaseHandlerMock(BaseHandler):
     def get(self):
         return
 
+
+def flow_args(chunk_number, data):
+    return {
+        b'file': [data],
+        b'flowFilename': [b'antani.txt'],
+        b'flowIdentifier': [b'antani'],
+        b'flowChunkNumber': [str(chunk_number).encode()],
+        b'flowChunkSize': [b'10'],
+        b'flowTotalChunks': [b'3'],
+        b'flowTotalSize': [b'25']
+    }
+
+
 class TestBaseHandler(helpers.TestHandlerWithPopulatedDB):
     _handler = BaseHandlerMock
 
@@ -69,4 +87,160 @@ class TestBaseHandler(helpers.TestHandlerWithPopulatedDB):
 
     def test_validate_regexp_valid(self):
         self.assertTrue(BaseHandler.validate_regexp('Foca', '\w+'))
-        self.assertFalse(BaseHandler.validate_regexp('Foca', '\d+'))
\ No newline at end of file
+        self.assertFalse(BaseHandler.validate_regexp('Foca', '\d+'))
+
+    def test_process_file_upload_out_of_order(self):
+        content = b"0123456789" * 2 + b"01234"
+
+        for chunk_number in [2, 3, 1]:
+            args = flow_args(chunk_number, content[(chunk_number - 1) * 10:chunk_number * 10])
+
+            handler = self.request()
+            handler.request.args = args
+            handler.check_file_upload()
+            self.assertEqual(handler.request.responseCode, 204)
+
+            handler = self.request()
+            handler.request.args = args
+            handler.process_file_upload()
+            handler.check_file_upload()
+            self.assertNotEqual(handler.request.responseCode, 204)
+
+            if chunk_number != 1:
+                self.assertIsNone(handler.uploaded_file)
+
+        self.assertEqual(handler.uploaded_file['size'], len(content))
+
+        with handler.uploaded_file['body'].open('r') as f:
+            self.assertEqual(f.read(), content)
+
+    def test_process_file_upload_invalid_chunk(self):
+        handler = self.request()
+
+        handler.request.args = flow_args(1, b'012345')
+        self.assertRaises(InputValidationError, handler.process_file_upload)
+
+        handler.request.args = flow_args(4, b'0123456789')
+        self.assertRaises(InputValidationError, handler.process_file_upload)
+
+
+class SendfileResource(resource.Resource):
+    isLeaf = True
+
+    def __init__(self, path):
+        resource.Resource.__init__(self)
+        self.path = path
+
+    def render(self, request):
+        BaseHandler(State, request).send_file(open(self.path, 'rb'))
+        return server.NOT_DONE_YET
+
+
+class RawHTTPClient(protocol.Protocol):
+    """
+    Client sending a sequence of requests over a single keep-alive connection,
+    each one after having received the whole response to the previous one
+    """
+    def __init__(self, requests):
+        self.requests = list(requests)
+        self.method = None
+        self.buffer = b''
+        self.responses = []
+        self.done = defer.Deferred()
+
+    def connectionMade(self):
+        self.send_next()
+
+    def send_next(self):
+        self.method, path, headers = self.requests.pop(0)
+
+        data = b'%s %s HTTP/1.1\r\nHost: 127.0.0.1\r\n' % (self.method, path)
+        if not self.requests:
+            data += b'Connection: close\r\n'
+
+        for name, value in headers.items():
+            data += b'%s: %s\r\n' % (name, value)
+
+        self.transport.write(data + b'\r\n')
+
+    def dataReceived(self, data):
+        self.buffer += data
+
+        if b'\r\n\r\n' not in self.buffer:
+            return
+
+        head, body = self.buffer.split(b'\r\n\r\n', 1)
+        lines = head.split(b'\r\n')
+        headers = dict(line.lower().split(b': ', 1) for line in lines[1:])
+
+        length = int(headers[b'content-length']) if self.method != b'HEAD' else 0
+        if len(body) < length:
+            return
+
+        self.responses.append((lines[0], headers, body[:length]))
+        self.buffer = body[length:]
+
+        if self.requests:
+            self.send_next()
+
+    def connectionLost(self, reason):
+        self.done.callback(self.responses)
+
+
+class TestSendfile(helpers.TestGL):
+    @inlineCallbacks
+    def setUp(self):
+        yield helpers.TestGL.setUp(self)
+
+        self.content = os.urandom(3 * 1024 * 1024 + 1)
+        self.path = self.mktemp()
+        with open(self.path, 'wb') as f:
+            f.write(self.content)
+
+        self.sent = []
+        sendfile = os.sendfile
+
+        def patched_sendfile(*args):
+            sent = sendfile(*args)
+            self.sent.append(sent)
+            return sent
+
+        self.patch(os, 'sendfile', patched_sendfile)
+
+        self.port = reactor.listenTCP(0, server.Site(SendfileResource(self.path)), interface='127.0.0.1')
+
+    @inlineCallbacks
+    def tearDown(self):
+        yield self.port.stopListening()
+        yield helpers.TestGL.tearDown(self)
+
+    def fetch(self, requests):
+        creator = protocol.ClientCreator(reactor, RawHTTPClient, requests)
+        d = creator.connectTCP('127.0.0.1', self.port.getHost().port)
+        return d.addCallback(lambda client: client.done)
+
+    @inlineCallbacks
+    def test_head_and_range(self):
+        size = len(self.content)
+
+        responses = yield self.fetch([(b'HEAD', b'/file', {}),
+                                      (b'GET', b'/file', {b'Range': b'bytes=1024-2097151'}),
+                                      (b'GET', b'/file', {})])
+
+        self.assertEqual(len(responses), 3)
+
+        # the response to the HEAD request carries no body and the following
+        # responses on the same connection are not corrupted
+        self.assertEqual(responses[0][0], b'HTTP/1.1 200 OK')
+        self.assertEqual(responses[0][1][b'content-length'], b'%d' % size)
+
+        self.assertEqual(responses[1][0], b'HTTP/1.1 206 Partial Content')
+        self.assertEqual(responses[1][1][b'content-range'], b'bytes 1024-2097151/%d' % size)
+        self.assertEqual(responses[1][2], self.content[1024:2097152])
+
+        self.assertEqual(responses[2][0], b'HTTP/1.1 200 OK')
+        self.assertEqual(responses[2][2], self.content)
+
+        # past the first slice, written through the transport together with
+        # the headers, the bodies of the GET requests are sent by means of os.sendfile
+        self.assertTrue(0 < sum(self.sent) <= 2097152 - 1024 + size - 2 * SendfileProducer.chunk_size)
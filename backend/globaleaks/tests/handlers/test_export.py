@@ -1,7 +1,11 @@
 # -*- coding: utf-8 -*-
+import threading
+from io import BytesIO
+from zipfile import ZipFile
 
 from globaleaks.handlers import export
 from globaleaks.jobs.delivery import Delivery
+from globaleaks.rest import errors
 from globaleaks.tests import helpers
 from twisted.internet.defer import inlineCallbacks
 
@@ -31,3 +35,93 @@ class TestExportHandler(helpers.TestHandlerWithPopulatedDB):
 
         yield handler.get(rtips_desc[0]['id'])
         self.assertNotEqual(handler.request.getResponseBody(), b'')
+
+        with ZipFile(BytesIO(handler.request.getResponseBody()), 'r') as f:
+            self.assertIsNone(f.testzip())
+            self.assertIn('data.txt', f.namelist())
+
+    @inlineCallbacks
+    def test_export_aborted(self):
+        handler = self.request({}, role='receiver')
+
+        aborted = threading.Event()
+        fed = threading.Event()
+
+        class SlowFile(BytesIO):
+            def read(self, size=-1):
+                aborted.wait(10)
+                return BytesIO.read(self, size)
+
+        feed = export.ZipStreamProducer.feed
+        resumeProducing = export.ZipStreamProducer.resumeProducing
+
+        def patched_feed(producer):
+            feed(producer)
+            fed.set()
+
+        def patched_resumeProducing(producer):
+            resumeProducing(producer)
+
+            # the client goes away after the first chunk of the archive
+            if handler.request.written:
+                producer.stopProducing()
+                aborted.set()
+
+        self.patch(export.ZipStreamProducer, 'bufferSize', 1)
+        self.patch(export.ZipStreamProducer, 'feed', patched_feed)
+        self.patch(export.ZipStreamProducer, 'resumeProducing', patched_resumeProducing)
+
+        yield handler.write_zip('submission.zip', [{'name': 'file.txt', 'fo': SlowFile(b'x' * 1024)}])
+
+        self.assertEqual(len(handler.request.written), 1)
+        self.assertTrue(handler.zip_stream.closed.is_set())
+
+        # the thread generating the archive terminates
+        self.assertTrue(fed.wait(10))
+
+
+class TestTipsExportHandler(helpers.TestHandlerWithPopulatedDB):
+    _handler = export.TipsExportHandler
+
+    @inlineCallbacks
+    def setUp(self):
+        yield helpers.TestHandlerWithPopulatedDB.setUp(self)
+
+        yield self.perform_full_submission_actions()
+
+        yield Delivery().run()
+
+    @inlineCallbacks
+    def test_post(self):
+        rtips_desc = yield self.get_rtips()
+
+        receiver_id = rtips_desc[0]['receiver_id']
+        rtips = [rtip for rtip in rtips_desc if rtip['receiver_id'] == receiver_id]
+        self.assertTrue(len(rtips) > 1)
+
+        body = {'rtips': [rtip['id'] for rtip in rtips] + [rtips[0]['id']]}
+
+        handler = self.request(body, role='receiver')
+        handler.current_user.user_id = receiver_id
+
+        yield handler.post()
+
+        with ZipFile(BytesIO(handler.request.getResponseBody()), 'r') as f:
+            self.assertIsNone(f.testzip())
+
+            for rtip in rtips:
+                self.assertIn('submission-%d/data.txt' % rtip['progressive'], f.namelist())
+
+    @inlineCallbacks
+    def test_post_unaccessible_tip(self):
+        rtips_desc = yield self.get_rtips()
+
+        receiver_id = rtips_desc[0]['receiver_id']
+        other_rtip = [rtip for rtip in rtips_desc if rtip['receiver_id'] != receiver_id][0]
+
+        handler = self.request({'rtips': [rtips_desc[0]['id'], other_rtip['id']]}, role='receiver')
+        handler.current_user.user_id = receiver_id
+
+        # the access to all the tips is checked before starting the archive
+        yield self.assertFailure(handler.post(), errors.ModelNotFound)
+        self.assertEqual(handler.request.written, [])
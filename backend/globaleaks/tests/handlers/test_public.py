@@ -1,9 +1,18 @@
 # -*- coding: utf-8 -*-
 import json
+import time
 
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from globaleaks import models
 from globaleaks.handlers import public
+from globaleaks.orm import transact
 from globaleaks.rest import requests
+from globaleaks.rest.apicache import ApiCache
 from globaleaks.tests import helpers
+from globaleaks.utils import structures
+from globaleaks.utils.structures import get_localized_values, load_localized
 from twisted.internet.defer import inlineCallbacks
 
 
@@ -16,3 +25,122 @@ class TestPublicResource(helpers.TestHandlerWithPopulatedDB):
         response = yield handler.get()
 
         self._handler.validate_message(json.dumps(response), requests.PublicResourcesDesc)
+
+
+@transact
+def add_translations(session, count):
+    for model in [models.Context, models.Field, models.FieldOption]:
+        for obj in session.query(model):
+            for key in model.localized_keys:
+                value = dict(getattr(obj, key))
+                value.update({u'l%d' % i: u'%s %d' % (key, i) * 20 for i in range(count)})
+                setattr(obj, key, value)
+
+
+@transact
+def add_field_options(session, count):
+    field = session.query(models.Field).first()
+
+    for i in range(count):
+        option = models.FieldOption()
+        option.field_id = field.id
+        option.presentation_order = i
+        option.label = {u'en': u'option %d' % i}
+        session.add(option)
+
+
+@transact
+def check_localized_values(session, test, language):
+    for model in [models.Context, models.Field, models.FieldOption]:
+        expected = {obj.id: get_localized_values({}, obj, model.localized_keys, language) for obj in session.query(model)}
+
+        session.expunge_all()
+
+        l10n = {}
+        load_localized(session.query(model), model, language, l10n)
+        test.assertEqual(l10n, expected)
+
+
+@transact
+def serialize_localized_columns(session, language, projected):
+    for model in [models.Context, models.Field, models.FieldOption]:
+        if projected:
+            load_localized(session.query(model), model, language, {})
+        else:
+            for obj in session.query(model):
+                get_localized_values({}, obj, model.localized_keys, language)
+
+
+@transact
+def serialize_steps(session, language):
+    for step in session.query(models.Step):
+        public.serialize_step(session, 1, step, language)
+
+
+class TestLocalizedSerialization(helpers.TestHandlerWithPopulatedDB):
+    _handler = public.PublicResource
+    complex_field_population = True
+
+    @inlineCallbacks
+    def test_projected_translations(self):
+        yield add_translations(20)
+
+        for language in [u'en', u'l7', u'it']:
+            yield check_localized_values(self, language)
+
+        handler = self.request()
+        response = yield handler.get()
+        self._handler.validate_message(json.dumps(response), requests.PublicResourcesDesc)
+
+    @inlineCallbacks
+    def test_fallback_without_json_extract(self):
+        yield add_translations(5)
+
+        handler = self.request()
+        expected = yield handler.get()
+
+        ApiCache.invalidate()
+        self.patch(structures, 'json_extract_supported', False)
+
+        for language in [u'en', u'l3', u'it']:
+            yield check_localized_values(self, language)
+
+        handler = self.request()
+        response = yield handler.get()
+        self.assertEqual(response, expected)
+
+    @inlineCallbacks
+    def test_localized_columns_are_not_lazy_loaded(self):
+        statements = []
+
+        def before_cursor_execute(conn, cursor, statement, *args):
+            statements.append(statement)
+
+        event.listen(Engine, 'before_cursor_execute', before_cursor_execute)
+        self.addCleanup(event.remove, Engine, 'before_cursor_execute', before_cursor_execute)
+
+        yield serialize_steps(u'en')
+
+        lazy_loads = tuple('SELECT %s.%s AS' % (model.__tablename__, key)
+                           for model in [models.Field, models.FieldOption]
+                           for key in model.localized_keys)
+
+        self.assertTrue(statements)
+        self.assertEqual([x for x in statements if x.startswith(lazy_loads)], [])
+
+    @helpers.benchmark
+    @inlineCallbacks
+    def test_serialization_benchmark(self):
+        yield add_field_options(500)
+
+        for count in [0, 10, 30]:
+            yield add_translations(count)
+
+            results = {}
+            for projected in [False, True]:
+                start = time.time()
+                for _ in range(10):
+                    yield serialize_localized_columns(u'en', projected)
+                results[projected] = time.time() - start
+
+            print("serialization with %d languages: decoding %.4fs, projection %.4fs" % (count + 1, results[False], results[True]))
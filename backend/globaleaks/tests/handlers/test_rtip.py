@@ -260,6 +260,30 @@ class TestReceiverFileDownload(helpers.TestHandlerWithPopulatedDB):
                 yield handler.get(rfile_desc['id'])
                 self.assertNotEqual(handler.request.getResponseBody(), '')
 
+    @inlineCallbacks
+    def test_get_range(self):
+        yield self.perform_minimal_submission()
+        yield Delivery().run()
+
+        rtip_desc = (yield self.get_rtips())[0]
+        rfile_desc = (yield self.get_rfiles(rtip_desc['id']))[0]
+
+        handler = self.request(role='receiver', user_id=rtip_desc['receiver_id'])
+        yield handler.get(rfile_desc['id'])
+        content = handler.request.getResponseBody()
+
+        for value, expected in [(b'bytes=0-9', content[0:10]),
+                                (b'bytes=10-', content[10:]),
+                                (b'bytes=-5', content[-5:])]:
+            handler = self.request(role='receiver', user_id=rtip_desc['receiver_id'], headers={'Range': value})
+            yield handler.get(rfile_desc['id'])
+            self.assertEqual(handler.request.responseCode, 206)
+            self.assertEqual(handler.request.getResponseBody(), expected)
+
+        handler = self.request(role='receiver', user_id=rtip_desc['receiver_id'],
+                               headers={'Range': b'bytes=%d-' % len(content)})
+        yield self.assertFailure(handler.get(rfile_desc['id']), errors.RangeNotSatisfiable)
+
 
 class TestIdentityAccessRequestsCollection(helpers.TestHandlerWithPopulatedDB):
     _handler = rtip.IdentityAccessRequestsCollection
@@ -19,7 +19,37 @@ class TestStaticFileHandler(helpers.TestHandler):
         yield handler.get('')
         self.assertTrue(text_type(handler.request.getResponseBody(), 'utf-8').startswith('<!doctype html>'))
 
+        # the files are subject to the platform-wide no-store cache policy
+        self.assertIsNone(handler.request.responseHeaders.getRawHeaders(b'cache-control'))
+
     def test_get_unexistent(self):
         handler = self.request(kwargs={'path': Settings.client_path})
 
         return self.assertRaises(errors.ResourceNotFound, handler.get, u'unexistent')
+
+    @inlineCallbacks
+    def test_get_conditional(self):
+        handler = self.request(kwargs={'path': Settings.client_path})
+        yield handler.get('')
+        body = handler.request.getResponseBody()
+        last_modified = handler.request.responseHeaders.getRawHeaders(b'last-modified')[0]
+        etag = handler.request.responseHeaders.getRawHeaders(b'etag')[0]
+
+        for headers in [{'If-None-Match': etag},
+                        {'If-Modified-Since': last_modified}]:
+            handler = self.request(kwargs={'path': Settings.client_path}, headers=headers)
+            yield handler.get('')
+            self.assertEqual(handler.request.responseCode, 304)
+            self.assertEqual(handler.request.written, [])
+
+        handler = self.request(kwargs={'path': Settings.client_path},
+                               headers={'Range': b'bytes=0-9', 'If-Range': etag})
+        yield handler.get('')
+        self.assertEqual(handler.request.responseCode, 206)
+        self.assertEqual(handler.request.getResponseBody(), body[:10])
+
+        handler = self.request(kwargs={'path': Settings.client_path},
+                               headers={'Range': b'bytes=0-9', 'If-Range': b'"outdated"'})
+        yield handler.get('')
+        self.assertNotEqual(handler.request.responseCode, 206)
+        self.assertEqual(handler.request.getResponseBody(), body)
@@ -96,7 +96,7 @@ class TestSubmissionTokenInteract(helpers.TestHandlerWithPopulatedDB):
         token = Token(1)
         self.submission_desc = yield self.get_dummy_submission(self.dummyContext['id'])
         handler = self.request(self.submission_desc)
-        yield self.assertRaises(errors.TokenFailure, handler.put, token.id)
+        yield self.assertFailure(handler.put(token.id), errors.TokenFailure)
 
     @inlineCallbacks
     def test_token_reuse_blocked(self):
@@ -108,7 +108,7 @@ class TestSubmissionTokenInteract(helpers.TestHandlerWithPopulatedDB):
         token.solve()
         yield handler.put(token.id)
 
-        yield self.assertRaises(errors.TokenFailure, handler.put, token.id)
+        yield self.assertFailure(handler.put(token.id), errors.TokenFailure)
 
 
 class TestSubmissionEncryptedScenarioOneKeyExpired(TestSubmissionEncryptedScenario):
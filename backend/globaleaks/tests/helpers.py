@@ -31,6 +31,7 @@ from twisted.internet.address import IPv4Address
 from twisted.internet.defer import inlineCallbacks, Deferred
 from twisted.internet.protocol import ProcessProtocol
 from twisted.python.failure import Failure
+from twisted.python.threadpool import ThreadPool
 from twisted.trial import unittest
 from twisted.web.test.requesthelper import DummyRequest
 
@@ -56,6 +57,7 @@ from globaleaks.settings import Settings
 from globaleaks.state import State
 from globaleaks.utils import security, tempdict, token, utility
 from globaleaks.utils.securetempfile import SecureTemporaryFile
+from globaleaks.utils.storage import get_attachment_path, get_sharded_path
 from globaleaks.utils.objectdict import ObjectDict
 from globaleaks.utils.utility import datetime_null, datetime_now, datetime_to_ISO8601, \
     sum_dicts
@@ -88,6 +90,16 @@ def deferred_sleep_mock(seconds):
 utility.deferred_sleep = deferred_sleep_mock
 
 
+def benchmark(f):
+    """
+    Decorator of the benchmarks, skipped unless GLOBALEAKS_BENCHMARK is set in the environment
+    """
+    if not os.environ.get('GLOBALEAKS_BENCHMARK'):
+        f.skip = 'benchmark: set GLOBALEAKS_BENCHMARK=1 to run it'
+
+    return f
+
+
 class UTlog:
     @staticmethod
     def mlog(flag):
@@ -134,6 +146,9 @@ def init_state():
         dir_util.remove_tree(Settings.working_path, 0)
 
     orm.set_thread_pool(FakeThreadPool())
+    State.secure_delete_tp = FakeThreadPool()
+    State.export_tp = ThreadPool(0, 8, 'export')
+    State.compress_tp = ThreadPool(0, 4, 'compress')
 
     State.settings.enable_api_cache = False
     State.tenant_cache[1] = ObjectDict()
@@ -154,6 +169,13 @@ def associate_users_of_first_tenant_to_second_tenant(session):
         session.add(user_tenant)
 
 
+def list_files(path):
+    """
+    Return the names of the files contained in a directory and in its subdirectories
+    """
+    return [f for _, _, filenames in os.walk(path) for f in filenames]
+
+
 def get_dummy_step():
     return {
         'id': '',
@@ -231,7 +253,7 @@ def get_dummy_file(filename=None, content_type=None, content=None):
     with temporary_file.open('w') as f:
         f.write(content)
 
-    State.TempUploadFiles[temporary_file.filepath] = temporary_file
+    State.TempUploadFiles.set(temporary_file.filepath, temporary_file)
 
     return {
         'date': datetime_now(),
@@ -354,6 +376,10 @@ class TestGL(unittest.TestCase):
 
         init_state()
 
+        for tp in [State.export_tp, State.compress_tp]:
+            tp.start()
+            self.addCleanup(tp.stop)
+
         self.setUp_dummy()
 
         if self.initialize_test_database_using_archived_db:
@@ -477,8 +503,8 @@ class TestGL(unittest.TestCase):
 
         self.dummyNode = dummyStuff.dummyNode
 
-        self.assertEqual(os.listdir(Settings.attachments_path), [])
-        self.assertEqual(os.listdir(Settings.tmp_path), [])
+        self.assertEqual(list_files(Settings.attachments_path), [])
+        self.assertEqual(list_files(Settings.tmp_path), [])
 
     def get_dummy_user(self, role, username):
         new_u = dict(MockDict().dummyUser)
@@ -724,11 +750,10 @@ class TestGLWithPopulatedDB(TestGL):
         for _ in range(self.population_of_attachments):
             dummyFile = self.get_dummy_file()
 
-            src = os.path.join(Settings.tmp_path,
-                               os.path.basename(dummyFile['filename']))
+            src = get_sharded_path(Settings.tmp_path,
+                                   os.path.basename(dummyFile['filename']))
 
-            dst = os.path.join(Settings.attachments_path,
-                               os.path.basename(dummyFile['filename']))
+            dst = get_attachment_path(os.path.basename(dummyFile['filename']), True)
 
             shutil.move(src, dst)
 
@@ -1,6 +1,4 @@
 # -*- coding: utf-8 -*-
-import os
-
 from globaleaks import models
 from globaleaks.jobs import daily, delivery
 from globaleaks.orm import transact
@@ -13,8 +11,8 @@ from twisted.internet.defer import inlineCallbacks
 class TestDaily(helpers.TestGLWithPopulatedDB):
     @transact
     def check0(self, session):
-        self.assertTrue(os.listdir(Settings.attachments_path) == [])
-        self.assertTrue(os.listdir(Settings.tmp_path) == [])
+        self.assertTrue(helpers.list_files(Settings.attachments_path) == [])
+        self.assertTrue(helpers.list_files(Settings.tmp_path) == [])
 
         self.db_test_model_count(session, models.InternalTip, 0)
         self.db_test_model_count(session, models.ReceiverTip, 0)
@@ -27,7 +25,7 @@ class TestDaily(helpers.TestGLWithPopulatedDB):
 
     @transact
     def check1(self, session):
-        self.assertTrue(os.listdir(Settings.attachments_path) != [])
+        self.assertTrue(helpers.list_files(Settings.attachments_path) != [])
 
         self.db_test_model_count(session, models.InternalTip, self.population_of_submissions)
         self.db_test_model_count(session, models.ReceiverTip, self.population_of_recipients * self.population_of_submissions)
@@ -40,9 +38,10 @@ class TestDaily(helpers.TestGLWithPopulatedDB):
 
     @transact
     def check2(self, session):
-        self.assertTrue(os.listdir(Settings.attachments_path) != [])
+        self.assertTrue(helpers.list_files(Settings.attachments_path) != [])
 
         self.db_test_model_count(session, models.InternalTip, self.population_of_submissions)
+        self.db_test_model_count(session, models.WhistleblowerTip, 0)
         self.db_test_model_count(session, models.ReceiverTip, self.population_of_recipients * self.population_of_submissions)
         self.db_test_model_count(session, models.InternalFile, self.population_of_attachments * self.population_of_submissions)
         self.db_test_model_count(session, models.ReceiverFile, self.population_of_attachments * self.population_of_submissions * self.population_of_recipients)
@@ -53,7 +52,7 @@ class TestDaily(helpers.TestGLWithPopulatedDB):
 
     @transact
     def check3(self, session):
-        self.assertTrue(os.listdir(Settings.attachments_path) != [])
+        self.assertTrue(helpers.list_files(Settings.attachments_path) != [])
 
         self.db_test_model_count(session, models.InternalTip, self.population_of_submissions)
         self.db_test_model_count(session, models.ReceiverTip, self.population_of_recipients * self.population_of_submissions)
@@ -66,8 +65,8 @@ class TestDaily(helpers.TestGLWithPopulatedDB):
 
     @transact
     def check4(self, session):
-        self.assertTrue(os.listdir(Settings.attachments_path) == [])
-        self.assertTrue(os.listdir(Settings.tmp_path) == [])
+        self.assertTrue(helpers.list_files(Settings.attachments_path) == [])
+        self.assertTrue(helpers.list_files(Settings.tmp_path) == [])
 
         self.db_test_model_count(session, models.InternalTip, 0)
         self.db_test_model_count(session, models.ReceiverTip, 0)
@@ -121,7 +120,15 @@ class TestDaily(helpers.TestGLWithPopulatedDB):
 
         yield self.force_itip_expiration()
 
-        yield daily.Daily().run()
+        # delete the expired tips one per transaction
+        job = daily.Daily()
+        job.expiration_batch_size = 1
+
+        yield job.run()
+
+        self.assertEqual(job.get_metrics()['expired_itips_deleted'], self.population_of_submissions)
+        self.assertEqual(job.get_metrics()['expired_itips_pending'], 0)
+        self.assertIn('db_check_for_expiring_submissions', job.get_metrics()['phases_timings'])
 
         # verify cascade deletion when tips expire
         yield self.check4()
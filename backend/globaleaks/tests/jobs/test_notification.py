@@ -3,8 +3,27 @@ from twisted.internet.defer import inlineCallbacks, succeed
 
 from globaleaks import models
 from globaleaks.jobs.delivery import Delivery
-from globaleaks.jobs.notification import Notification
+from globaleaks.jobs import notification
+from globaleaks.jobs.notification import MailGenerator, Notification
+from globaleaks.orm import transact
 from globaleaks.tests import helpers
+from globaleaks.utils.utility import datetime_null, datetime_now
+
+
+@transact
+def make_mails_due(session):
+    session.query(models.Mail).update({'next_attempt_at': datetime_null()})
+
+
+@transact
+def set_processing_attempts(session):
+    for i, mail in enumerate(session.query(models.Mail).order_by(models.Mail.creation_date)):
+        mail.processing_attempts = 2 * (i % 2)
+
+
+@transact
+def get_leases(session):
+    return [(mail.processing_attempts, mail.next_attempt_at) for mail in session.query(models.Mail)]
 
 
 class TestNotification(helpers.TestGLWithPopulatedDB):
@@ -34,16 +53,111 @@ class TestNotification(helpers.TestGLWithPopulatedDB):
         notification = Notification()
         notification.skip_sleep = True
 
-        def sendmail_failure(_):
+        attempts = []
+
+        def sendmails_failure(tid, mails):
             # simulate the failure just returning with no action
+            attempts.append(len(mails))
             return succeed(None)
 
-        notification.sendmail = sendmail_failure
+        notification.sendmails = sendmails_failure
 
-        for _ in range(10):
+        yield notification.run()
+        yield self.test_model_count(models.Mail, 24)
+        self.assertEqual(sum(attempts), 24)
+        self.assertEqual(notification.get_metrics()['queue_depth'], 24)
+
+        # the failed mails are not retried before their backoff expires
+        yield notification.run()
+        self.assertEqual(sum(attempts), 24)
+
+        for _ in range(Notification.max_attempts - 1):
+            yield make_mails_due()
             yield notification.run()
             yield self.test_model_count(models.Mail, 24)
 
+        self.assertEqual(sum(attempts), 24 * Notification.max_attempts)
+
+        yield make_mails_due()
+        yield notification.run()
+
+        yield self.test_model_count(models.Mail, 0)
+
+    @inlineCallbacks
+    def test_notification_lease_batch(self):
+        yield Delivery().run()
+
+        notification = Notification()
+        notification.skip_sleep = True
+        notification.mails_per_run = 10
+
+        yield notification.run()
+        yield self.test_model_count(models.Mail, 14)
+        self.assertEqual(notification.get_metrics()['queue_depth'], 24)
+
+        yield notification.run()
+        yield notification.run()
+        yield self.test_model_count(models.Mail, 0)
+
+    @inlineCallbacks
+    def test_notification_lease_backoff(self):
+        yield Delivery().run()
+        yield MailGenerator(self.state).generate()
+        yield set_processing_attempts()
+
+        now = datetime_now()
+        ret = yield notification.get_mails_from_the_pool(100)
+        self.assertEqual(len(ret['mails']), 24)
+
+        leases = yield get_leases()
+        self.assertEqual(sorted(set(attempts for attempts, _ in leases)), [1, 3])
+
+        # each mail is leased up to the backoff of its own number of attempts
+        for attempts, next_attempt_at in leases:
+            delay = (next_attempt_at - now).total_seconds()
+            max_delay = Notification.retry_base_delay * 2 ** (attempts - 1)
+            self.assertTrue(max_delay * 0.5 - 1 <= delay <= max_delay + 1)
+
+    @inlineCallbacks
+    def test_notification_spool_by_tenant_sessions(self):
+        yield Delivery().run()
+
+        notification = Notification()
+        notification.skip_sleep = True
+        notification.mails_per_session = 5
+
+        sessions = []
+        sendmails = notification.sendmails
+
+        def sendmails_mock(tid, mails):
+            sessions.append((tid, len(mails)))
+            return sendmails(tid, mails)
+
+        notification.sendmails = sendmails_mock
+
         yield notification.run()
 
-        yield self.test_model_count(models.Mail, 0)
\ No newline at end of file
+        self.assertEqual(sum(n for _, n in sessions), 24)
+        self.assertTrue(all(n <= 5 for _, n in sessions))
+
+        yield self.test_model_count(models.Mail, 0)
+
+    @inlineCallbacks
+    def test_generate_serializes_each_tip_once_per_language(self):
+        yield Delivery().run()
+
+        serialized = []
+        serialize_usertip = notification.serialize_usertip
+
+        def serialize_usertip_mock(session, usertip, itip, language):
+            serialized.append((itip.id, language, usertip.can_access_whistleblower_identity))
+            return serialize_usertip(session, usertip, itip, language)
+
+        self.patch(notification, 'serialize_usertip', serialize_usertip_mock)
+
+        yield MailGenerator(self.state).generate()
+
+        self.assertTrue(serialized)
+        self.assertEqual(len(serialized), len(set(serialized)))
+
+        yield self.test_model_count(models.Mail, 24)
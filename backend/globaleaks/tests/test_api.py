@@ -1,8 +1,12 @@
 # -*- coding: utf-8 -*-
+from datetime import timedelta
+
 from twisted.internet.address import IPv4Address
 from twisted.internet.defer import inlineCallbacks
 
+from globaleaks import event
 from globaleaks.db import refresh_memory_variables
+from globaleaks.handlers import authentication, public
 from globaleaks.handlers.admin.node import update_enabled_languages
 from globaleaks.state import State
 from globaleaks.tests.helpers import TestGL, forge_request
@@ -164,3 +168,19 @@ class TestAPI(TestGL):
         self.assertEqual(request.responseCode, 301)
         location = request.responseHeaders.getRawHeaders(b'location')[0]
         self.assertEqual(b'https://www.globaleaks.org/public', location)
+
+    def test_events_tracking(self):
+        def track(handler_cls, method, code):
+            handler = handler_cls(State, forge_request(method=method))
+            handler.request.code = code
+            handler.request.execution_time = timedelta(seconds=1)
+            event.track_handler(handler)
+
+        track(authentication.AuthenticationHandler, b'POST', 401)
+        track(authentication.AuthenticationHandler, b'POST', 200)
+        track(authentication.AuthenticationHandler, b'POST', 200)
+        track(authentication.AuthenticationHandler, b'GET', 401)
+        track(public.PublicResource, b'GET', 200)
+
+        self.assertEqual(State.tenant_state[1].EventQ.counts(),
+                         {'failed_logins': 1, 'successful_logins': 2})
@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+from globaleaks.sessions import SessionsFactory
+from globaleaks.tests import helpers
+
+
+class TestSessions(helpers.TestGL):
+    def test_revoke(self):
+        sessions = SessionsFactory(timeout=60)
+
+        first = sessions.new(1, 'a', 'receiver', False)
+        second = sessions.new(1, 'b', 'receiver', False)
+
+        # a new login revokes the previous sessions of the user
+        third = sessions.new(1, 'a', 'receiver', False)
+        self.assertEqual(set(sessions), {second.id, third.id})
+        self.assertEqual(sessions.lookup('user_id', 'a'), [third.id])
+        self.assertEqual(sessions.lookup('user_id', 'b'), [second.id])
+
+        sessions.revoke('b')
+        self.assertEqual(set(sessions), {third.id})
+        self.assertEqual(sessions.lookup('tid', 1), [third.id])
+
+        self.assertEqual(sessions.get(first.id), None)
+
+    def test_regenerate(self):
+        sessions = SessionsFactory(timeout=60)
+
+        session_id = sessions.new(1, 'a', 'receiver', False).id
+        session = sessions.regenerate(session_id)
+
+        self.assertNotEqual(session.id, session_id)
+        self.assertEqual(sessions.lookup('user_id', 'a'), [session.id])
+
+    def test_revoke_tenant(self):
+        sessions = SessionsFactory(timeout=60)
+
+        sessions.new(1, 'a', 'admin', False)
+        sessions.new(2, 'b', 'receiver', False)
+        session = sessions.new(3, 'c', 'receiver', False)
+
+        sessions.revoke_tenant(2)
+        sessions.revoke_tenant(1)
+
+        self.assertEqual(list(sessions), [session.id])
+        self.assertEqual(sessions.lookup('user_id', 'a'), [])
+
+    def test_expiration(self):
+        sessions = SessionsFactory(timeout=60)
+
+        sessions.new(1, 'a', 'admin', False)
+        sessions.new(1, 'b', 'receiver', False)
+
+        self.test_reactor.advance(60)
+
+        self.assertEqual(len(sessions), 0)
+        self.assertEqual(sessions.lookup('user_id', 'a'), [])
+        self.assertEqual(sessions.lookup('tid', 1), [])
@@ -0,0 +1,36 @@
+from datetime import datetime, timedelta
+
+from globaleaks import event
+from globaleaks.tests import helpers
+from globaleaks.utils.eventqueue import EventQueue
+
+
+class TestEventQueue(helpers.TestGL):
+    def test_counts_and_capacity(self):
+        q = EventQueue(capacity=10)
+
+        for x in range(25):
+            e = event.Event(event.events_monitored[0], timedelta(seconds=x))
+            e.creation_date = datetime(2018, 1, 1) + timedelta(seconds=x)
+            q.append(e)
+
+        e = event.Event(event.events_monitored[1], timedelta(seconds=0.5))
+        q.append(e)
+
+        self.assertEqual(q.counts(), {'failed_logins': 25, 'successful_logins': 1})
+        self.assertEqual(len(q), 26)
+
+        # only the most recent events are retained for the details
+        details = q.serialize()
+        self.assertEqual(len(details), 11)
+        self.assertEqual(details[0], {'event': 'failed_logins',
+                                      'creation_date': '2018-01-01T00:00:15',
+                                      'duration': 15.0})
+        self.assertEqual(details[9]['creation_date'], '2018-01-01T00:00:24')
+        self.assertEqual(details[10]['event'], 'successful_logins')
+
+        self.assertEqual(len(q.rings['failed_logins'].timestamps), 10)
+
+        q.clear()
+        self.assertEqual(q.counts(), {})
+        self.assertEqual(q.serialize(), [])
@@ -0,0 +1,86 @@
+# -*- coding: utf-8
+import os
+import time
+
+from twisted.internet.defer import inlineCallbacks
+
+from globaleaks.settings import Settings
+from globaleaks.tests import helpers
+from globaleaks.utils.inventory import FileInventory
+
+
+class TestFileInventory(helpers.TestGL):
+    def create_file(self, name, mtime=None):
+        path = os.path.join(self.path, name)
+        with open(path, 'w') as f:
+            f.write(name)
+
+        if mtime is not None:
+            os.utime(path, (mtime, mtime))
+
+    @inlineCallbacks
+    def setUp(self):
+        yield helpers.TestGL.setUp(self)
+
+        self.path = os.path.join(Settings.tmp_path, 'inventory')
+        os.mkdir(self.path)
+
+    def test_scan(self):
+        inventory = FileInventory(self.path)
+
+        self.create_file('a')
+        self.create_file('b')
+        os.mkdir(os.path.join(self.path, 'c'))
+
+        self.assertEqual(inventory.scan(), {'a', 'b'})
+        self.assertEqual(inventory.names(), {'a', 'b'})
+        self.assertEqual(inventory.untracked({'a'}), {'b'})
+
+        self.create_file('d')
+        os.remove(os.path.join(self.path, 'a'))
+
+        self.assertEqual(inventory.scan(), {'d'})
+        self.assertEqual(inventory.names(), {'b', 'd'})
+
+    def test_scan_unmodified_directory(self):
+        inventory = FileInventory(self.path)
+
+        self.create_file('a')
+
+        # make the directory older than the timestamp granularity
+        mtime = time.time() - 10
+        os.utime(self.path, (mtime, mtime))
+
+        self.assertEqual(inventory.scan(), {'a'})
+
+        inventory.discard('a')
+        self.assertEqual(inventory.scan(), set())
+        self.assertEqual(inventory.names(), set())
+
+        self.assertEqual(inventory.scan(incremental=False), {'a'})
+
+    def test_older_than(self):
+        inventory = FileInventory(self.path)
+
+        self.create_file('a', time.time() - 3600)
+        self.create_file('b')
+
+        inventory.scan()
+
+        self.assertEqual(inventory.older_than(time.time() - 60), {'a'})
+
+    def test_scan_subdirectories(self):
+        inventory = FileInventory(self.path)
+
+        os.mkdir(os.path.join(self.path, 'x'))
+        self.create_file('a')
+        self.create_file(os.path.join('x', 'b'))
+
+        self.assertEqual(inventory.scan(), {'a', 'b'})
+        self.assertEqual(inventory.get_path('b'), os.path.join(self.path, 'x', 'b'))
+
+        os.remove(os.path.join(self.path, 'x', 'b'))
+        os.rmdir(os.path.join(self.path, 'x'))
+
+        self.assertEqual(inventory.scan(), set())
+        self.assertEqual(inventory.names(), {'a'})
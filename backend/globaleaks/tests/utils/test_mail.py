@@ -0,0 +1,108 @@
+# -*- coding: utf-8
+from twisted.internet import defer, protocol, reactor, task
+from twisted.internet.defer import inlineCallbacks
+from twisted.mail import smtp
+from zope.interface import implementer
+
+from globaleaks.tests import helpers
+from globaleaks.utils.mail import sendmails
+
+
+@implementer(smtp.IMessage)
+class FakeMessage(object):
+    def __init__(self, messages, recipient):
+        self.messages = messages
+        self.recipient = recipient
+        self.lines = []
+
+    def lineReceived(self, line):
+        self.lines.append(line)
+
+    def eomReceived(self):
+        self.messages.append((self.recipient, b'\n'.join(self.lines)))
+        return defer.succeed(None)
+
+    def connectionLost(self):
+        pass
+
+
+@implementer(smtp.IMessageDelivery)
+class FakeDelivery(object):
+    def __init__(self, messages):
+        self.messages = messages
+
+    def receivedHeader(self, helo, origin, recipients):
+        return b'Received: by the fake server'
+
+    def validateFrom(self, helo, origin):
+        return origin
+
+    def validateTo(self, user):
+        if user.dest.local == b'rejected':
+            raise smtp.SMTPBadRcpt(user)
+
+        return lambda: FakeMessage(self.messages, str(user.dest))
+
+
+class FakeESMTP(smtp.ESMTP):
+    def connectionLost(self, reason):
+        smtp.ESMTP.connectionLost(self, reason)
+        self.factory.disconnected.callback(None)
+
+
+class FakeSMTPServerFactory(protocol.ServerFactory):
+    def __init__(self):
+        self.connections = 0
+        self.messages = []
+        self.disconnected = defer.Deferred()
+
+    def buildProtocol(self, addr):
+        self.connections += 1
+
+        p = FakeESMTP()
+        p.delivery = FakeDelivery(self.messages)
+        p.factory = self
+
+        return p
+
+
+class TestSendmails(helpers.TestGL):
+    @inlineCallbacks
+    def setUp(self):
+        yield helpers.TestGL.setUp(self)
+
+        self.server = FakeSMTPServerFactory()
+        self.port = reactor.listenTCP(0, self.server, interface='127.0.0.1')
+
+    @inlineCallbacks
+    def tearDown(self):
+        yield self.port.stopListening()
+        yield helpers.TestGL.tearDown(self)
+
+    def sendmails(self, addresses):
+        mails = [{'address': address,
+                  'subject': u'subject %d' % i,
+                  'body': u'body %d' % i} for i, address in enumerate(addresses)]
+
+        return sendmails(1, u'127.0.0.1', self.port.getHost().port, 'PLAIN', False, u'', u'',
+                         u'GlobaLeaks', u'globaleaks@example.com', mails, anonymize=False)
+
+    @inlineCallbacks
+    def test_sendmails(self):
+        results = yield self.sendmails([u'a@example.com',
+                                        u'rejected@example.com',
+                                        u'b@example.com'])
+
+        # the client quits the session once all the messages are sent
+        yield self.server.disconnected
+        yield task.deferLater(reactor, 0, lambda: None)
+
+        # the rejection of a recipient does not abort the delivery of the other messages
+        self.assertEqual(results, [True, False, True])
+
+        # the messages are delivered over a single connection
+        self.assertEqual(self.server.connections, 1)
+
+        self.assertEqual([recipient for recipient, _ in self.server.messages], ['a@example.com', 'b@example.com'])
+        self.assertIn(b'subject_0', self.server.messages[0][1])
+        self.assertIn(b'subject_2', self.server.messages[1][1])
@@ -1,9 +1,12 @@
 # -*- coding: utf-8
+import os
+
 from six import text_type
+from six.moves import cPickle as pickle
 
 from globaleaks.settings import Settings
 from globaleaks.tests import helpers
-from globaleaks.utils.securetempfile import SecureTemporaryFile
+from globaleaks.utils.securetempfile import SecureTemporaryFile, SecureTemporaryUploadFile, TempUploadFilesClass
 
 
 class TestSecureTemporaryFiles(helpers.TestGL):
@@ -18,3 +21,79 @@ class TestSecureTemporaryFiles(helpers.TestGL):
         with a.open('r') as f:
             for x in range(1000):
                 self.assertTrue(antani == text_type(f.read(10), 'utf-8'))
+
+    def test_temporary_file_write_at(self):
+        a = SecureTemporaryFile(Settings.tmp_path)
+        antani = b"0123456789" * 100
+
+        with a.open('w') as f:
+            for offset in [900, 7, 0, 333, 500]:
+                f.write_at(offset, antani[offset:offset + 100])
+
+            f.write_at(433, antani[433:500])
+            f.write_at(107, antani[107:333])
+            f.write_at(600, antani[600:900])
+
+        with a.open('r') as f:
+            self.assertEqual(f.read(), antani)
+
+    def test_temporary_file_pickle(self):
+        a = SecureTemporaryFile(Settings.tmp_path)
+        antani = b"0123456789" * 100
+
+        with a.open('w') as f:
+            f.write(antani)
+            f.finalize_write()
+
+        b = pickle.loads(pickle.dumps(a, 2))
+
+        # the serialization does not change the persistence of the file
+        self.assertFalse(a.persistent)
+        self.assertFalse(b.persistent)
+
+        with b.open('r'):
+            self.assertEqual(b.read(), antani)
+
+    def test_temporary_file_shared_store(self):
+        uploads = TempUploadFilesClass(timeout=10)
+        uploads.set_store_url('sqlite://' + os.path.join(Settings.tmp_path, 'store.db'), helpers.FakeThreadPool())
+
+        a = SecureTemporaryFile(Settings.tmp_path)
+        with a.open('w') as f:
+            f.write(b"0123456789")
+            f.finalize_write()
+
+        filepath = a.filepath
+        uploads.set(a.filename, a)
+
+        # the stored file outlives the objects until it is owned again
+        del a
+        self.assertTrue(os.path.exists(filepath))
+
+        b = uploads.pop(os.path.basename(filepath))
+        b.persistent = False
+        del b
+        self.assertFalse(os.path.exists(filepath))
+
+
+class TestSecureTemporaryUploadFiles(helpers.TestGL):
+    def test_upload_file_out_of_order(self):
+        a = SecureTemporaryUploadFile(Settings.tmp_path, 25, 3, 10)
+        antani = b"0123456789" * 2 + b"01234"
+
+        self.assertFalse(a.valid_chunk(0, 10))
+        self.assertFalse(a.valid_chunk(1, 9))
+        self.assertFalse(a.valid_chunk(3, 10))
+        self.assertFalse(a.valid_chunk(4, 5))
+
+        with a.open('w') as f:
+            for chunk_number in [3, 1, 2]:
+                self.assertFalse(f.completed)
+                self.assertTrue(f.valid_chunk(chunk_number, len(antani[(chunk_number - 1) * 10:chunk_number * 10])))
+                f.write_chunk(chunk_number, antani[(chunk_number - 1) * 10:chunk_number * 10])
+                self.assertTrue(f.has_chunk(chunk_number))
+
+        self.assertTrue(a.completed)
+
+        with a.open('r') as f:
+            self.assertEqual(f.read(), antani)
@@ -1,15 +1,59 @@
 # -*- coding: utf-8
 import os
+import re
+import string
+import timeit
+from random import SystemRandom
 
 from twisted.trial import unittest
 
 from globaleaks.rest import errors
-from globaleaks.utils.security import generateRandomSalt, hash_password, check_password, directory_traversal_check
+from globaleaks.utils.security import generateRandomKey, generateRandomReceipt, generateRandomSalt, \
+    hash_password, RandomStringGenerator, check_password, directory_traversal_check, \
+    overwrite_and_remove, overwrite_chunk_size, _get_data_extents, _overwrite
 from globaleaks.settings import Settings
 from globaleaks.tests import helpers
 
 dummy_salt = generateRandomSalt()
 
+class TestRandomKeys(unittest.TestCase):
+    def test_generate_random_key(self):
+        for N in [1, 16, 42]:
+            self.assertTrue(re.match('^[a-zA-Z0-9]{%d}$' % N, generateRandomKey(N)))
+
+        self.assertEqual(len(set(generateRandomKey(42) for _ in range(100))), 100)
+
+    def test_generate_random_receipt(self):
+        self.assertTrue(re.match('^[0-9]{16}$', generateRandomReceipt()))
+
+    def test_random_string_generator(self):
+        generator = RandomStringGenerator('ab', block_size=7)
+
+        ret = generator.generate(1000)
+
+        self.assertEqual(len(ret), 1000)
+        self.assertEqual(set(ret), {'a', 'b'})
+        self.assertTrue(len(generator.buffer) < 7)
+
+        # with an alphabet of 62 characters the bytes from 248 are rejected
+        generator = RandomStringGenerator(string.ascii_letters + string.digits)
+        generator.buffer = bytearray([248, 255, 0, 61, 10])
+        self.assertEqual(generator.generate(2), 'a9')
+        self.assertEqual(generator.buffer, bytearray([10]))
+
+    @helpers.benchmark
+    def test_random_key_benchmark(self):
+        alphabet = string.ascii_letters + string.digits
+
+        def system_random_key():
+            return ''.join(SystemRandom().choice(alphabet) for _ in range(42))
+
+        reference = min(timeit.repeat(system_random_key, number=1000, repeat=3))
+        batched = min(timeit.repeat(lambda: generateRandomKey(42), number=1000, repeat=3))
+
+        print("generation of 1000 keys of 42 characters: SystemRandom %.4fs, batched %.4fs" % (reference, batched))
+
+
 class TestPasswordManagement(unittest.TestCase):
     def test_pass_hash(self):
         dummy_password = "focaccina"
@@ -48,4 +92,87 @@ class TestFilesystemAccess(helpers.TestGL):
 
     def test_directory_traversal_check_allowed(self):
         valid_access = os.path.join(Settings.files_path, "valid.txt")
-        directory_traversal_check(Settings.files_path, valid_access)
\ No newline at end of file
+        directory_traversal_check(Settings.files_path, valid_access)
+
+    def test_overwrite_and_remove(self):
+        path = os.path.join(Settings.tmp_path, 'overwrite_and_remove.txt')
+        size = 3 * overwrite_chunk_size + 1
+
+        with open(path, 'wb') as f:
+            f.write(os.urandom(size))
+
+        self.assertEqual(overwrite_and_remove(path, 2), 4 * size)
+        self.assertFalse(os.path.exists(path))
+
+        self.assertEqual(overwrite_and_remove(path), 0)
+
+    def overwrite(self, path, size):
+        """
+        Overwrite the file with a pass of zeros and a pass of random data
+
+        :return: the extents of the file and its content after each pass
+        """
+        contents = []
+
+        fd = os.open(path, os.O_WRONLY)
+        try:
+            extents = _get_data_extents(fd, size)
+            count = sum(end - start for start, end in extents)
+
+            for random_data in (False, True):
+                self.assertEqual(_overwrite(fd, extents, random_data), count)
+
+                with open(path, 'rb') as f:
+                    contents.append(f.read())
+        finally:
+            os.close(fd)
+
+        return extents, contents
+
+    def test_overwrite(self):
+        path = os.path.join(Settings.tmp_path, 'overwrite.txt')
+        size = 3 * overwrite_chunk_size + 4096
+
+        with open(path, 'wb') as f:
+            f.write(b'A' * size)
+
+        extents, (zeros, random_data) = self.overwrite(path, size)
+
+        self.assertEqual(extents, [(0, size)])
+        self.assertEqual(zeros, b'\0' * size)
+
+        self.assertEqual(len(random_data), size)
+        for i in range(0, size, overwrite_chunk_size):
+            chunk = random_data[i:i + overwrite_chunk_size]
+            self.assertNotEqual(chunk, b'\0' * len(chunk))
+            self.assertNotEqual(chunk, b'A' * len(chunk))
+
+    def test_overwrite_sparse_file(self):
+        path = os.path.join(Settings.tmp_path, 'overwrite_sparse.txt')
+        size = 4 * overwrite_chunk_size
+        block = b'A' * 4096
+
+        with open(path, 'wb') as f:
+            f.write(block)
+            f.seek(size - len(block))
+            f.write(block)
+
+        extents, (zeros, random_data) = self.overwrite(path, size)
+
+        # the blocks of data are covered while the holes, where the filesystem reports them, are skipped
+        self.assertEqual(extents[0][0], 0)
+        self.assertEqual(extents[-1][1], size)
+        self.assertEqual(extents, sorted(extents))
+
+        self.assertEqual(zeros, b'\0' * size)
+
+        self.assertEqual(len(random_data), size)
+        for data in (random_data[:len(block)], random_data[-len(block):]):
+            self.assertNotEqual(data, b'\0' * len(block))
+            self.assertNotEqual(data, block)
+
+        # the holes still read as zeros
+        offset = 0
+        for start, end in extents:
+            self.assertEqual(random_data[offset:start], b'\0' * (start - offset))
+            offset = end
@@ -0,0 +1,146 @@
+# -*- coding: utf-8
+import os
+import sqlite3
+
+from twisted.internet.defer import inlineCallbacks
+
+from globaleaks.rest import errors
+from globaleaks.settings import Settings
+from globaleaks.tests import helpers
+from globaleaks.utils.store import get_filesystem_type, get_store, MemoryStore, SQLiteStore
+
+
+class Item(object):
+    def __init__(self, owner):
+        self.owner = owner
+        self.values = []
+
+
+class TestStore(helpers.TestGL):
+    def get_store(self):
+        return MemoryStore(timeout=10, indexes=('owner',))
+
+    def test_store(self):
+        store = self.get_store()
+
+        store.set('a', Item('x'))
+        store.set('b', Item('x'))
+        store.set('c', Item('y'))
+
+        self.assertEqual(len(store), 3)
+        self.assertEqual(sorted(store.lookup('owner', 'x')), ['a', 'b'])
+
+        self.assertEqual(store.get('a').owner, 'x')
+        self.assertEqual(store.get('d'), None)
+
+        self.assertEqual(store.pop('b').owner, 'x')
+        self.assertEqual(store.pop('b', None), None)
+        self.assertEqual(store.lookup('owner', 'x'), ['a'])
+
+        store.delete('c')
+        self.assertFalse('c' in store)
+        self.assertEqual(list(store), ['a'])
+
+    def test_update(self):
+        store = self.get_store()
+
+        store.set('a', Item('x'))
+
+        self.assertEqual(store.update('a', lambda item: item.values.append(1)).values, [1])
+        self.assertEqual(store.update('b', lambda item: item.values.append(1)), None)
+
+        item = store.get('a')
+        item.values.append(2)
+        store.save('a', item)
+
+        self.assertEqual(store.get('a').values, [1, 2])
+
+        self.assertEqual(store.setdefault('a', Item('y')).owner, 'x')
+        self.assertEqual(store.setdefault('b', Item('y')).owner, 'y')
+
+    def test_expiration(self):
+        expired = []
+
+        store = self.get_store()
+        store.expireCallback = lambda item: expired.append(item.owner)
+
+        store.set('a', Item('x'))
+        store.set('b', Item('y'))
+
+        self.test_reactor.advance(5)
+        store.get('a')
+
+        self.test_reactor.advance(5)
+        self.assertEqual(expired, ['y'])
+        self.assertEqual(list(store), ['a'])
+
+        self.test_reactor.advance(5)
+        self.assertEqual(expired, ['y', 'x'])
+        self.assertEqual(len(store), 0)
+
+    @inlineCallbacks
+    def test_run(self):
+        store = self.get_store()
+
+        store.set('a', Item('x'))
+
+        item = yield store.run(store.get, 'a')
+        self.assertEqual(item.owner, 'x')
+
+
+class TestSQLiteStore(TestStore):
+    def get_store(self):
+        return get_store('sqlite://' + os.path.join(Settings.tmp_path, 'store.db'), 'items', 10, ('owner',),
+                         helpers.FakeThreadPool())
+
+    def test_shared_store(self):
+        store1 = self.get_store()
+        store2 = self.get_store()
+
+        self.assertTrue(isinstance(store1, SQLiteStore))
+
+        store1.set('a', Item('x'))
+
+        self.assertEqual(store2.get('a').owner, 'x')
+        store2.update('a', lambda item: item.values.append(1))
+        self.assertEqual(store1.get('a').values, [1])
+
+        expired = []
+        store1.expireCallback = store2.expireCallback = lambda item: expired.append(item.owner)
+
+        self.test_reactor.advance(10)
+
+        # the item is expired only once
+        self.assertEqual(expired, ['x'])
+        self.assertEqual(len(store2), 0)
+
+    def test_locked_store(self):
+        self.patch(SQLiteStore, 'busy_timeout', 0.1)
+
+        store = self.get_store()
+
+        # a lock held by another process for longer than the busy timeout makes the store fail
+        db = sqlite3.connect(store.path, isolation_level=None)
+        db.execute('BEGIN IMMEDIATE')
+
+        self.assertRaises(errors.ServiceOverloaded, store.set, 'a', Item('x'))
+        self.assertRaises(errors.ServiceOverloaded, store.setdefault, 'a', Item('x'))
+
+        db.execute('ROLLBACK')
+        db.close()
+
+        store.set('a', Item('x'))
+        self.assertEqual(store.get('a').owner, 'x')
+
+    def test_get_filesystem_type(self):
+        mounts = os.path.join(Settings.tmp_path, 'mounts')
+        with open(mounts, 'w') as f:
+            f.write('/dev/sda1 / ext4 rw 0 0\n'
+                    'tmpfs /dev/shm tmpfs rw 0 0\n'
+                    'tmpfs /run tmpfs rw 0 0\n')
+
+        self.assertEqual(get_filesystem_type('/dev/shm/store.db', mounts), 'tmpfs')
+        self.assertEqual(get_filesystem_type('/dev/shm', mounts), 'tmpfs')
+        self.assertEqual(get_filesystem_type('/dev/shmem', mounts), 'ext4')
+        self.assertEqual(get_filesystem_type('/var/globaleaks', mounts), 'ext4')
+        self.assertEqual(get_filesystem_type('/var/globaleaks', mounts + '.missing'), None)
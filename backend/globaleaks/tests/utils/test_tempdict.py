@@ -53,3 +53,22 @@ class TestTempDict(helpers.TestGL):
                 self.assertEqual(len(xxx), size_limit)
                 self.assertEqual(xxx.get(x - size_limit + 1).id, x - size_limit + 1)
                 self.assertEqual(xxx.get(x - size_limit), None)
+
+    def test_get_extends_expiration(self):
+        xxx = TempDict(timeout=10)
+
+        for x in range(1, 101):
+            xxx.set(x, TestObject(x))
+
+        # a single delayed call is scheduled for all the items
+        self.assertEqual(len(self.test_reactor.getDelayedCalls()), 1)
+
+        self.test_reactor.advance(9)
+        self.assertEqual(xxx.get(1).id, 1)
+
+        self.test_reactor.advance(1)
+        self.assertEqual(len(xxx), 1)
+        self.assertEqual(xxx.get(2), None)
+
+        self.test_reactor.advance(9)
+        self.assertEqual(len(xxx), 0)
@@ -3,7 +3,7 @@ from twisted.internet.defer import inlineCallbacks
 from globaleaks.handlers import admin, rtip
 from globaleaks.jobs.delivery import Delivery
 from globaleaks.tests import helpers
-from globaleaks.utils.templating import Templating, supported_template_types
+from globaleaks.utils.templating import Templating, UserCredentials, supported_template_types
 
 
 class notifTemplateTest(helpers.TestGLWithPopulatedDB):
@@ -39,3 +39,27 @@ class notifTemplateTest(helpers.TestGLWithPopulatedDB):
             data['type'] = key
             template = ''.join(supported_template_types[key].keyword_list)
             Templating().format_template(template, data)
+
+    def test_keywords_are_evaluated_once(self):
+        calls = []
+
+        class CountingKeyword(UserCredentials):
+            def Role(self):
+                calls.append('Role')
+                return '{Username}'
+
+        data = {
+            'type': 'counting',
+            'role': 'admin',
+            'username': 'user',
+            'password': 'password'
+        }
+
+        supported_template_types['counting'] = CountingKeyword
+        try:
+            text = Templating().format_template('{Role} {Role}\n{Blank}\n{Password} {Unknown}\n', data)
+        finally:
+            del supported_template_types['counting']
+
+        self.assertEqual(text, 'user user\npassword {Unknown}')
+        self.assertEqual(calls, ['Role'])
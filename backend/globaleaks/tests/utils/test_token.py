@@ -4,7 +4,9 @@ import os
 from globaleaks.jobs import anomalies
 from globaleaks.rest import errors
 from globaleaks.tests import helpers
-from globaleaks.utils.token import Token, TokenList
+from globaleaks.utils.storage import get_sharded_path
+from globaleaks.utils.security import sha256
+from globaleaks.utils.token import Token, TokenList, POW_DIFFICULTY
 from twisted.internet.defer import inlineCallbacks
 
 
@@ -50,7 +52,7 @@ class TestToken(helpers.TestGL):
             self.emulate_file_upload(token, 3)
 
             for f in token.uploaded_files:
-                filepath = os.path.abspath(os.path.join(self.state.settings.tmp_path, f['filename']))
+                filepath = get_sharded_path(self.state.settings.tmp_path, f['filename'])
                 self.assertTrue(os.path.exists(filepath))
                 file_list.append(filepath)
 
@@ -125,6 +127,39 @@ class TestToken(helpers.TestGL):
         self.assertTrue(token.update({'proof_of_work_answer': 26}))
         token.use()
 
+    def solve_proof_of_work(self, question, difficulty, weaker=False):
+        answer = 0
+        while True:
+            x = sha256(("%s%d" % (question, answer)).encode())
+            if x.endswith(b'0' * difficulty) or \
+               (weaker and x.endswith(b'0' * (difficulty - 1)) and not x.endswith(b'0' * difficulty)):
+                return answer
+
+            answer += 1
+
+    def test_proof_of_work_difficulty(self):
+        self.state.tenant_cache[1].enable_proof_of_work = True
+
+        for level, difficulty in enumerate(POW_DIFFICULTY):
+            self.state.tenant_state[1].Alarm.alarm_levels['activity'] = level
+
+            token = Token(1, 'submission')
+            token.human_captcha = {'solved': True}
+            self.assertEqual(token.serialize()['proof_of_work_difficulty'], difficulty)
+
+            answer = self.solve_proof_of_work(token.proof_of_work['question'], difficulty)
+            self.assertTrue(token.update({'proof_of_work_answer': answer}))
+
+    def test_proof_of_work_difficulty_wrong_answer(self):
+        self.state.tenant_cache[1].enable_proof_of_work = True
+        self.state.tenant_state[1].Alarm.alarm_levels['activity'] = 2
+
+        token = Token(1, 'submission')
+        token.human_captcha = {'solved': True}
+
+        answer = self.solve_proof_of_work(token.proof_of_work['question'], POW_DIFFICULTY[2], True)
+        self.assertFalse(token.update({'proof_of_work_answer': answer}))
+
     def test_tokens_garbage_collected(self):
         self.assertTrue(len(TokenList) == 0)
 
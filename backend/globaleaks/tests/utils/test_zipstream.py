@@ -2,13 +2,16 @@
 from io import BytesIO
 
 import os
+import struct
+import zlib
 from six import unichr, binary_type
 
 from twisted.internet.defer import inlineCallbacks
+from twisted.python.threadpool import ThreadPool
 from zipfile import ZipFile
 
 from globaleaks.tests import helpers
-from globaleaks.utils.zipstream import ZipStream
+from globaleaks.utils.zipstream import ZipStream, ZIP_DEFLATED, structFileHeader, stringFileHeader
 
 
 class TestZipStream(helpers.TestGL):
@@ -21,13 +24,18 @@ class TestZipStream(helpers.TestGL):
         self.files = [
           {'name': __file__, 'fo': open(os.path.abspath(__file__), 'rb')},
           {'name': __file__, 'path': os.path.abspath(__file__)},
-          {'name': self.unicode_seq, 'fo': BytesIO(self.unicode_seq.encode('utf-8'))}
+          {'name': self.unicode_seq, 'fo': BytesIO(self.unicode_seq.encode('utf-8'))},
+          {'name': 'file.pgp', 'path': os.path.abspath(__file__), 'content_type': 'application/pgp-encrypted'}
         ]
 
-    def test_zipstream(self):
+        self.threadpool = ThreadPool(0, 2)
+        self.threadpool.start()
+        self.addCleanup(self.threadpool.stop)
+
+    def _test_zipstream(self, threadpool):
         output = BytesIO()
 
-        for data in ZipStream(self.files):
+        for data in ZipStream(self.files, threadpool, workers=2):
             output.write(data)
 
         with ZipFile(output, 'r') as f:
@@ -37,7 +45,66 @@ class TestZipStream(helpers.TestGL):
             infolist = f.infolist()
             self.assertTrue(len(infolist), 2)
             for ff in infolist:
+                # the files are deflated so that the entries can be read
+                # by the streaming readers relying on the compressed data
+                # to find the data descriptor
+                self.assertEqual(ff.compress_type, ZIP_DEFLATED)
+
+                if ff.filename == 'file.pgp':
+                    self.assertTrue(ff.compress_size > ff.file_size)
+                elif ff.filename != self.unicode_seq:
+                    self.assertTrue(ff.compress_size < ff.file_size)
+
                 if ff.filename == self.unicode_seq:
                     self.assertTrue(ff.file_size == len(self.unicode_seq.encode()))
                 else:
                     self.assertTrue(ff.file_size == os.stat(os.path.abspath(__file__)).st_size)
+
+    def test_zipstream(self):
+        self._test_zipstream(None)
+
+    def test_zipstream_with_threadpool(self):
+        self._test_zipstream(self.threadpool)
+
+    def test_zipstream_sequential_read(self):
+        data = b''.join(ZipStream(self.files, self.threadpool))
+
+        # read the entries from the local headers as done by the streaming
+        # readers, that do not look at the central directory
+        names = []
+        while data.startswith(stringFileHeader):
+            header = struct.unpack(structFileHeader, data[:30])
+            self.assertEqual(header[4], ZIP_DEFLATED)
+
+            names.append(data[30:30 + header[10]])
+            data = data[30 + header[10] + header[11]:]
+
+            # the end of a deflated entry is known without its sizes
+            d = zlib.decompressobj(-15)
+            content = d.decompress(data)
+            self.assertTrue(d.unused_data.startswith(b'PK\x07\x08'))
+
+            crc, compress_size, file_size = struct.unpack('<LLL', d.unused_data[4:16])
+            self.assertEqual(file_size, len(content))
+            self.assertEqual(crc, zlib.crc32(content) & 0xffffffff)
+
+            data = d.unused_data[16:]
+
+        self.assertEqual(len(names), len(self.files))
+
+    def test_zipstream_close(self):
+        files = [{'name': str(i), 'fo': BytesIO(os.urandom(ZipStream.chunk_size * 8))} for i in range(3)]
+
+        zipstream = ZipStream(files, self.threadpool, workers=2, prefetch=2)
+
+        chunks = iter(zipstream)
+        for _ in range(3):
+            next(chunks)
+
+        zipstream.close()
+
+        # the stream stops without waiting for the end of the files being compressed
+        for _ in chunks:
+            pass
+
+        self.assertTrue(zipstream.closed.is_set())
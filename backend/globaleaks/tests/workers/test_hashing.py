@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+from twisted.internet.defer import inlineCallbacks
+from twisted.trial import unittest
+
+from globaleaks.rest import errors
+from globaleaks.utils.security import hash_password
+from globaleaks.workers.hashing import HashingPool
+
+dummy_salt = 'HUbmV25txTqWvdS76fUnDh0QBuEe4T1k'
+
+
+class TestHashingPool(unittest.TestCase):
+    def setUp(self):
+        self.pool = HashingPool(size=2, queue_size=1)
+        self.pool.start()
+
+    def tearDown(self):
+        return self.pool.stop()
+
+    @inlineCallbacks
+    def test_hash_password(self):
+        password_hash = yield self.pool.hash_password(u'password', dummy_salt)
+        self.assertEqual(password_hash, hash_password(u'password', dummy_salt))
+
+        valid = yield self.pool.check_password(u'password', dummy_salt, password_hash.decode())
+        self.assertTrue(valid)
+
+        valid = yield self.pool.check_password(u'x', dummy_salt, password_hash)
+        self.assertFalse(valid)
+
+    @inlineCallbacks
+    def test_admission_control(self):
+        deferreds = [self.pool.hash_password(u'password', dummy_salt) for _ in range(3)]
+
+        yield self.assertFailure(self.pool.hash_password(u'password', dummy_salt), errors.ServiceOverloaded)
+
+        for d in deferreds:
+            yield d
+
+        self.assertEqual(len(self.pool.busy) + len(self.pool.queue), 0)
+
+        yield self.pool.hash_password(u'password', dummy_salt)
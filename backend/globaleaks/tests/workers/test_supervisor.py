@@ -2,18 +2,27 @@
 import json
 import ssl
 import tempfile
+from datetime import timedelta
 from six.moves import urllib
 
 from twisted.internet import threads, reactor
 from twisted.internet.defer import inlineCallbacks
 
+from globaleaks import event
+from globaleaks.handlers import authentication
 from globaleaks.handlers.admin.https import load_tls_dict_list
+from globaleaks.jobs.session_management import SessionManagement
 from globaleaks.models.config import ConfigFactory
 from globaleaks.orm import transact
 from globaleaks.tests import helpers
 from globaleaks.tests.utils import test_tls
+from globaleaks.utils.security import generateRandomSalt, hash_password
 from globaleaks.utils.sock import reserve_port_for_ip
-from globaleaks.workers import supervisor
+from globaleaks.rest import errors
+from globaleaks.rest.apicache import ApiCache
+from globaleaks.settings import Settings
+from globaleaks.state import State
+from globaleaks.workers import control, supervisor
 from globaleaks.workers.worker_https import HTTPSProcess
 
 
@@ -46,6 +55,231 @@ class TestProcessSupervisor(helpers.TestGL):
         self.assertFalse(p_s.is_running())
 
 
+class FakeAPIProcProtocol(object):
+    def __init__(self):
+        self.messages = []
+
+    def send(self, message):
+        self.messages.append(message)
+
+
+class TestAPIWorkersControl(helpers.TestGL):
+    @inlineCallbacks
+    def setUp(self):
+        yield super(TestAPIWorkersControl, self).setUp()
+
+        self.p_s = supervisor.ProcessSupervisor([], '127.0.0.1', 43435)
+        self.workers = [FakeAPIProcProtocol(), FakeAPIProcProtocol()]
+        self.p_s.api_process_pool.extend(self.workers)
+
+    @inlineCallbacks
+    def test_refresh_is_relayed_to_the_other_workers(self):
+        ApiCache.set(1, '/public', 'en', 'application/json', '{}')
+
+        message = {'command': 'refresh', 'tid': None}
+
+        yield self.p_s.handle_message(self.workers[0], message)
+
+        self.assertEqual(self.workers[0].messages, [])
+        self.assertEqual(self.workers[1].messages, [message])
+        self.assertIsNone(ApiCache.get(1, '/public', 'en'))
+
+    def test_notify_change(self):
+        State.process_supervisor = self.p_s
+
+        State.notify_change(1)
+
+        for worker in self.workers:
+            self.assertEqual(worker.messages, [{'command': 'refresh', 'tid': 1}])
+
+    def test_call(self):
+        calls = []
+
+        class FakeJob(object):
+            def add_all_hidden_services(self, *args):
+                calls.append(args)
+
+            def _private(self):
+                calls.append('private')
+
+        State.onion_service_job = FakeJob()
+
+        self.p_s.handle_message(self.workers[0], {'command': 'call',
+                                                  'object': 'onion_service_job',
+                                                  'method': 'add_all_hidden_services',
+                                                  'args': [1]})
+
+        self.p_s.handle_message(self.workers[0], {'command': 'call',
+                                                  'object': 'onion_service_job',
+                                                  'method': '_private',
+                                                  'args': []})
+
+        self.p_s.handle_message(self.workers[0], {'command': 'call',
+                                                  'object': 'tenant_cache',
+                                                  'method': 'clear',
+                                                  'args': []})
+
+        State.onion_service_job = None
+
+        self.assertEqual(calls, [(1,)])
+        self.assertNotEqual(State.tenant_cache, {})
+
+    def test_remote_process_supervisor(self):
+        worker = FakeAPIProcProtocol()
+        remote = control.RemoteProcessSupervisor(worker)
+
+        remote.shutdown()
+
+        self.assertEqual(worker.messages, [{'command': 'call',
+                                            'object': 'process_supervisor',
+                                            'method': 'shutdown',
+                                            'args': ()}])
+
+        self.assertFalse(remote.is_running())
+
+        self.p_s.broadcast(self.p_s.get_https_status_message())
+
+        message = self.workers[0].messages[0]
+        self.assertEqual(message['command'], 'https_status')
+        self.assertFalse(message['running'])
+
+    def test_events_are_forwarded_to_the_main_process(self):
+        State.tenant_state[1].RecentEventQ.clear()
+        State.tenant_state[1].EventQ.clear()
+
+        event.register_handler(authentication.AuthenticationHandler)
+
+        worker_control = FakeAPIProcProtocol()
+
+        State.control = worker_control
+        self.addCleanup(setattr, State, 'control', None)
+
+        handler = authentication.AuthenticationHandler(State, helpers.forge_request(method=b'POST'))
+        handler.request.code = 401
+        handler.request.execution_time = timedelta(seconds=1)
+        event.track_handler(handler)
+
+        State.control = None
+
+        message = worker_control.messages[0]
+        self.assertEqual(message, {'command': 'event', 'tid': 1, 'event': 'failed_logins', 'duration': 1.0})
+        self.assertEqual(len(State.tenant_state[1].RecentEventQ), 0)
+
+        self.p_s.handle_message(self.workers[0], message)
+
+        self.assertEqual(State.tenant_state[1].RecentEventQ.counts(), {'failed_logins': 1})
+        self.assertEqual(State.tenant_state[1].EventQ.counts(), {'failed_logins': 1})
+
+    @inlineCallbacks
+    def test_hash_password(self):
+        salt = generateRandomSalt()
+
+        yield self.p_s.handle_message(self.workers[0], {'command': 'hash',
+                                                        'id': 1,
+                                                        'password': u'password',
+                                                        'salt': salt})
+
+        self.assertEqual(self.workers[0].messages, [{'command': 'hash_result',
+                                                     'id': 1,
+                                                     'hash': hash_password(u'password', salt).decode()}])
+        self.assertEqual(self.workers[1].messages, [])
+
+    @inlineCallbacks
+    def test_remote_hashing_pool(self):
+        worker_control = FakeAPIProcProtocol()
+        remote = control.RemoteHashingPool(worker_control)
+
+        d1 = remote.hash_password(u'password', u'salt')
+        d2 = remote.check_password(u'password', u'salt', u'hash')
+
+        self.assertEqual(worker_control.messages, [
+            {'command': 'hash', 'id': 1, 'password': u'password', 'salt': u'salt'},
+            {'command': 'hash', 'id': 2, 'password': u'password', 'salt': u'salt'}
+        ])
+
+        remote.handle_result({'command': 'hash_result', 'id': 2, 'hash': u'hash'})
+        remote.handle_result({'command': 'hash_result', 'id': 1, 'error': u'overloaded'})
+
+        valid = yield d2
+        self.assertTrue(valid)
+
+        yield self.assertFailure(d1, errors.ServiceOverloaded)
+
+        self.assertEqual(remote.pending, {})
+
+    def test_alarm(self):
+        State.process_supervisor = self.p_s
+
+        State.notify_alarm(1, 2)
+
+        for worker in self.workers:
+            self.assertEqual(worker.messages, [{'command': 'alarm', 'tid': 1, 'activity': 2}])
+
+        protocol = control.ControlProtocol()
+        protocol.lineReceived(control.encode_message(self.workers[0].messages[0]).strip())
+
+        self.assertEqual(State.tenant_state[1].Alarm.alarm_levels['activity'], 2)
+
+        State.tenant_state[1].Alarm.alarm_levels['activity'] = 0
+
+    def test_failed_logins_are_counted_by_the_main_process(self):
+        State.process_supervisor = self.p_s
+
+        worker_control = FakeAPIProcProtocol()
+
+        State.control = worker_control
+        self.addCleanup(setattr, State, 'control', None)
+
+        State.track_failed_login()
+
+        State.control = None
+
+        message = worker_control.messages[0]
+        self.assertEqual(message, {'command': 'failed_login'})
+        self.assertEqual(Settings.failed_login_attempts, 0)
+
+        self.p_s.handle_message(self.workers[0], message)
+
+        self.assertEqual(Settings.failed_login_attempts, 1)
+
+        for worker in self.workers:
+            self.assertEqual(worker.messages, [{'command': 'login_state',
+                                                'failed_login_attempts': 1,
+                                                'api_token_session_suspended': False}])
+
+        # the counter is reset by the main process and with it by the workers
+        job = SessionManagement()
+        self.test_reactor.advance(1)
+        job.stop()
+
+        self.assertEqual(Settings.failed_login_attempts, 0)
+
+        Settings.failed_login_attempts = 1
+
+        protocol = control.ControlProtocol()
+        protocol.lineReceived(control.encode_message(self.workers[1].messages[1]).strip())
+
+        self.assertEqual(Settings.failed_login_attempts, 0)
+
+    def test_tor_exit_set(self):
+        State.process_supervisor = self.p_s
+
+        State.tor_exit_set.set_addresses(['1.2.3.4', '5.6.7.8'])
+        self.addCleanup(State.tor_exit_set.clear)
+
+        State.notify_tor_exit_set()
+
+        for worker in self.workers:
+            self.assertEqual(worker.messages, [{'command': 'tor_exit_set', 'ips': ['1.2.3.4', '5.6.7.8']}])
+
+        State.tor_exit_set.clear()
+
+        protocol = control.ControlProtocol()
+        protocol.lineReceived(control.encode_message(self.workers[0].messages[0]).strip())
+
+        self.assertEqual(State.tor_exit_set, set(['1.2.3.4', '5.6.7.8']))
+
+
 @transact
 def wrap_db_tx(session, f, *args, **kwargs):
     return f(session, *args, **kwargs)
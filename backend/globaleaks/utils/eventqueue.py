@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+# EventQueue
+#
+# Queue of the events tracked by the handlers.
+#
+# The events are not kept as objects: for each event type the times of
+# creation and the durations of the most recent events are stored in a
+# pair of ring buffers backed by array('d') of bounded size while the number
+# of the events is kept in a counter. The memory used by a queue is then
+# bounded regardless of the traffic and the summary of the events is
+# computed in O(number of event types).
+from array import array
+from datetime import datetime, timedelta
+
+EPOCH = datetime(1970, 1, 1)
+
+
+class EventRing(object):
+    """
+    Ring buffer of the times of creation and of the durations of the events of a type
+    """
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.timestamps = array('d')
+        self.durations = array('d')
+        self.position = 0
+        self.count = 0
+
+    def append(self, timestamp, duration):
+        # the arrays grow up to the capacity and are then overwritten in circle
+        if len(self.timestamps) < self.capacity:
+            self.timestamps.append(timestamp)
+            self.durations.append(duration)
+        else:
+            self.timestamps[self.position] = timestamp
+            self.durations[self.position] = duration
+
+        self.position = (self.position + 1) % self.capacity
+        self.count += 1
+
+    def __iter__(self):
+        """
+        Iterate over the (timestamp, duration) of the retained events from the oldest
+        """
+        if len(self.timestamps) < self.capacity:
+            start = 0
+        else:
+            start = self.position
+
+        for i in range(len(self.timestamps)):
+            j = (start + i) % len(self.timestamps)
+            yield self.timestamps[j], self.durations[j]
+
+
+class EventQueue(object):
+    """
+    Queue of the events of a tenant
+    """
+    def __init__(self, capacity=1024):
+        self.capacity = capacity
+        self.rings = {}
+
+    def append(self, event):
+        ring = self.rings.get(event.event_type)
+        if ring is None:
+            ring = self.rings[event.event_type] = EventRing(self.capacity)
+
+        ring.append((event.creation_date - EPOCH).total_seconds(), event.request_time)
+
+    def counts(self):
+        """
+        Return the number of the events of each type
+        """
+        return {event_type: ring.count for event_type, ring in self.rings.items()}
+
+    def serialize(self):
+        """
+        Return the serialization of the retained events sorted by time of creation
+        """
+        ret = []
+
+        for event_type, ring in self.rings.items():
+            for timestamp, duration in ring:
+                ret.append((timestamp, event_type, duration))
+
+        ret.sort(key=lambda x: x[0])
+
+        return [{
+            'event': event_type,
+            'creation_date': (EPOCH + timedelta(seconds=timestamp)).strftime('%Y-%m-%dT%H:%M:%S'),
+            'duration': duration
+        } for timestamp, event_type, duration in ret]
+
+    def clear(self):
+        self.rings.clear()
+
+    def __len__(self):
+        return sum(ring.count for ring in self.rings.values())
@@ -0,0 +1,155 @@
+# -*- coding: utf-8
+# Inventory of the files contained in a directory
+import os
+import time
+
+try:
+    scandir = os.scandir
+except AttributeError:
+    scandir = None
+
+
+class ScanEntry(object):
+    """
+    Minimal replacement of os.DirEntry used where os.scandir is not available
+    """
+    def __init__(self, path, name):
+        self.name = name
+        self.path = os.path.join(path, name)
+
+    def is_dir(self, follow_symlinks=True):
+        return os.path.isdir(self.path) and (follow_symlinks or not os.path.islink(self.path))
+
+    def is_file(self, follow_symlinks=True):
+        return os.path.isfile(self.path) and (follow_symlinks or not os.path.islink(self.path))
+
+    def stat(self):
+        return os.stat(self.path)
+
+
+def scan_directory(path):
+    if scandir is not None:
+        return scandir(path)
+
+    return [ScanEntry(path, name) for name in os.listdir(path)]
+
+
+class FileInventory(object):
+    """
+    Keeps the inventory of the files contained in a directory and in its
+    subdirectories, caching their modification time so that each file is
+    stat'ed only once.
+
+    The incremental scan does not list the directories that were not
+    modified since the last scan and stats only the files that appeared since.
+    """
+    def __init__(self, path):
+        self.path = path
+
+        # name -> (relative directory, mtime)
+        self.files = {}
+
+        # relative directory -> (mtime, names of the files, names of the subdirectories)
+        self.directories = {}
+
+    def scan(self, incremental=True):
+        """
+        Update the inventory
+
+        :param incremental: when False the inventory is rebuilt from scratch
+        :return: the set of the names of the files added since the last scan
+        """
+        if not incremental:
+            self.files = {}
+            self.directories = {}
+
+        added = set()
+
+        self.scan_directory('', time.time(), added)
+
+        return added
+
+    def scan_directory(self, directory, start_time, added):
+        path = os.path.join(self.path, directory)
+
+        try:
+            mtime = os.stat(path).st_mtime
+        except OSError:
+            self.forget_directory(directory)
+            return
+
+        cached_mtime, names, subdirectories = self.directories.get(directory, (None, set(), set()))
+
+        if cached_mtime is None or mtime != cached_mtime:
+            current_names, current_subdirectories = set(), set()
+
+            for entry in scan_directory(path):
+                if entry.name in names:
+                    current_names.add(entry.name)
+                    continue
+
+                try:
+                    if entry.name in subdirectories or entry.is_dir(follow_symlinks=False):
+                        current_subdirectories.add(entry.name)
+                        continue
+
+                    if not entry.is_file(follow_symlinks=False):
+                        continue
+
+                    self.files[entry.name] = (directory, entry.stat().st_mtime)
+                except OSError:
+                    # the file has been removed in the meantime
+                    continue
+
+                current_names.add(entry.name)
+                added.add(entry.name)
+
+            for name in names - current_names:
+                if self.files.get(name, (None,))[0] == directory:
+                    del self.files[name]
+
+            for subdirectory in subdirectories - current_subdirectories:
+                self.forget_directory(os.path.join(directory, subdirectory))
+
+            names, subdirectories = current_names, current_subdirectories
+
+            # changes happening within the timestamp granularity of the
+            # directory could go unnoticed; in this case the next scan
+            # lists the directory again.
+            self.directories[directory] = (mtime if mtime < start_time - 1 else None, names, subdirectories)
+
+        for subdirectory in subdirectories:
+            self.scan_directory(os.path.join(directory, subdirectory), start_time, added)
+
+    def forget_directory(self, directory):
+        _, names, subdirectories = self.directories.pop(directory, (None, set(), set()))
+
+        for name in names:
+            if self.files.get(name, (None,))[0] == directory:
+                del self.files[name]
+
+        for subdirectory in subdirectories:
+            self.forget_directory(os.path.join(directory, subdirectory))
+
+    def get_path(self, name):
+        return os.path.join(self.path, self.files[name][0], name)
+
+    def names(self):
+        return set(self.files)
+
+    def untracked(self, tracked):
+        """
+        Return the names of the files not included in the set of tracked names
+        """
+        return set(self.files) - tracked
+
+    def older_than(self, timestamp):
+        """
+        Return the names of the files modified before the given timestamp
+        """
+        return set(name for name, (_, mtime) in self.files.items() if mtime < timestamp)
+
+    def discard(self, name):
+        directory, _ = self.files.pop(name, (None, None))
+        if directory in self.directories:
+            self.directories[directory][1].discard(name)
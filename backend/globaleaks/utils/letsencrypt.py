@@ -7,12 +7,23 @@ from acme import challenges, client, crypto_util, messages
 from six import text_type
 
 from globaleaks.utils.log import log
+from globaleaks.utils.store import StoredItems
 
 
 class ChallTok:
     def __init__(self, tok):
         self.tok = tok
 
+
+class AcmeChallengesClass(StoredItems):
+    """
+    Challenges exposed to the ACME CA during the issuance of the certificates
+
+    The challenges are kept in the store shared by the processes serving the
+    API as the validation requests of the CA may reach any of them.
+    """
+    namespace = 'acme_challenges'
+
 def split_certificate_chain(full_chain_pem):
     certificates = re.findall('-----BEGIN CERTIFICATE-----.*?-----END CERTIFICATE-----', full_chain_pem, re.DOTALL)
     return certificates[0], ''.join(certificates[1:])
@@ -9,9 +9,9 @@ from email.header import Header
 from email.mime.multipart import MIMEMultipart
 from email.mime.text import MIMEText
 
-from twisted.internet import reactor, defer
+from twisted.internet import reactor, defer, protocol
 from twisted.internet.endpoints import TCP4ClientEndpoint
-from twisted.mail.smtp import ESMTPSenderFactory
+from twisted.mail.smtp import Address, DNSNAME, ESMTPSender, SMTPClient, SMTPDeliveryError, SUCCESS
 from twisted.protocols import tls
 
 from globaleaks.utils.socks import SOCKS5ClientEndpoint
@@ -51,29 +51,124 @@ def MIME_mail_build(src_name, src_mail, dest_name, dest_mail, title, mail_body):
     return BytesIO(multipart_as_bytes) # pylint: disable=no-member
 
 
-def sendmail(tid, smtp_host, smtp_port, security, authentication, username, password, from_name, from_address, to_address, subject, body, anonymize=True, socks_host='127.0.0.1', socks_port=9050):
+class MultiESMTPSender(ESMTPSender):
     """
-    Send an email using SMTPS/SMTP+TLS and maybe torify the connection.
+    ESMTP sender delivering over the same authenticated session all the
+    messages queued on its factory, resetting the transaction after each one
+    """
+    def getMailFrom(self):
+        return self.factory.next_message()
 
-    @param to_address: the 'To:' field of the email
-    @param subject: the mail subject
-    @param body: the mail body
+    def getMailTo(self):
+        return [self.factory.current[0]]
 
-    @return: a {Deferred} that returns a success {bool} if the message was passed
-             to the server.
+    def getMailData(self):
+        return self.factory.current[1]
+
+    def sendError(self, exc):
+        SMTPClient.sendError(self, exc)
+        self.factory.fail(exc)
+
+    def sentMail(self, code, resp, numOk, addresses, log):
+        if code in SUCCESS:
+            self.factory.succeed()
+        else:
+            self.factory.fail_current(SMTPDeliveryError(code, resp, log.str(), addresses))
+
+    def connectionLost(self, reason=protocol.connectionDone):
+        ESMTPSender.connectionLost(self, reason)
+        self.factory.fail(reason)
+
+
+class MultiESMTPSenderFactory(protocol.ClientFactory):
+    """
+    Factory of a MultiESMTPSender in charge of a queue of messages
+
+    @param messages: a list of (to_address, message file, deferred) tuples;
+                     each deferred fires with True when its message is accepted
+                     by the server or errbacks with the cause of the failure.
+    """
+    protocol = MultiESMTPSender
+    domain = DNSNAME
+
+    def __init__(self, username, password, from_address, messages, timeout,
+                 contextFactory, requireAuthentication, requireTransportSecurity):
+        self.username = username
+        self.password = password
+        self.from_address = Address(from_address)
+        self.messages = list(messages)
+        self.current = None
+        self.timeout = timeout
+        self.contextFactory = contextFactory
+        self.requireAuthentication = requireAuthentication
+        self.requireTransportSecurity = requireTransportSecurity
+
+    def next_message(self):
+        if not self.messages:
+            return None
+
+        self.current = self.messages.pop(0)
+
+        return str(self.from_address)
+
+    def succeed(self):
+        current, self.current = self.current, None
+        if current is not None:
+            current[2].callback(True)
+
+    def fail_current(self, excep):
+        current, self.current = self.current, None
+        if current is not None:
+            current[2].errback(excep)
+
+    def fail(self, excep):
+        """
+        Fail the message in delivery and all the messages still queued
+        """
+        self.fail_current(excep)
+
+        messages, self.messages = self.messages, []
+        for message in messages:
+            message[2].errback(excep)
+
+        return None
+
+    def buildProtocol(self, addr):
+        p = self.protocol(self.username, self.password, self.contextFactory,
+                          self.domain, len(self.messages) * 2 + 2)
+        p.heloFallback = False
+        p.requireAuthentication = self.requireAuthentication
+        p.requireTransportSecurity = self.requireTransportSecurity
+        p.factory = self
+        p.timeout = self.timeout
+        return p
+
+
+def sendmails(tid, smtp_host, smtp_port, security, authentication, username, password, from_name, from_address, mails, anonymize=True, socks_host='127.0.0.1', socks_port=9050):
+    """
+    Send a list of emails over a single SMTPS/SMTP+TLS session and maybe torify the connection.
+
+    @param mails: a list of dicts with the 'address', the 'subject' and the 'body' of each email
+
+    @return: a {Deferred} that returns a list of success {bool}, one for each
+             email, telling if the message was passed to the server.
     """
     try:
         timeout = 30
 
-        message = MIME_mail_build(from_name,
-                                  from_address,
-                                  to_address,
-                                  to_address,
-                                  subject,
-                                  body)
+        messages = []
+        for mail in mails:
+            message = MIME_mail_build(from_name,
+                                      from_address,
+                                      mail['address'],
+                                      mail['address'],
+                                      mail['subject'],
+                                      mail['body'])
 
-        log.debug('Sending email to %s using SMTP server [%s:%d] [%s]',
-                  to_address,
+            messages.append((mail['address'].encode('utf-8'), message, defer.Deferred()))
+
+        log.debug('Sending %d emails using SMTP server [%s:%d] [%s]',
+                  len(mails),
                   smtp_host,
                   smtp_port,
                   security,
@@ -81,20 +176,15 @@ def sendmail(tid, smtp_host, smtp_port, security, authentication, username, pass
 
         context_factory = TLSClientContextFactory()
 
-        smtp_deferred = defer.Deferred()
-
-        factory = ESMTPSenderFactory(
+        sender_factory = factory = MultiESMTPSenderFactory(
             username.encode('utf-8') if authentication else None,
             password.encode('utf-8') if authentication else None,
             from_address,
-            to_address,
-            message,
-            smtp_deferred,
+            messages,
+            timeout,
             contextFactory=context_factory,
             requireAuthentication=authentication,
-            requireTransportSecurity=(security == 'TLS'),
-            retries=0,
-            timeout=timeout)
+            requireTransportSecurity=(security == 'TLS'))
 
         if security == "SSL":
             factory = tls.TLSMemoryBIOFactory(context_factory, True, factory)
@@ -105,27 +195,41 @@ def sendmail(tid, smtp_host, smtp_port, security, authentication, username, pass
         else:
             endpoint = TCP4ClientEndpoint(reactor, smtp_host.encode('utf-8'), smtp_port, timeout=timeout)
 
-        conn_deferred = endpoint.connect(factory)
-
-        final = defer.DeferredList([conn_deferred, smtp_deferred], fireOnOneErrback=True, consumeErrors=True)
-
         def failure_cb(failure):
-            """
-            @param failure {Failure {twisted.internet.FirstError {Failure}}}
-            """
-            log.err("SMTP connection failed (Exception: %s)", failure.value.subFailure.value, tid=tid)
+            log.err("SMTP connection failed (Exception: %s)", failure.value, tid=tid)
             log.debug(failure)
             return False
 
-        def success_cb(results):
-            """
-            @param results {list of (success, return_val) tuples}
-            """
-            return True
+        results = [d.addErrback(failure_cb) for _, _, d in messages]
+
+        endpoint.connect(factory).addErrback(sender_factory.fail)
 
-        return final.addCallbacks(success_cb, failure_cb)
+        return defer.gatherResults(results)
 
     except Exception as excep:
         # avoids raising an exception inside email logic to avoid chained errors
         log.err("Unexpected exception in sendmail: %s", str(excep), tid=tid)
-        return defer.succeed(False)
+        return defer.succeed([False] * len(mails))
+
+
+def sendmail(tid, smtp_host, smtp_port, security, authentication, username, password, from_name, from_address, to_address, subject, body, anonymize=True, socks_host='127.0.0.1', socks_port=9050):
+    """
+    Send an email using SMTPS/SMTP+TLS and maybe torify the connection.
+
+    @param to_address: the 'To:' field of the email
+    @param subject: the mail subject
+    @param body: the mail body
+
+    @return: a {Deferred} that returns a success {bool} if the message was passed
+             to the server.
+    """
+    mail = {
+        'address': to_address,
+        'subject': subject,
+        'body': body
+    }
+
+    d = sendmails(tid, smtp_host, smtp_port, security, authentication, username, password,
+                  from_name, from_address, [mail], anonymize, socks_host, socks_port)
+
+    return d.addCallback(lambda results: results[0])
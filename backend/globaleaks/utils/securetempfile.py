@@ -1,13 +1,20 @@
 # -*- coding: utf-8 -*-
+import binascii
 import os
 
 from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
 from six import text_type
 
 from globaleaks.utils.security import crypto_backend, generateRandomKey
+from globaleaks.utils.storage import get_sharded_path
+from globaleaks.utils.store import StoredItems
 
 class SecureTemporaryFile(object):
     file = None
+    fd = None
+
+    # the file is removed with the object unless it is persistent
+    persistent = False
 
     def __init__(self, filesdir):
         """
@@ -17,14 +24,34 @@ class SecureTemporaryFile(object):
         self.key_id = generateRandomKey(16)
         self.key_counter_nonce = os.urandom(16)
         self.cipher = Cipher(algorithms.AES(self.key), modes.CTR(self.key_counter_nonce), backend=crypto_backend)
-        self.filepath = os.path.join(filesdir, "%s.aes" % self.key_id)
+        self.filepath = get_sharded_path(filesdir, "%s.aes" % self.key_id, True)
+        self.enc = self.cipher.encryptor()
+        self.dec = None
+
+    @property
+    def filename(self):
+        return os.path.basename(self.filepath)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        for x in ['cipher', 'enc', 'dec', 'fd']:
+            state.pop(x, None)
+
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.cipher = Cipher(algorithms.AES(self.key), modes.CTR(self.key_counter_nonce), backend=crypto_backend)
         self.enc = self.cipher.encryptor()
         self.dec = None
 
     def open(self, mode):
         if self.file is None:
            if mode == 'w':
-               self.fd = open(self.filepath, 'ab+')
+               # the file is not opened in append mode in order to permit
+               # write_at() to seek; sequential writes continue from the end
+               self.fd = open(self.filepath, 'rb+' if os.path.exists(self.filepath) else 'wb+')
+               self.fd.seek(0, os.SEEK_END)
            else:
                self.fd = open(self.filepath, 'rb')
                self.dec = self.cipher.decryptor()
@@ -37,6 +64,25 @@ class SecureTemporaryFile(object):
 
         self.fd.write(self.enc.update(data))
 
+    def write_at(self, offset, data):
+        """
+        Write data at the specified plaintext offset.
+
+        AES-CTR permits to seek by computing the counter of the block
+        containing the offset and discarding the keystream that precedes it.
+        """
+        if isinstance(data, text_type):
+            data = data.encode('utf-8')
+
+        counter = int(binascii.hexlify(self.key_counter_nonce), 16) + offset // 16
+        counter = binascii.unhexlify('%032x' % (counter % (1 << 128)))
+
+        enc = Cipher(algorithms.AES(self.key), modes.CTR(counter), backend=crypto_backend).encryptor()
+        enc.update(b'\x00' * (offset % 16))
+
+        self.fd.seek(offset)
+        self.fd.write(enc.update(data) + enc.finalize())
+
     def finalize_write(self):
         self.fd.write(self.enc.finalize())
 
@@ -65,7 +111,73 @@ class SecureTemporaryFile(object):
     def __del__(self):
         self.close()
 
+        if self.persistent:
+            return
+
         try:
             os.remove(self.filepath)
         except:
-            pass
\ No newline at end of file
+            pass
+
+
+class SecureTemporaryUploadFile(SecureTemporaryFile):
+    """
+    SecureTemporaryFile assembled from the chunks of a flow.js upload
+
+    Chunks are written by offset and could so be received in any order,
+    in parallel or again after a connection drop; the upload is completed
+    when every chunk has been received.
+    """
+    def __init__(self, filesdir, total_size, total_chunks, chunk_size):
+        SecureTemporaryFile.__init__(self, filesdir)
+        self.total_size = total_size
+        self.total_chunks = total_chunks
+        self.chunk_size = chunk_size
+        self.chunks = set()
+
+    def match(self, total_size, total_chunks, chunk_size):
+        return (self.total_size, self.total_chunks, self.chunk_size) == (total_size, total_chunks, chunk_size)
+
+    def valid_chunk(self, chunk_number, size):
+        if chunk_number < 1 or chunk_number > self.total_chunks:
+            return False
+
+        offset = (chunk_number - 1) * self.chunk_size
+
+        if chunk_number < self.total_chunks:
+            return size == self.chunk_size
+
+        return offset + size == self.total_size
+
+    def has_chunk(self, chunk_number):
+        return chunk_number in self.chunks
+
+    def write_chunk(self, chunk_number, data):
+        self.write_at((chunk_number - 1) * self.chunk_size, data)
+        self.chunks.add(chunk_number)
+
+    @property
+    def completed(self):
+        return len(self.chunks) == self.total_chunks
+
+
+class TempUploadFilesClass(StoredItems):
+    """
+    Uploads in progress and uploaded files waiting to be processed
+    """
+    namespace = 'uploads'
+    indexes = ('filename',)
+
+    def set(self, key, item):
+        # once in the store the file outlives the object and is removed
+        # by the copy popped from the store or on its expiration
+        item.persistent = True
+        StoredItems.set(self, key, item)
+
+    def setdefault(self, key, item):
+        item.persistent = True
+        return StoredItems.setdefault(self, key, item)
+
+    def expireCallback(self, item):
+        # the expired file is removed with the object
+        item.persistent = False
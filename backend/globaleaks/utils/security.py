@@ -1,11 +1,11 @@
 # -*- coding: utf-8 -*-
 import base64
 import binascii
+import errno
 import os
-import random
 import scrypt
 import string
-import sys
+import threading
 
 from cryptography.hazmat.backends import default_backend
 from cryptography.hazmat.primitives import constant_time, hashes
@@ -41,18 +41,62 @@ def sha512(data):
     return binascii.b2a_hex(h.finalize())
 
 
+class RandomStringGenerator(object):
+    """
+    Generator of random strings over an alphabet
+
+    The randomness is read from os.urandom in blocks and each byte is
+    mapped to a character; the bytes exceeding the largest multiple of
+    the size of the alphabet are discarded in order to not bias the
+    distribution of the characters (rejection sampling).
+
+    The generator is shared by the reactor and the threads of the ORM
+    and the bytes are consumed under a lock so that they are never
+    used twice.
+    """
+    def __init__(self, alphabet, block_size=4096):
+        self.alphabet = alphabet
+        self.limit = 256 - 256 % len(alphabet)
+        self.block_size = block_size
+        self.buffer = bytearray()
+        self.lock = threading.Lock()
+
+    def generate(self, N):
+        ret = []
+
+        with self.lock:
+            while len(ret) < N:
+                if not self.buffer:
+                    self.buffer = bytearray(os.urandom(self.block_size))
+
+                i = 0
+                for i, byte in enumerate(self.buffer, 1):
+                    if byte < self.limit:
+                        ret.append(self.alphabet[byte % len(self.alphabet)])
+                        if len(ret) == N:
+                            break
+
+                del self.buffer[:i]
+
+        return ''.join(ret)
+
+
+key_generator = RandomStringGenerator(string.ascii_letters + string.digits)
+receipt_generator = RandomStringGenerator(string.digits)
+
+
 def generateRandomReceipt():
     """
     Return a random receipt of 16 digits
     """
-    return ''.join(random.SystemRandom().choice(string.digits) for _ in range(16))
+    return receipt_generator.generate(16)
 
 
 def generateRandomKey(N):
     """
     Return a random key of N characters in a-zA-Z0-9
     """
-    return ''.join(random.SystemRandom().choice(string.ascii_letters + string.digits) for _ in range(N))
+    return key_generator.generate(N)
 
 
 def generateRandomSalt():
@@ -78,49 +122,90 @@ def generate_api_token():
     return token, sha512(token.encode())
 
 
-def _overwrite(absolutefpath, pattern):
+# size of the buffers used to overwrite the files
+overwrite_chunk_size = 1024 * 1024
+overwrite_zeros = b'\0' * overwrite_chunk_size
+
+
+def _get_data_extents(fd, size):
+    """
+    Return the list of (start, end) ranges of the file that are backed by data.
+
+    Holes, as created by sparse writes or by fallocate(FALLOC_FL_PUNCH_HOLE),
+    hold no data on disk and so are skipped; if the filesystem does not
+    support SEEK_DATA/SEEK_HOLE the whole file is returned as a single range.
+    """
+    if not hasattr(os, 'SEEK_DATA'):
+        return [(0, size)]
+
+    extents = []
+    offset = 0
+
+    try:
+        while offset < size:
+            start = os.lseek(fd, offset, os.SEEK_DATA)
+            offset = min(os.lseek(fd, start, os.SEEK_HOLE), size)
+            extents.append((start, offset))
+    except OSError as excep:
+        # ENXIO signals that there is no more data after the offset
+        if excep.errno != errno.ENXIO:
+            return [(0, size)]
+
+    return extents
+
+
+def _overwrite(fd, extents, random_data):
+    """
+    Overwrite the given extents of the file with zeros or random data
+    and flush the result to disk.
+    """
     count = 0
-    length = len(pattern)
 
-    with open(absolutefpath, 'w+') as f:
-        f.seek(0)
-        while count < length:
-            f.write(pattern)
-            count += len(pattern)
+    for start, end in extents:
+        os.lseek(fd, start, os.SEEK_SET)
+        while start < end:
+            length = min(overwrite_chunk_size, end - start)
+            chunk = os.urandom(length) if random_data else overwrite_zeros[:length]
+            while chunk:
+                written = os.write(fd, chunk)
+                chunk = chunk[written:]
+
+            start += length
+            count += length
+
+    os.fsync(fd)
+
+    return count
 
 
 def overwrite_and_remove(absolutefpath, iterations_number=1):
     """
-    Overwrite the file with all_zeros, all_ones, random patterns
+    Overwrite the file with zeros and random data and remove it
 
-    Note: At each iteration the original size of the file is altered.
+    Each iteration covers every data block of the file with a pass of
+    zeros followed by a pass of random data, each one flushed to disk.
+
+    :return: the number of bytes overwritten
     """
     log.debug("Starting secure deletion of file %s", absolutefpath)
 
-    randomgen = random.SystemRandom()
+    count = 0
 
     try:
-        # in the following loop, the file is open and closed on purpose, to trigger flush operations
-        all_zeros = "\0\0\0\0" * 1024               # 4kb of zeros
-
-        if sys.version_info[0] == 2:
-            all_ones = "FFFFFFFF".decode("hex") * 1024  # 4kb of ones
-        else:
-            all_ones = "\xFF" * 4096
-
-        for iteration in range(iterations_number):
-            OPTIMIZATION_RANDOM_BLOCK = randomgen.randint(4096, 4096 * 2)
+        fd = os.open(absolutefpath, os.O_WRONLY)
+        try:
+            extents = _get_data_extents(fd, os.fstat(fd).st_size)
 
-            random_pattern = ""
-            for _ in range(OPTIMIZATION_RANDOM_BLOCK):
-                random_pattern += str(randomgen.randrange(256))
+            for iteration in range(iterations_number):
+                log.debug("Excecuting rewrite iteration (%d out of %d)",
+                          iteration, iterations_number)
 
-            log.debug("Excecuting rewrite iteration (%d out of %d)",
-                      iteration, iterations_number)
+                count += _overwrite(fd, extents, False)
+                count += _overwrite(fd, extents, True)
 
-            _overwrite(absolutefpath, all_zeros)
-            _overwrite(absolutefpath, all_ones)
-            _overwrite(absolutefpath, random_pattern)
+            os.ftruncate(fd, 0)
+        finally:
+            os.close(fd)
 
     except Exception as excep:
         log.err("Unable to perform secure overwrite for file %s: %s",
@@ -135,6 +220,8 @@ def overwrite_and_remove(absolutefpath, iterations_number=1):
 
     log.debug("Performed deletion of file: %s", absolutefpath)
 
+    return count
+
 
 def directory_traversal_check(trusted_absolute_prefix, untrusted_path):
     """
@@ -0,0 +1,432 @@
+# -*- coding: utf-8
+# Storage of the attachments
+#
+# The attachments are stored by means of a driver exposing a streaming
+# interface to read, write, stat and delete files by name:
+#
+#  - LocalStorage, the default, keeps the files in the attachments directory;
+#  - S3Storage keeps the files in the bucket of an S3 compatible service
+#    permitting multiple backend nodes to share the same attachments.
+#
+# In order to keep the directories small the local files are distributed in
+# subdirectories named after the first shard_width hex digits of the
+# sha256 of their name.
+import errno
+import hashlib
+import hmac
+import os
+import shutil
+import tempfile
+
+from datetime import datetime
+from email.utils import mktime_tz, parsedate_tz
+from six.moves import http_client
+from six.moves.urllib.parse import parse_qs, quote, unquote, urlparse
+
+from globaleaks.rest import errors
+from globaleaks.settings import Settings
+from globaleaks.utils.security import directory_traversal_check, overwrite_and_remove, sha256
+
+shard_width = 2
+
+
+def get_shard(filename):
+    return sha256(filename)[:shard_width].decode()
+
+
+def get_sharded_path(directory, filename, create=False):
+    """
+    Return the path of a file in the sharded layout of a directory
+
+    :param create: create the shard subdirectory if missing
+    """
+    shard_path = os.path.join(directory, get_shard(filename))
+
+    if create:
+        try:
+            os.mkdir(shard_path)
+        except OSError as excep:
+            if excep.errno != errno.EEXIST:
+                raise
+
+    return os.path.join(shard_path, filename)
+
+
+def get_file_path(directory, filename, create=False):
+    """
+    Return the path of a file stored in a sharded directory
+
+    Files stored in the legacy flat layout are found until they
+    are moved in their shard by reshard_directory.
+    """
+    path = get_sharded_path(directory, filename, create)
+    if create or os.path.exists(path):
+        return path
+
+    legacy_path = os.path.join(directory, filename)
+    if os.path.exists(legacy_path):
+        return legacy_path
+
+    # the file could have been moved in its shard in the meantime
+    return path
+
+
+def get_attachment_path(filename, create=False):
+    return get_file_path(Settings.attachments_path, filename, create)
+
+
+def reshard_directory(directory, exclude=()):
+    """
+    Move the files stored in the flat layout of a directory into their shards
+
+    The files are moved with an atomic rename so that the directory can be
+    resharded while the application is running.
+
+    :param exclude: paths of the files that must not be moved
+    :return: the number of files moved
+    """
+    count = 0
+
+    for filename in os.listdir(directory):
+        path = os.path.join(directory, filename)
+        if path in exclude or not os.path.isfile(path):
+            continue
+
+        os.rename(path, get_sharded_path(directory, filename, True))
+        count += 1
+
+    return count
+
+
+class LocalStorage(object):
+    """
+    Driver storing the files in the sharded layout of a local directory
+    """
+    def __init__(self, path):
+        self.path = path
+
+    def get_path(self, name, create=False):
+        path = get_file_path(self.path, name, create)
+
+        directory_traversal_check(self.path, path)
+
+        return path
+
+    def open(self, name, mode='rb'):
+        """
+        Open a file for reading ('rb') or for writing ('wb')
+        """
+        if mode == 'rb' and not self.exists(name):
+            raise errors.ResourceNotFound
+
+        return open(self.get_path(name, mode != 'rb'), mode)
+
+    def stream(self, name):
+        """
+        Open a file for a sequential read
+        """
+        return self.open(name)
+
+    def put_file(self, name, path):
+        """
+        Move a local file into the storage
+        """
+        os.rename(path, self.get_path(name, True))
+
+    def exists(self, name):
+        return os.path.isfile(self.get_path(name))
+
+    def stat(self, name):
+        """
+        :return: a (size, mtime) tuple
+        """
+        stat = os.stat(self.get_path(name))
+        return stat.st_size, stat.st_mtime
+
+    def delete(self, name):
+        """
+        Securely delete a file
+
+        :return: the number of bytes overwritten
+        """
+        path = self.get_path(name)
+        if not os.path.exists(path):
+            return 0
+
+        return overwrite_and_remove(path)
+
+
+class S3WriteFile(object):
+    """
+    File uploaded to the S3 storage when closed
+
+    The content is spooled in an anonymous temporary file so that the
+    upload can be performed with a known content length.
+    """
+    def __init__(self, storage, name):
+        self.storage = storage
+        self.name = name
+        self.fo = tempfile.TemporaryFile(dir=Settings.tmp_path)
+
+    def write(self, data):
+        self.fo.write(data)
+
+    def close(self):
+        if self.fo is None:
+            return
+
+        try:
+            self.fo.seek(0)
+            self.storage.upload(self.name, self.fo)
+        finally:
+            self.fo.close()
+            self.fo = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is not None:
+            self.fo.close()
+            self.fo = None
+        else:
+            self.close()
+
+
+class S3ReadFile(object):
+    """
+    File read sequentially from the response of the S3 storage
+    """
+    def __init__(self, conn, response):
+        self.conn = conn
+        self.response = response
+
+    def read(self, size=-1):
+        return self.response.read(None if size < 0 else size)
+
+    def close(self):
+        if self.conn is None:
+            return
+
+        self.response.close()
+        self.conn.close()
+        self.conn = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class S3Storage(object):
+    """
+    Driver storing the files in a bucket of an S3 compatible service
+
+    Requests are authenticated with AWS Signature Version 4 and use
+    path-style addressing, supported by AWS and by the self hosted
+    services like MinIO.
+
+    Objects cannot be overwritten in place and so are simply deleted.
+    """
+    chunk_size = 1024 * 1024
+    timeout = 30
+
+    def __init__(self, host, bucket, access_key, secret_key, region='us-east-1', secure=True, prefix=''):
+        self.host = host
+        self.bucket = bucket
+        self.access_key = access_key
+        self.secret_key = secret_key
+        self.region = region
+        self.secure = secure
+        self.prefix = prefix
+
+    @classmethod
+    def from_url(cls, url):
+        """
+        Configure the driver from an URL like:
+
+            s3://access_key:secret_key@host:port/bucket/prefix?region=eu-west-1
+
+        s3+http:// may be used for services not supporting TLS.
+        The credentials default to the AWS_ACCESS_KEY_ID and
+        AWS_SECRET_ACCESS_KEY environment variables.
+        """
+        url = urlparse(url)
+        query = parse_qs(url.query)
+
+        bucket, _, prefix = url.path.lstrip('/').partition('/')
+
+        return cls(url.hostname + (':%d' % url.port if url.port else ''),
+                   bucket,
+                   unquote(url.username or os.environ.get('AWS_ACCESS_KEY_ID', '')),
+                   unquote(url.password or os.environ.get('AWS_SECRET_ACCESS_KEY', '')),
+                   query.get('region', [os.environ.get('AWS_DEFAULT_REGION', 'us-east-1')])[0],
+                   url.scheme != 's3+http',
+                   prefix)
+
+    def get_object_path(self, name):
+        return quote('/%s/%s%s' % (self.bucket, self.prefix, name))
+
+    def sign(self, method, path, headers):
+        now = datetime.utcnow()
+        date = now.strftime('%Y%m%d')
+        timestamp = now.strftime('%Y%m%dT%H%M%SZ')
+
+        headers['host'] = self.host
+        headers['x-amz-date'] = timestamp
+        headers['x-amz-content-sha256'] = 'UNSIGNED-PAYLOAD'
+
+        names = sorted(headers)
+        signed_headers = ';'.join(names)
+        canonical_request = '\n'.join([method,
+                                       path,
+                                       '',
+                                       ''.join('%s:%s\n' % (x, str(headers[x]).strip()) for x in names),
+                                       signed_headers,
+                                       'UNSIGNED-PAYLOAD'])
+
+        scope = '%s/%s/s3/aws4_request' % (date, self.region)
+        string_to_sign = '\n'.join(['AWS4-HMAC-SHA256',
+                                    timestamp,
+                                    scope,
+                                    hashlib.sha256(canonical_request.encode()).hexdigest()])
+
+        key = ('AWS4' + self.secret_key).encode()
+        for x in [date, self.region, 's3', 'aws4_request']:
+            key = hmac.new(key, x.encode(), hashlib.sha256).digest()
+
+        signature = hmac.new(key, string_to_sign.encode(), hashlib.sha256).hexdigest()
+
+        headers['authorization'] = 'AWS4-HMAC-SHA256 Credential=%s/%s, SignedHeaders=%s, Signature=%s' % \
+                                   (self.access_key, scope, signed_headers, signature)
+
+    def request(self, method, name, body=None, headers=None):
+        headers = {} if headers is None else headers
+        path = self.get_object_path(name)
+
+        self.sign(method, path, headers)
+
+        if self.secure:
+            conn = http_client.HTTPSConnection(self.host, timeout=self.timeout)
+        else:
+            conn = http_client.HTTPConnection(self.host, timeout=self.timeout)
+
+        conn.request(method, path, body, headers)
+
+        response = conn.getresponse()
+        if response.status == 404:
+            response.read()
+            conn.close()
+            raise errors.ResourceNotFound
+
+        if response.status >= 300:
+            response.read()
+            conn.close()
+            raise errors.ExternalResourceError
+
+        return conn, response
+
+    def upload(self, name, fo):
+        fo.seek(0, os.SEEK_END)
+        size = fo.tell()
+        fo.seek(0)
+
+        conn, response = self.request('PUT', name, fo, {'content-length': str(size)})
+        response.read()
+        conn.close()
+
+    def open(self, name, mode='rb'):
+        """
+        Open a file for reading ('rb') or for writing ('wb')
+
+        Downloaded files are spooled in an anonymous temporary file
+        in order to offer a seekable file to the readers.
+        """
+        if mode != 'rb':
+            return S3WriteFile(self, name)
+
+        conn, response = self.request('GET', name)
+
+        fo = tempfile.TemporaryFile(dir=Settings.tmp_path)
+
+        try:
+            shutil.copyfileobj(response, fo, self.chunk_size)
+        except Exception:
+            fo.close()
+            raise
+        finally:
+            conn.close()
+
+        fo.seek(0)
+
+        return fo
+
+    def stream(self, name):
+        """
+        Open a file for a sequential read
+
+        The content is read directly from the response of the storage without
+        waiting for the download of the whole file; the reads are blocking and
+        the file is intended for the readers running in threads.
+        """
+        return S3ReadFile(*self.request('GET', name))
+
+    def put_file(self, name, path):
+        """
+        Move a local file into the storage
+        """
+        with open(path, 'rb') as fo:
+            self.upload(name, fo)
+
+        os.remove(path)
+
+    def exists(self, name):
+        try:
+            self.stat(name)
+        except errors.ResourceNotFound:
+            return False
+
+        return True
+
+    def stat(self, name):
+        """
+        :return: a (size, mtime) tuple
+        """
+        conn, response = self.request('HEAD', name)
+        response.read()
+        conn.close()
+
+        mtime = 0
+        last_modified = parsedate_tz(response.getheader('last-modified', ''))
+        if last_modified is not None:
+            mtime = mktime_tz(last_modified)
+
+        return int(response.getheader('content-length', 0)), mtime
+
+    def delete(self, name):
+        """
+        Delete a file
+
+        :return: the number of bytes overwritten, always 0
+        """
+        try:
+            conn, response = self.request('DELETE', name)
+        except errors.ResourceNotFound:
+            return 0
+
+        response.read()
+        conn.close()
+
+        return 0
+
+
+def get_storage(url, path):
+    """
+    Return the storage driver configured by the given URL, by default
+    the local storage of the given directory
+    """
+    if url and url.startswith(('s3://', 's3+http://')):
+        return S3Storage.from_url(url)
+
+    return LocalStorage(path)
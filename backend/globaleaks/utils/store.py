@@ -0,0 +1,501 @@
+# -*- coding: utf-8
+# Stores of expiring items
+#
+# The sessions and the tokens are kept in a store offering a subset of the
+# interface of the TempDict:
+#
+#  - MemoryStore, the default, keeps the items in the memory of the process;
+#  - SQLiteStore keeps the items in a SQLite database shared by all the
+#    backend processes running on the same host.
+#
+# The items can be indexed by some of their attributes in order to look up
+# efficiently all the items sharing the same value (e.g. the sessions of a user).
+#
+# The items include secrets like the session ids and the keys of the uploads
+# and a SQLite store is then accepted only on a memory filesystem.
+#
+# The methods of the stores are blocking; the code running on the reactor
+# accesses them by means of run() that moves the queries of a SQLite store
+# to a thread pool.
+import os
+import threading
+from collections import OrderedDict
+
+import sqlite3
+from six.moves import cPickle as pickle
+from twisted.internet import defer, reactor
+from twisted.internet.threads import deferToThreadPool
+from twisted.python.threadable import isInIOThread
+
+from globaleaks.rest import errors
+from globaleaks.utils import tempdict
+from globaleaks.utils.tempdict import TempDict
+
+memory_filesystems = frozenset(['tmpfs', 'ramfs'])
+
+
+def get_filesystem_type(path, mounts='/proc/mounts'):
+    """
+    Return the type of the filesystem containing a path or None if it could not be determined
+    """
+    path = os.path.realpath(path)
+
+    fstype, mountpoint_len = None, -1
+
+    try:
+        with open(mounts) as f:
+            for line in f:
+                fields = line.split()
+                if len(fields) < 3:
+                    continue
+
+                mountpoint = fields[1].replace('\\040', ' ')
+                if path != mountpoint and not path.startswith(mountpoint.rstrip('/') + '/'):
+                    continue
+
+                if len(mountpoint) > mountpoint_len:
+                    fstype, mountpoint_len = fields[2], len(mountpoint)
+    except (IOError, OSError):
+        return None
+
+    return fstype
+
+
+def is_on_memory_filesystem(path):
+    return get_filesystem_type(os.path.dirname(os.path.abspath(path))) in memory_filesystems
+
+
+class MemoryStore(TempDict):
+    """
+    Store keeping the items in memory
+    """
+    def __init__(self, timeout=None, indexes=()):
+        # attribute -> value -> set of the keys
+        self.indexes = dict((attr, {}) for attr in indexes)
+
+        TempDict.__init__(self, timeout)
+
+    def get_timeout(self):
+        return self.timeout() if callable(self.timeout) else self.timeout
+
+    def run(self, function, *args, **kwargs):
+        """
+        Run a function accessing the store; the items in memory are
+        accessed directly by the reactor
+        """
+        return defer.maybeDeferred(function, *args, **kwargs)
+
+    def _index(self, key, item):
+        for attr, index in self.indexes.items():
+            index.setdefault(getattr(item, attr), set()).add(key)
+
+    def _unindex(self, key, item):
+        for attr, index in self.indexes.items():
+            keys = index.get(getattr(item, attr))
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del index[getattr(item, attr)]
+
+    def __setitem__(self, key, item):
+        if key in self:
+            self._unindex(key, self[key])
+
+        TempDict.__setitem__(self, key, item)
+        self._index(key, item)
+
+    def __delitem__(self, key):
+        self._unindex(key, self[key])
+        TempDict.__delitem__(self, key)
+
+    def pop(self, key, *args):
+        if key in self:
+            self._unindex(key, self[key])
+
+        return TempDict.pop(self, key, *args)
+
+    def clear(self):
+        for index in self.indexes.values():
+            index.clear()
+
+        TempDict.clear(self)
+
+    def lookup(self, attr, value):
+        """
+        Return the keys of the items having the given value of an indexed attribute
+        """
+        return list(self.indexes[attr].get(value, ()))
+
+    def save(self, key, item):
+        """
+        Persist the changes of an item; the items in memory are kept by reference
+        """
+        pass
+
+    def update(self, key, function):
+        """
+        Apply a function changing an item and persist the result
+
+        :return: the updated item or None if the item does not exist
+        """
+        item = OrderedDict.get(self, key)
+        if item is not None:
+            function(item)
+
+        return item
+
+    def setdefault(self, key, item):
+        """
+        Store an item if the key is not already present
+
+        :return: the item stored with the key
+        """
+        current = self.get(key)
+        if current is not None:
+            return current
+
+        self.set(key, item)
+
+        return item
+
+
+class SQLiteStore(object):
+    """
+    Store keeping the items in a table of a SQLite database
+
+    The items are pickled; the indexed attributes are copied in dedicated
+    columns. Every process sharing the store sweeps the expired items and
+    the deletion guarantees that the expireCallback is run only once.
+    """
+    expireCallback = None
+
+    # granularity of the expiration expressed in seconds
+    resolution = 1
+
+    # time in seconds waited for the locks held by the other processes
+    busy_timeout = 30
+
+    def __init__(self, path, namespace, timeout=None, indexes=(), threadpool=None):
+        self.path = path
+        self.namespace = namespace
+        self.timeout = timeout
+        self.indexes = tuple(indexes)
+        self.threadpool = threadpool
+        self.sweepCall = None
+        self.lock = threading.Lock()
+
+        self.db = sqlite3.connect(path, timeout=self.busy_timeout, isolation_level=None, check_same_thread=False)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute('CREATE TABLE IF NOT EXISTS %s (key TEXT PRIMARY KEY, value BLOB NOT NULL, expiration REAL NOT NULL%s)' %
+                        (namespace, ''.join(', %s' % attr for attr in self.indexes)))
+        self.db.execute('CREATE INDEX IF NOT EXISTS %s_expiration ON %s (expiration)' % (namespace, namespace))
+        for attr in self.indexes:
+            self.db.execute('CREATE INDEX IF NOT EXISTS %s_%s ON %s (%s)' % (namespace, attr, namespace, attr))
+
+    def run(self, function, *args, **kwargs):
+        """
+        Run a function accessing the store in the thread pool of the store
+        """
+        return deferToThreadPool(reactor, self.threadpool, function, *args, **kwargs)
+
+    def _query(self, query, args=()):
+        try:
+            return self.db.execute(query, args)
+        except sqlite3.OperationalError as e:
+            if 'locked' in str(e):
+                raise errors.ServiceOverloaded()
+
+            raise
+
+    def _execute(self, query, *args):
+        cursor = self._query(query % {'table': self.namespace}, args)
+        return cursor.fetchall(), cursor.rowcount
+
+    def execute(self, query, *args):
+        with self.lock:
+            return self._execute(query, *args)
+
+    def transaction(self, function, *args):
+        """
+        Run a function in a transaction locking the database
+        against the writes of the other processes
+        """
+        with self.lock:
+            self._query('BEGIN IMMEDIATE')
+            try:
+                result = function(*args)
+            except:
+                self.db.execute('ROLLBACK')
+                raise
+
+            self.db.execute('COMMIT')
+
+            return result
+
+    def get_timeout(self):
+        return self.timeout() if callable(self.timeout) else self.timeout
+
+    def _values(self, item):
+        return (sqlite3.Binary(pickle.dumps(item, 2)),) + tuple(getattr(item, attr) for attr in self.indexes)
+
+    def _insert(self, key, item):
+        self._execute('INSERT OR REPLACE INTO %%(table)s (key, expiration, value%s) VALUES (?, ?, ?%s)' %
+                      (''.join(', %s' % attr for attr in self.indexes), ', ?' * len(self.indexes)),
+                      key, item.expireTime, *self._values(item))
+
+    def _save(self, key, item):
+        self._execute('UPDATE %%(table)s SET value = ?%s WHERE key = ?' %
+                      ''.join(', %s = ?' % attr for attr in self.indexes),
+                      *(self._values(item) + (key,)))
+
+    def set(self, key, item):
+        item.expireTime = tempdict.reactor.seconds() + self.get_timeout()
+
+        with self.lock:
+            self._insert(key, item)
+
+        self._schedule_sweep(item.expireTime)
+
+    def get(self, key):
+        rows, _ = self.execute('SELECT value, expiration FROM %(table)s WHERE key = ?', key)
+        if not rows:
+            return None
+
+        now = tempdict.reactor.seconds()
+        if rows[0][1] <= now:
+            self._expire(key)
+            return None
+
+        item = pickle.loads(bytes(rows[0][0]))
+        item.expireTime = now + self.get_timeout()
+
+        # the expiration is updated only when it moves by more than the
+        # resolution in order to limit the number of writes
+        if item.expireTime - rows[0][1] >= self.resolution:
+            self.execute('UPDATE %(table)s SET expiration = ? WHERE key = ?', item.expireTime, key)
+
+        return item
+
+    def save(self, key, item):
+        """
+        Persist the changes of an item
+        """
+        with self.lock:
+            self._save(key, item)
+
+    def _update(self, key, function):
+        rows, _ = self._execute('SELECT value, expiration FROM %(table)s WHERE key = ? AND expiration > ?',
+                                key, tempdict.reactor.seconds())
+        if not rows:
+            return None
+
+        item = pickle.loads(bytes(rows[0][0]))
+        item.expireTime = rows[0][1]
+
+        function(item)
+
+        self._save(key, item)
+
+        return item
+
+    def update(self, key, function):
+        """
+        Apply a function changing an item and persist the result
+
+        The update is atomic with respect to the other processes.
+
+        :return: the updated item or None if the item does not exist
+        """
+        return self.transaction(self._update, key, function)
+
+    def _setdefault(self, key, item):
+        now = tempdict.reactor.seconds()
+
+        rows, _ = self._execute('SELECT value, expiration FROM %(table)s WHERE key = ? AND expiration > ?', key, now)
+        if rows:
+            item = pickle.loads(bytes(rows[0][0]))
+            item.expireTime = rows[0][1]
+            return item
+
+        item.expireTime = now + self.get_timeout()
+
+        self._insert(key, item)
+
+        return item
+
+    def setdefault(self, key, item):
+        """
+        Store an item if the key is not already present
+
+        :return: the item stored with the key
+        """
+        item = self.transaction(self._setdefault, key, item)
+
+        self._schedule_sweep(item.expireTime)
+
+        return item
+
+    def pop(self, key, *args):
+        rows, _ = self.execute('SELECT value FROM %(table)s WHERE key = ?', key)
+        _, rowcount = self.execute('DELETE FROM %(table)s WHERE key = ?', key)
+        if not rows or not rowcount:
+            if args:
+                return args[0]
+
+            raise KeyError(key)
+
+        return pickle.loads(bytes(rows[0][0]))
+
+    def delete(self, key):
+        _, rowcount = self.execute('DELETE FROM %(table)s WHERE key = ?', key)
+        if not rowcount:
+            raise Exception("Failed to delete %s from %s" % (key, self.__class__))
+
+    def __delitem__(self, key):
+        self.pop(key)
+
+    def __contains__(self, key):
+        rows, _ = self.execute('SELECT 1 FROM %(table)s WHERE key = ? AND expiration > ?',
+                               key, tempdict.reactor.seconds())
+        return bool(rows)
+
+    def __iter__(self):
+        rows, _ = self.execute('SELECT key FROM %(table)s WHERE expiration > ?', tempdict.reactor.seconds())
+        return iter([row[0] for row in rows])
+
+    def __len__(self):
+        rows, _ = self.execute('SELECT COUNT(*) FROM %(table)s WHERE expiration > ?', tempdict.reactor.seconds())
+        return rows[0][0]
+
+    def clear(self):
+        self.execute('DELETE FROM %(table)s')
+
+    def lookup(self, attr, value):
+        """
+        Return the keys of the items having the given value of an indexed attribute
+        """
+        rows, _ = self.execute('SELECT key FROM %%(table)s WHERE %s = ?' % attr, value)
+        return [row[0] for row in rows]
+
+    def _schedule_sweep(self, sweep_time):
+        if not isInIOThread():
+            return reactor.callFromThread(self._schedule_sweep, sweep_time)
+
+        if self.sweepCall is not None:
+            if self.sweepCall.getTime() <= sweep_time:
+                return
+
+            self.sweepCall.cancel()
+
+        self.sweepCall = tempdict.reactor.callLater(max(sweep_time - tempdict.reactor.seconds(), 0),
+                                                    self.run, self._sweep)
+
+    def _expire(self, key):
+        rows, _ = self.execute('SELECT value FROM %(table)s WHERE key = ? AND expiration <= ?',
+                               key, tempdict.reactor.seconds())
+        if not rows:
+            return
+
+        # the item is expired only by the process succeeding in its deletion
+        _, rowcount = self.execute('DELETE FROM %(table)s WHERE key = ? AND expiration <= ?',
+                                   key, tempdict.reactor.seconds())
+        if rowcount and self.expireCallback is not None:
+            # pylint: disable=not-callable
+            self.expireCallback(pickle.loads(bytes(rows[0][0])))
+
+    def _sweep(self):
+        self.sweepCall = None
+
+        rows, _ = self.execute('SELECT key FROM %(table)s WHERE expiration <= ?', tempdict.reactor.seconds())
+        for row in rows:
+            self._expire(row[0])
+
+        rows, _ = self.execute('SELECT MIN(expiration) FROM %(table)s')
+        if rows[0][0] is not None:
+            self._schedule_sweep(rows[0][0])
+
+
+def get_store(url, namespace, timeout=None, indexes=(), threadpool=None):
+    """
+    Return the store configured by the given URL, by default
+    a store keeping the items in memory
+
+    A store shared by the processes running on the same host is configured
+    by means of an URL like sqlite:///var/globaleaks/store.db; its queries
+    are run by the given thread pool.
+    """
+    if url and url.startswith('sqlite://'):
+        return SQLiteStore(url[len('sqlite://'):], namespace, timeout, indexes, threadpool)
+
+    return MemoryStore(timeout, indexes)
+
+
+class StoredItems(object):
+    """
+    Base class of the collections of items kept in a store
+    """
+    namespace = None
+    indexes = ()
+
+    def __init__(self, timeout=None):
+        self.timeout = timeout
+        self.set_store_url(None)
+
+    def set_store_url(self, url, threadpool=None):
+        self.store = get_store(url, self.namespace, self.get_timeout, self.indexes, threadpool)
+        self.store.expireCallback = self.expireCallback
+
+    def get_timeout(self):
+        """The override of this method allows dynamic limits imlementations"""
+        return self.timeout
+
+    def expireCallback(self, item):
+        pass
+
+    def run(self, function, *args, **kwargs):
+        """
+        Run a function accessing the items; the queries of a shared
+        store are run off the reactor
+
+        :return: a Deferred firing with the result of the function
+        """
+        return self.store.run(function, *args, **kwargs)
+
+    def set(self, key, item):
+        self.store.set(key, item)
+
+    def get(self, key):
+        return self.store.get(key)
+
+    def save(self, key, item):
+        self.store.save(key, item)
+
+    def update(self, key, function):
+        return self.store.update(key, function)
+
+    def setdefault(self, key, item):
+        return self.store.setdefault(key, item)
+
+    def pop(self, key, *args):
+        return self.store.pop(key, *args)
+
+    def delete(self, key):
+        self.store.delete(key)
+
+    def lookup(self, attr, value):
+        return self.store.lookup(attr, value)
+
+    def clear(self):
+        self.store.clear()
+
+    def __delitem__(self, key):
+        del self.store[key]
+
+    def __contains__(self, key):
+        return key in self.store
+
+    def __iter__(self):
+        return iter(self.store)
+
+    def __len__(self):
+        return len(self.store)
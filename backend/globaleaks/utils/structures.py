@@ -5,11 +5,36 @@
 # This file contains the complex structures stored in Storm table
 # in order to checks integrity between exclusive options, provide defaults,
 # supports extensions (without changing DB format)
+import sqlite3
+
+from sqlalchemy import func
+from sqlalchemy.orm import defer
 
 from globaleaks.models import Model
 from globaleaks.state import State
 
 
+def probe_json_extract():
+    """
+    Return True if the SQLite library provides json_extract
+
+    The function is available since SQLite 3.9 when built with the JSON1 extension.
+    """
+    conn = sqlite3.connect(':memory:')
+
+    try:
+        conn.execute("SELECT json_extract('{}', '$.a')")
+    except sqlite3.OperationalError:
+        return False
+    finally:
+        conn.close()
+
+    return True
+
+
+json_extract_supported = probe_json_extract()
+
+
 # Localized strings utility management
 
 class Rosetta(object):
@@ -41,8 +66,6 @@ class Rosetta(object):
         return ret
 
     def dump_localized_key(self, key, language):
-        default_language = State.tenant_cache[1].default_language
-
         if key not in self._localized_strings:
             return ""
 
@@ -54,14 +77,8 @@ class Rosetta(object):
         if language is None:
             # When language is None we export the full language dictionary
             return translated_dict
-        elif language in translated_dict:
-            return translated_dict[language]
-        elif default_language in translated_dict:
-            return translated_dict[default_language]
-        elif u'en' in translated_dict:
-            return translated_dict[u'en']
-        else:
-            return ""
+
+        return get_localized_value(translated_dict, language)
 
 
 def fill_localized_keys(dictionary, keys, language):
@@ -73,19 +90,105 @@ def fill_localized_keys(dictionary, keys, language):
     return dictionary
 
 
-def get_localized_values(dictionary, obj, keys, language):
-    mo = Rosetta(keys)
+def get_fallback_languages(language):
+    """
+    Return the languages in which a localized string is looked up
+    """
+    ret = [language]
 
-    if isinstance(obj, dict):
-        mo.acquire_multilang_dict(obj)
-    elif isinstance(obj, Model):
-        mo.acquire_orm_object(obj)
+    for l in [State.tenant_cache[1].default_language, u'en']:
+        if l not in ret:
+            ret.append(l)
 
-    if language is not None:
-        dictionary.update({key: mo.dump_localized_key(key, language) for key in keys})
+    return ret
+
+
+def get_localized_value(translated_dict, language):
+    """
+    Return the translation in the given language of a localized string,
+    falling back on the default language and on english
+    """
+    if not isinstance(translated_dict, dict):
+        return ""
+
+    if language in translated_dict:
+        return translated_dict[language]
+
+    default_language = State.tenant_cache[1].default_language
+
+    if default_language in translated_dict:
+        return translated_dict[default_language]
+    elif u'en' in translated_dict:
+        return translated_dict[u'en']
     else:
-        for key in keys:
-            value = mo._localized_strings[key] if key in mo._localized_strings else ''
-            dictionary.update({key: value})
+        return ""
+
+
+def get_localized_values(dictionary, obj, keys, language):
+    is_dict = isinstance(obj, dict)
+    is_model = isinstance(obj, Model)
+
+    for key in keys:
+        if is_dict:
+            value = obj[key] if key in obj else ''
+        elif is_model:
+            value = getattr(obj, key)
+        else:
+            value = ''
+
+        dictionary[key] = value if language is None else get_localized_value(value, language)
 
     return dictionary
+
+
+def localized_column(column, language):
+    """
+    Return the SQL expression extracting from a localized column only
+    the translation in the given language and its fallbacks
+    """
+    return func.coalesce(*[func.json_extract(column, u'$."%s"' % l) for l in get_fallback_languages(language)] + [u''])
+
+
+def defer_localized_columns(model):
+    """
+    Return the query options deferring the loading of the localized columns of a model
+    """
+    return [defer(key) for key in model.localized_keys]
+
+
+def load_localized(query, model, language, l10n):
+    """
+    Execute a query of the objects of a model loading the localized
+    columns decoded in SQL only for the given language
+
+    When the language is None the full localized columns are needed
+    and the objects are loaded as usual without updating l10n.
+
+    When the SQLite library does not provide json_extract the localized
+    columns are loaded in full and decoded in python.
+
+    :param l10n: the dictionary updated with the localized values of each object
+    :return: the list of the objects
+    """
+    if language is None:
+        return query.all()
+
+    keys = model.localized_keys
+
+    if not json_extract_supported:
+        ret = query.all()
+
+        for obj in ret:
+            l10n[obj.id] = get_localized_values({}, obj, keys, language)
+
+        return ret
+
+    ret = []
+
+    columns = [localized_column(getattr(model, key), language) for key in keys]
+
+    for row in query.add_columns(*columns).options(*defer_localized_columns(model)):
+        ret.append(row[0])
+        l10n[row[0].id] = dict(zip(keys, row[1:]))
+
+    return ret
@@ -1,4 +1,15 @@
 # -*- coding: utf-8 -*-
+# TempDict
+#
+# Dictionary of items expiring after a timeout since their last access.
+#
+# Instead of scheduling a timer for each item the expirations are tracked
+# by means of a timer wheel: the keys are grouped in slots of resolution
+# seconds and a single delayed call is scheduled at the time of the oldest
+# slot. Accessing an item only updates its expiration time; when its slot
+# is swept the item is moved to the slot of its new expiration time.
+import heapq
+import math
 import six
 from collections import OrderedDict
 
@@ -11,9 +22,21 @@ reactor = _reactor
 class TempDict(OrderedDict):
     expireCallback = None
 
+    # granularity of the expiration expressed in seconds
+    resolution = 1
+
     def __init__(self, timeout=None, size_limit=None):
         self.timeout = timeout
         self.size_limit = size_limit
+
+        # slot time -> set of the keys expiring within the slot
+        self.slots = {}
+
+        # heap of the slot times
+        self.slot_times = []
+
+        self.sweepCall = None
+
         OrderedDict.__init__(self)
 
         self._check_size_limit()
@@ -28,28 +51,30 @@ class TempDict(OrderedDict):
 
     def set(self, key, item):
         self._check_size_limit()
-        timeout = self.get_timeout()
-        item.expireCall = reactor.callLater(timeout, self._expire, key)
+        item.expireTime = reactor.seconds() + self.get_timeout()
         self[key] = item
+        self._schedule(key, item.expireTime)
 
     def get(self, key):
-        if key in self:
-            if self[key].expireCall is not None:
-                self[key].expireCall.reset(self.get_timeout())
+        item = OrderedDict.get(self, key)
+        if item is None:
+            return None
 
-            return self[key]
+        now = reactor.seconds()
+        if item.expireTime <= now:
+            self._expire(key)
+            return None
+
+        item.expireTime = now + self.get_timeout()
 
-        return None
+        return item
 
     def delete(self, key):
         if key in self:
-            item = self.pop(key)
-            item.expireCall.cancel() # pylint: disable=no-member
-            self._expire(key)
+            self.pop(key)
         else:
             raise Exception("Failed to delete %s from %s" % (key, self.__class__))
 
-
     def _check_size_limit(self):
         size_limit = self.get_size_limit()
         if size_limit is not None:
@@ -58,6 +83,52 @@ class TempDict(OrderedDict):
                 k = next(six.iterkeys(self))
                 self.delete(k)
 
+    def _schedule(self, key, expire_time):
+        slot_time = int(math.ceil(expire_time / self.resolution)) * self.resolution
+
+        if slot_time not in self.slots:
+            self.slots[slot_time] = set()
+            heapq.heappush(self.slot_times, slot_time)
+            self._schedule_sweep()
+
+        self.slots[slot_time].add(key)
+
+    def _schedule_sweep(self):
+        if not self.slot_times:
+            return
+
+        sweep_time = self.slot_times[0]
+
+        if self.sweepCall is not None:
+            if self.sweepCall.getTime() <= sweep_time:
+                return
+
+            self.sweepCall.cancel()
+
+        self.sweepCall = reactor.callLater(max(sweep_time - reactor.seconds(), 0), self._sweep)
+
+    def _sweep(self):
+        self.sweepCall = None
+
+        now = reactor.seconds()
+
+        keys = []
+        while self.slot_times and self.slot_times[0] <= now:
+            keys.extend(self.slots.pop(heapq.heappop(self.slot_times)))
+
+        for key in keys:
+            item = OrderedDict.get(self, key)
+            if item is None:
+                # the item has been already deleted
+                continue
+
+            if item.expireTime <= now:
+                self._expire(key)
+            else:
+                self._schedule(key, item.expireTime)
+
+        self._schedule_sweep()
+
     def _expire(self, key):
         if key in self:
             if self.expireCallback is not None:
@@ -4,6 +4,7 @@
 # mainly in mail notifications.
 import collections
 import copy
+import re
 
 from datetime import timedelta
 
@@ -645,33 +646,74 @@ supported_template_types = {
 }
 
 
+# splits a template in the sequence of its literal texts (even indexes)
+# and of its candidate keywords (odd indexes)
+template_regexp = re.compile(r'(\{\w+\})')
+
+
 class Templating(object):
-    def format_template(self, raw_template, data):
-        keyword_converter = supported_template_types[data['type']](data)
-        for _ in range(3):
-            count = 0
+    # templates parsed by format_template, indexed by their text
+    templates_cache = {}
+    templates_cache_size = 1024
+
+    # number of times the keywords contained in the content of a keyword are
+    # in turn resolved; e.g. the admin_anomaly_disk_high template included
+    # by {AnomalyDetailDisk} contains itself keywords.
+    max_passes = 3
+
+    def parse_template(self, raw_template):
+        tokens = self.templates_cache.get(raw_template)
+        if tokens is None:
+            if len(self.templates_cache) >= self.templates_cache_size:
+                self.templates_cache.clear()
+
+            tokens = self.templates_cache[raw_template] = template_regexp.split(raw_template)
+
+        return tokens
 
-            for kw in keyword_converter.keyword_list:
-                if raw_template.count(kw):
-                    # if %SomeKeyword% matches, call keyword_converter.SomeKeyword function
-                    variable_content = getattr(keyword_converter, kw[1:-1])()
-                    raw_template = raw_template.replace(kw, variable_content)
+    def render_tokens(self, tokens, keyword_converter, keywords, values, depth):
+        output = []
 
-                    count += 1
+        for i, token in enumerate(tokens):
+            if not i % 2 or token not in keywords:
+                output.append(token)
+                continue
+
+            key = (token, depth)
+            if key not in values:
+                if token not in values:
+                    # if {SomeKeyword} matches, call keyword_converter.SomeKeyword function
+                    values[token] = getattr(keyword_converter, token[1:-1])()
+
+                value = values[token]
+                if depth < self.max_passes:
+                    # keyword contents are not cached as they may contain the user data
+                    value = self.render_tokens(template_regexp.split(value),
+                                               keyword_converter, keywords, values, depth + 1)
+
+                values[key] = value
 
-            # remobe lines with only {Blank}
-            raw_template = raw_template.replace('\n{Blank}\n', '\n')
+            output.append(values[key])
+
+        return ''.join(output)
+
+    def format_template(self, raw_template, data):
+        keyword_converter = supported_template_types[data['type']](data)
 
-            # remove remaining $Blank% tokens
-            raw_template = raw_template.replace('\n{Blank}', '')
+        # every keyword is evaluated at most once per template
+        text = self.render_tokens(self.parse_template(raw_template),
+                                  keyword_converter,
+                                  set(keyword_converter.keyword_list),
+                                  {},
+                                  1)
 
-            raw_template = raw_template.rstrip()
+        # remove lines with only {Blank}
+        text = text.replace('\n{Blank}\n', '\n')
 
-            if count == 0:
-                # finally!
-                break
+        # remove remaining {Blank} tokens
+        text = text.replace('\n{Blank}', '')
 
-        return raw_template
+        return text.rstrip()
 
     def get_mail_subject_and_body(self, data):
         subject_template = ''
@@ -12,14 +12,20 @@ from random import SystemRandom
 from globaleaks.rest import errors
 from globaleaks.utils.security import sha256, generateRandomKey
 from globaleaks.state import State
-from globaleaks.utils.tempdict import TempDict
+from globaleaks.utils.storage import get_sharded_path
+from globaleaks.utils.store import StoredItems
 from globaleaks.utils.utility import datetime_now, datetime_to_ISO8601
 from globaleaks.utils.log import log
 
 
-class TokenListClass(TempDict):
-    def __init__(self, *args, **kwds):
-        TempDict.__init__(self, *args, **kwds)
+# Number of the trailing zero hex digits of the hash solving the proof of
+# work required for each level of the activity alarm of the tenant; every
+# additional digit multiplies by 16 the work expected from the client.
+POW_DIFFICULTY = [2, 3, 4]
+
+
+class TokenListClass(StoredItems):
+    namespace = 'tokens'
 
     def get_timeout(self):
         return State.settings.submission_minimum_delay + \
@@ -28,14 +34,14 @@ class TokenListClass(TempDict):
     def expireCallback(self, item):
         for f in item.uploaded_files:
             try:
-                path = os.path.abspath(os.path.join(State.settings.tmp_path, f['filename']))
+                path = get_sharded_path(State.settings.tmp_path, f['filename'])
                 if os.path.exists(path):
                     os.remove(path)
             except:
                 pass
 
     def get(self, key):
-        ret = TempDict.get(self, key)
+        ret = StoredItems.get(self, key)
         if ret is None:
             raise errors.TokenFailure("Not found")
 
@@ -67,7 +73,10 @@ class Token(object):
         TokenList.set(self.id, self)
 
     def associate_file(self, fileinfo):
-        self.uploaded_files.append(fileinfo)
+        # the update is atomic as the files of a submission are uploaded in parallel
+        token = TokenList.update(self.id, lambda token: token.uploaded_files.append(fileinfo))
+        if token is not None:
+            self.uploaded_files = token.uploaded_files
 
     def __repr__(self):
         test_desc = "challenges:"
@@ -88,6 +97,7 @@ class Token(object):
             'type': self.kind,
             'human_captcha': False,
             'proof_of_work': False,
+            'proof_of_work_difficulty': 0,
             'human_captcha_answer': 0,
             'proof_of_work_answer': 0
         }
@@ -97,6 +107,7 @@ class Token(object):
 
         if not self.proof_of_work['solved']:
             r['proof_of_work'] = self.proof_of_work['question']
+            r['proof_of_work_difficulty'] = self.proof_of_work.get('difficulty', POW_DIFFICULTY[0])
 
         return r
 
@@ -113,8 +124,11 @@ class Token(object):
 
     def generate_proof_of_work(self):
         if State.tenant_cache[self.tid].enable_proof_of_work:
+            level = State.tenant_state[self.tid].Alarm.alarm_levels['activity']
+
             self.proof_of_work = {
                 'question': generateRandomKey(20),
+                'difficulty': POW_DIFFICULTY[min(level, len(POW_DIFFICULTY) - 1)],
                 'solved': False
             }
 
@@ -151,7 +165,7 @@ class Token(object):
         :param resolved_proof_of_work: a string, that has to be an integer
         :return:
         """
-        HASH_ENDS_WITH = b'00'
+        HASH_ENDS_WITH = b'0' * self.proof_of_work.get('difficulty', POW_DIFFICULTY[0])
 
         resolved = "%s%d" % (self.proof_of_work['question'], request_answer)
         x = sha256(resolved.encode())
@@ -183,6 +197,8 @@ class Token(object):
             if not self.proof_of_work['solved']:
                 self.generate_proof_of_work()
 
+        TokenList.save(self.id, self)
+
         return self.human_captcha['solved'] and self.proof_of_work['solved']
 
     def use(self):
@@ -194,9 +210,13 @@ class Token(object):
             TokenList.delete(self.id)
             raise e
 
+        TokenList.save(self.id, self)
+
         if not self.human_captcha['solved'] or not self.proof_of_work['solved']:
             raise errors.TokenFailure("Token is not solved")
 
     def solve(self):
         self.human_captcha = {'solved': True}
         self.proof_of_work = {'solved': True}
+
+        TokenList.save(self.id, self)
@@ -10,9 +10,12 @@ EXIT_ADDR_URL = b'https://check.torproject.org/exit-addresses'
 class TorExitSet(set):
     """Set that keep the list of Tor exit nodes ip using check.torproject.org"""
     def processData(self, data):
+        self.set_addresses(re.findall( r'ExitAddress ([^ ]*) ', text_type(data)))
+
+    def set_addresses(self, addresses):
         self.clear()
 
-        for ip in re.findall( r'ExitAddress ([^ ]*) ', text_type(data)):
+        for ip in addresses:
             self.add(ip)
 
     def update(self, agent):
@@ -7,18 +7,56 @@
 # that is initially derived from zipfile.py and then changed heavily for
 # our purpose (that's the reason why is not in third party)
 import binascii
+import collections
 import os
 import struct
+import threading
 import time
 import zlib
 
 from six import text_type
+from six.moves.queue import Queue, Empty, Full
 
 __all__ = ["ZipStream"]
 
 ZIP64_LIMIT= (1 << 31) - 1
 ZIP_DEFLATED = 8
 
+# Content types of formats already compressed that are deflated with no
+# compression, as compressing them again would only waste CPU time; the
+# entries are not stored as they are because the streaming readers can
+# locate the end of a stored entry only by its sizes, that are written
+# after the data in the data descriptor
+precompressed_content_types = frozenset([
+    'application/gzip',
+    'application/pgp-encrypted',
+    'application/vnd.openxmlformats-officedocument.presentationml.presentation',
+    'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+    'application/vnd.openxmlformats-officedocument.wordprocessingml.document',
+    'application/vnd.oasis.opendocument.presentation',
+    'application/vnd.oasis.opendocument.spreadsheet',
+    'application/vnd.oasis.opendocument.text',
+    'application/x-7z-compressed',
+    'application/x-bzip2',
+    'application/x-gzip',
+    'application/x-rar-compressed',
+    'application/x-xz',
+    'application/zip',
+    'image/gif',
+    'image/jpeg',
+    'image/png',
+    'image/webp'
+])
+
+precompressed_content_type_prefixes = ('audio/', 'video/')
+
+
+def is_precompressed(content_type):
+    content_type = (content_type or '').split(';')[0].strip().lower()
+
+    return content_type in precompressed_content_types or \
+           content_type.startswith(precompressed_content_type_prefixes)
+
 # Here are some struct module formats for reading headers
 structEndArchive = b"<4s4H2lH"     # 9 items, end of archive, 22 bytes
 stringEndArchive = b"PK\005\006"   # magic number for end of archive record
@@ -138,14 +176,35 @@ class ZipInfo(object):
         return header + filename + extra
 
 class ZipStream(object):
-    def __init__(self, files):
+    """
+    Generate a ZIP archive of the given files as a stream of chunks.
+
+    Each file is described by a dictionary with its 'name' in the archive
+    and either an open file object 'fo', a callable 'open' returning one or
+    a 'path'; files with a 'content_type' of an already compressed format
+    are not compressed. The files may be provided by a generator, that
+    is consumed only as the archive reaches them.
+
+    When a threadpool is given the files are read and compressed in its
+    threads, up to workers files in parallel each one buffering at most
+    prefetch chunks, while the iteration of the stream only assembles
+    the archive.
+    """
+    chunk_size = 64 * 1024
+
+    def __init__(self, files, threadpool=None, workers=4, prefetch=16):
         self.files = files
+        self.threadpool = threadpool
+        self.workers = workers
+        self.prefetch = prefetch
 
         self.filelist = []  # List of ZipInfo instances for archive
         self.data_ptr = 0   # Keep track of location inside archive
 
         self.time = time.gmtime()[0:6]  # Security: Forced Time
 
+        self.closed = threading.Event()
+
     def update_data_ptr(self, data):
         """
         As data is added to the archive, update a pointer so we can determine
@@ -158,63 +217,132 @@ class ZipStream(object):
         self.data_ptr += len(data)
         return data
 
-    def zipinfo_open(self, arcname):
-        zinfo = ZipInfo(arcname, self.time, ZIP_DEFLATED)
-        zinfo.header_offset = self.data_ptr
+    def compress_fo(self, zinfo, fo, level):
+        cmpr = zlib.compressobj(level, zlib.DEFLATED, -15)
 
-        cmpr = zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED, -15)
+        with fo:
+            while not self.closed.is_set():
+                buf = fo.read(self.chunk_size)
+                if not buf:
+                    break
 
-        header = zinfo.FileHeader()
+                zinfo.file_size += len(buf)
+                zinfo.CRC = binascii.crc32(buf, zinfo.CRC) & 0xffffffff
 
-        self.update_data_ptr(header)
+                buf = cmpr.compress(buf)
+                zinfo.compress_size += len(buf)
 
-        self.filelist.append(zinfo)
+                if buf:
+                    yield buf
 
-        return zinfo, cmpr, header
+        buf = cmpr.flush()
+        zinfo.compress_size += len(buf)
+        yield buf
 
-    def zipinfo_update(self, zinfo, cmpr, chunk):
-        zinfo.file_size += len(chunk)
-        zinfo.CRC = binascii.crc32(chunk, zinfo.CRC) & 0xffffffff
+    def compress_file(self, f):
+        if is_precompressed(f.get('content_type')):
+            level = zlib.Z_NO_COMPRESSION
+        else:
+            level = zlib.Z_DEFAULT_COMPRESSION
 
-        chunk = cmpr.compress(chunk)
-        zinfo.compress_size += len(chunk)
+        zinfo = ZipInfo(f['name'], self.time, ZIP_DEFLATED)
 
-        self.update_data_ptr(chunk)
+        if 'fo' in f:
+            fo = f['fo']
+        elif 'open' in f:
+            fo = f['open']()
+        else:
+            fo = open(f['path'], 'rb')
 
-        return chunk
+        return zinfo, self.compress_fo(zinfo, fo, level)
 
-    def zipinfo_close(self, zinfo, cmpr):
-        buf = cmpr.flush()
-        zinfo.compress_size += len(buf)
-        self.update_data_ptr(buf)
+    def put(self, queue, item):
+        while not self.closed.is_set():
+            try:
+                queue.put(item, timeout=1)
+                return
+            except Full:
+                pass
 
-        trailer = zinfo.DataDescriptor()
-        self.update_data_ptr(trailer)
+    def get(self, queue):
+        """
+        Return the next item of the queue of a worker or None if the stream is closed
+        """
+        while not self.closed.is_set():
+            try:
+                return queue.get(timeout=1)
+            except Empty:
+                pass
 
-        return buf + trailer
+    def compress_worker(self, f, queue):
+        try:
+            zinfo, chunks = self.compress_file(f)
+            self.put(queue, zinfo)
 
-    def zip_fo(self, fo, arcname):
-        zipinfo, cmpr, header = self.zipinfo_open(arcname)
+            for chunk in chunks:
+                self.put(queue, chunk)
 
-        yield header
+            self.put(queue, None)
+        except Exception as e:
+            self.put(queue, e)
 
-        with fo:
-            while True:
-                buf = fo.read(8 * 1024)
-                if not buf:
-                    break
+    def dequeue(self, queue):
+        while True:
+            item = self.get(queue)
+            if isinstance(item, Exception):
+                raise item
+
+            if item is None:
+                return
 
-                yield self.zipinfo_update(zipinfo, cmpr, buf)
+            yield item
 
-        yield self.zipinfo_close(zipinfo, cmpr)
+    def dequeue_file(self, queue):
+        zinfo = self.get(queue)
+        if isinstance(zinfo, Exception):
+            raise zinfo
 
-    def zip_file(self, filepath, arcname):
-        return self.zip_fo(open(filepath, "rb"), arcname)
+        if zinfo is None:
+            return None
+
+        return zinfo, self.dequeue(queue)
+
+    def compress_file_in_thread(self, f):
+        queue = Queue(self.prefetch)
+
+        self.threadpool.callInThread(self.compress_worker, f, queue)
+
+        return queue
+
+    def compress_files_in_threads(self):
+        pending = collections.deque()
+
+        for f in self.files:
+            pending.append(self.compress_file_in_thread(f))
+            if len(pending) >= self.workers:
+                item = self.dequeue_file(pending.popleft())
+                if item is None:
+                    return
+
+                yield item
+
+        while pending:
+            item = self.dequeue_file(pending.popleft())
+            if item is None:
+                return
+
+            yield item
+
+    def close(self):
+        """
+        Stop the generation of the archive terminating the worker threads
+        """
+        self.closed.set()
 
     def archive_footer(self):
         """
         Returns data to finish off an archive based on the files already
-        added via zip_file(...).  The data returned corresponds to the fields:
+        added to the stream.  The data returned corresponds to the fields:
 
         [archive decryption header]
         [archive extra data record]
@@ -300,13 +428,26 @@ class ZipStream(object):
         return b''.join(data)
 
     def __iter__(self):
-        for f in self.files:
-            if 'fo' in f:
-                for data in self.zip_fo(f['fo'], f['name']):
-                    yield data
+        if self.threadpool is not None:
+            files = self.compress_files_in_threads()
+        else:
+            files = (self.compress_file(f) for f in self.files)
+
+        try:
+            for zinfo, chunks in files:
+                zinfo.header_offset = self.data_ptr
+                self.filelist.append(zinfo)
+
+                yield self.update_data_ptr(zinfo.FileHeader())
+
+                for chunk in chunks:
+                    yield self.update_data_ptr(chunk)
+
+                if self.closed.is_set():
+                    return
 
-            elif 'path' in f:
-                for data in self.zip_file(f['path'], f['name']):
-                    yield data
+                yield self.update_data_ptr(zinfo.DataDescriptor())
 
-        yield self.archive_footer()
+            yield self.archive_footer()
+        finally:
+            self.close()
@@ -0,0 +1,195 @@
+# -*- coding: utf-8 -*-
+# Control channel among the processes serving the API
+#
+# The API workers exchange with the main process JSON messages, one per line:
+#
+#  - {"command": "refresh", "tid": tid} notifies the change of the configuration
+#    of a tenant, or of all the tenants when tid is null; the receivers
+#    invalidate their API cache and reload the tenant from the database.
+#    The main process relays the message to the other workers;
+#  - {"command": "call", "object": name, "method": method, "args": args}
+#    invokes a method of an object living only in the main process
+#    (e.g. the supervisor of the HTTPS workers);
+#  - {"command": "https_status", "running": bool, "status": dict} informs
+#    the workers of the status of the HTTPS workers;
+#  - {"command": "event", "tid": tid, "event": name, "duration": seconds}
+#    notifies the main process of an event tracked by a worker;
+#  - {"command": "alarm", "tid": tid, "activity": level} informs the workers
+#    of the activity alarm level of a tenant computed by the main process;
+#  - {"command": "failed_login"} notifies the main process of a failed login
+#    attempt; the main process counts the attempts, resets them periodically
+#    and informs the workers with {"command": "login_state",
+#    "failed_login_attempts": count, "api_token_session_suspended": bool};
+#  - {"command": "tor_exit_set", "ips": ips} informs the workers of the
+#    addresses of the Tor exit nodes fetched periodically by the main process;
+#  - {"command": "hash", "id": id, "password": password, "salt": salt} requests
+#    the hash of a password to the pool of the hashing workers of the main
+#    process that replies with {"command": "hash_result", "id": id, "hash": hash}
+#    or {"command": "hash_result", "id": id, "error": reason}.
+import json
+from datetime import timedelta
+
+from twisted.internet import defer
+from twisted.protocols.basic import LineOnlyReceiver
+
+from globaleaks.db import refresh_memory_variables
+from globaleaks.event import Event, add_event
+from globaleaks.rest import errors
+from globaleaks.rest.apicache import ApiCache
+from globaleaks.state import State
+from globaleaks.workers.hashing import HashingPool
+
+# objects of the main process whose methods can be invoked by the workers
+remote_objects = ['process_supervisor', 'onion_service_job']
+
+
+def encode_message(message):
+    return json.dumps(message).encode() + b'\n'
+
+
+def refresh(tid):
+    ApiCache.invalidate(tid)
+
+    return refresh_memory_variables(None if tid is None else [tid])
+
+
+def track_event(message):
+    add_event(message['tid'], Event({'name': message['event']}, timedelta(seconds=message['duration'])))
+
+
+def hash_password(pp, message):
+    def reply(password_hash):
+        pp.send({'command': 'hash_result', 'id': message['id'], 'hash': password_hash.decode()})
+
+    def error(failure):
+        reason = 'overloaded' if failure.check(errors.ServiceOverloaded) else str(failure.value)
+        pp.send({'command': 'hash_result', 'id': message['id'], 'error': reason})
+
+    return State.hashing_pool.hash_password(message['password'], message['salt']).addCallbacks(reply, error)
+
+
+def call(message):
+    if message['object'] not in remote_objects or message['method'].startswith('_'):
+        return
+
+    obj = getattr(State, message['object'])
+    if obj is not None:
+        return getattr(obj, message['method'])(*message['args'])
+
+
+class RemoteObject(object):
+    """
+    Proxy of an object of the main process
+
+    The methods are invoked by means of the control channel and
+    their completion is not awaited.
+    """
+    def __init__(self, control, name):
+        self.control = control
+        self.name = name
+
+    def __getattr__(self, method):
+        def remote_call(*args):
+            self.control.send({'command': 'call',
+                               'object': self.name,
+                               'method': method,
+                               'args': args})
+
+            return defer.succeed(None)
+
+        return remote_call
+
+
+class RemoteProcessSupervisor(RemoteObject):
+    """
+    Proxy of the supervisor of the main process keeping track of the
+    status of the HTTPS workers
+    """
+    def __init__(self, control):
+        RemoteObject.__init__(self, control, 'process_supervisor')
+        self.running = False
+        self.status = {}
+
+    def is_running(self):
+        return self.running
+
+    def get_status(self):
+        return self.status
+
+
+class RemoteHashingPool(HashingPool):
+    """
+    Proxy of the pool of the hashing workers of the main process
+
+    The pool is shared by all the processes serving the API so that the
+    number of the hashing workers and the admission control are global.
+    """
+    def __init__(self, control):
+        HashingPool.__init__(self)
+        self.control = control
+        self.counter = 0
+        self.pending = {}
+
+    def start(self):
+        pass
+
+    def stop(self):
+        return defer.succeed(None)
+
+    def hash_password(self, password, salt):
+        self.counter += 1
+
+        d = self.pending[self.counter] = defer.Deferred()
+
+        self.control.send({'command': 'hash',
+                           'id': self.counter,
+                           'password': password,
+                           'salt': salt})
+
+        return d
+
+    def handle_result(self, message):
+        d = self.pending.pop(message['id'], None)
+        if d is None:
+            return
+
+        if 'hash' in message:
+            d.callback(message['hash'].encode())
+        elif message['error'] == 'overloaded':
+            d.errback(errors.ServiceOverloaded())
+        else:
+            d.errback(errors.InternalServerError(message['error']))
+
+
+class ControlProtocol(LineOnlyReceiver):
+    """
+    Endpoint of the control channel of an API worker
+    """
+    delimiter = b'\n'
+
+    def send(self, message):
+        self.transport.write(encode_message(message))
+
+    def lineReceived(self, line):
+        message = json.loads(line.decode())
+
+        if message['command'] == 'refresh':
+            refresh(message['tid'])
+
+        elif message['command'] == 'https_status':
+            State.process_supervisor.running = message['running']
+            State.process_supervisor.status = message['status']
+
+        elif message['command'] == 'hash_result':
+            State.hashing_pool.handle_result(message)
+
+        elif message['command'] == 'alarm':
+            if message['tid'] in State.tenant_state:
+                State.tenant_state[message['tid']].Alarm.alarm_levels['activity'] = message['activity']
+
+        elif message['command'] == 'login_state':
+            State.settings.failed_login_attempts = message['failed_login_attempts']
+            State.api_token_session_suspended = message['api_token_session_suspended']
+
+        elif message['command'] == 'tor_exit_set':
+            State.tor_exit_set.set_addresses(message['ips'])
@@ -0,0 +1,157 @@
+# -*- coding: utf-8 -*-
+# Pool of processes computing the scrypt hashes of the passwords and receipts
+#
+# The hashing is CPU bound and it is kept out of the reactor and of the
+# threads of the ORM in order to not starve the requests accessing the
+# database during a storm of logins.
+#
+# The workers receive {"password": password, "salt": salt} and reply with
+# {"hash": hash} or {"error": reason}, one message per line.
+import logging
+import multiprocessing
+import os
+import signal
+from collections import deque
+from sys import executable
+
+from cryptography.hazmat.primitives import constant_time
+from twisted.internet import defer, reactor, threads
+
+from globaleaks.rest import errors
+from globaleaks.utils.log import log
+from globaleaks.utils.security import hash_password
+from globaleaks.workers.process import HashingProcProtocol
+
+
+class HashingPool(object):
+    """
+    Pool of a fixed number of hashing workers
+
+    The requests exceeding the capacity of the workers and of the queue
+    are rejected early with errors.ServiceOverloaded.
+    Until the pool is started the hashes are computed in the threads
+    of the reactor.
+    """
+    def __init__(self, size=None, queue_size=32):
+        self.size = size or multiprocessing.cpu_count()
+        self.queue_size = queue_size
+        self.shutting_down = False
+
+        self.process_pool = []
+        self.idle = []
+        self.busy = {}
+        self.queue = deque()
+        self.exits = {}
+
+        self.worker_path = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'worker_hashing.py')
+
+        self.cfg = {
+          'debug': False,
+          'control_in_fd': 43,
+          'control_out_fd': 44
+        }
+
+    def start(self):
+        self.shutting_down = False
+        self.cfg['debug'] = log.loglevel <= logging.DEBUG
+
+        for _ in range(self.size):
+            self.launch_worker()
+
+    def launch_worker(self):
+        pp = HashingProcProtocol(self, self.cfg)
+        reactor.spawnProcess(pp, executable, [executable, self.worker_path], childFDs=pp.fd_map, env=os.environ)
+        self.process_pool.append(pp)
+        self.idle.append(pp)
+
+        log.debug('Launched: %s', pp)
+
+        return pp.startup_promise
+
+    def stop(self):
+        """
+        Stop the workers
+
+        :return: a deferred firing when all the workers have exited
+        """
+        self.shutting_down = True
+
+        while self.queue:
+            self.queue.popleft()[2].errback(errors.ServiceOverloaded())
+
+        del self.idle[:]
+
+        exits = []
+        while self.process_pool:
+            pp = self.process_pool.pop(0)
+            self.exits[pp] = defer.Deferred()
+            exits.append(self.exits[pp])
+
+            try:
+                pp.transport.signalProcess(signal.SIGUSR1)
+            except OSError as e:
+                log.debug('Tried to signal: %d got: %s', pp.transport.pid, e)
+
+        return defer.DeferredList(exits)
+
+    def hash_password(self, password, salt):
+        """
+        Return a deferred firing with the result of hash_password(password, salt)
+        """
+        if not self.process_pool:
+            return threads.deferToThread(hash_password, password, salt)
+
+        if len(self.busy) + len(self.queue) >= self.size + self.queue_size:
+            return defer.fail(errors.ServiceOverloaded())
+
+        d = defer.Deferred()
+        self.queue.append((password, salt, d))
+        self.dispatch()
+
+        return d
+
+    def check_password(self, password, salt, password_hash):
+        """
+        Return a deferred firing with the result of check_password(password, salt, password_hash)
+        """
+        if not isinstance(password_hash, bytes):
+            password_hash = password_hash.encode()
+
+        return self.hash_password(password, salt).addCallback(constant_time.bytes_eq, password_hash)
+
+    def dispatch(self):
+        while self.idle and self.queue:
+            pp = self.idle.pop()
+            password, salt, d = self.queue.popleft()
+            self.busy[pp] = d
+            pp.send({'password': password, 'salt': salt})
+
+    def handle_message(self, pp, message):
+        d = self.busy.pop(pp)
+
+        if pp in self.process_pool:
+            self.idle.append(pp)
+            self.dispatch()
+
+        if 'error' in message:
+            d.errback(errors.InternalServerError(message['error']))
+        else:
+            d.callback(message['hash'].encode())
+
+    def handle_worker_death(self, pp, reason):
+        log.debug("Subprocess: %s exited with: %s", pp, reason)
+
+        if pp in self.process_pool: self.process_pool.remove(pp)
+        if pp in self.idle: self.idle.remove(pp)
+
+        d = self.busy.pop(pp, None)
+        if d is not None:
+            d.errback(errors.InternalServerError("Hashing worker terminated"))
+
+        d = self.exits.pop(pp, None)
+        if d is not None:
+            d.callback(None)
+
+        if not self.shutting_down:
+            self.launch_worker()
+            self.dispatch()
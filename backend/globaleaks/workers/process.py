@@ -95,3 +95,44 @@ class HTTPSProcProtocol(CfgFDProcProtocol):
 
         for tls_socket_fd in cfg['tls_socket_fds']:
             self.fd_map[tls_socket_fd] = tls_socket_fd
+
+
+class ChannelProcProtocol(CfgFDProcProtocol):
+    """
+    Protocol of a worker exchanging JSON messages, one per line,
+    with its supervisor through a pair of dedicated pipes
+    """
+    def __init__(self, supervisor, cfg, cfg_fd=42):
+        CfgFDProcProtocol.__init__(self, supervisor, cfg, cfg_fd)
+
+        self.control_in_fd = cfg['control_in_fd']
+        self.control_out_fd = cfg['control_out_fd']
+        self.fd_map[self.control_in_fd] = 'w'
+        self.fd_map[self.control_out_fd] = 'r'
+
+        self.control_buffer = b''
+
+    def send(self, message):
+        self.transport.writeToChild(self.control_in_fd, json.dumps(message).encode() + b'\n')
+
+    def childDataReceived(self, childFD, data):
+        if childFD != self.control_out_fd:
+            return CfgFDProcProtocol.childDataReceived(self, childFD, data)
+
+        self.control_buffer += data
+
+        while b'\n' in self.control_buffer:
+            line, self.control_buffer = self.control_buffer.split(b'\n', 1)
+            self.supervisor.handle_message(self, json.loads(line.decode()))
+
+
+class APIProcProtocol(ChannelProcProtocol):
+    def __init__(self, supervisor, cfg, cfg_fd=42):
+        ChannelProcProtocol.__init__(self, supervisor, cfg, cfg_fd)
+
+        for api_socket_fd in cfg['api_socket_fds']:
+            self.fd_map[api_socket_fd] = api_socket_fd
+
+
+class HashingProcProtocol(ChannelProcProtocol):
+    pass
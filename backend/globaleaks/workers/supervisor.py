@@ -8,10 +8,12 @@ from sys import executable
 from globaleaks.handlers.admin.https import load_tls_dict_list
 from globaleaks.models.config import ConfigFactory
 from globaleaks.orm import transact
+from globaleaks.state import State
 from globaleaks.utils import tls
 from globaleaks.utils.utility import datetime_now, datetime_to_ISO8601
 from globaleaks.utils.log import log
-from globaleaks.workers.process import HTTPSProcProtocol
+from globaleaks.workers import control
+from globaleaks.workers.process import APIProcProtocol, HTTPSProcProtocol
 from twisted.internet import defer, reactor
 
 
@@ -23,12 +25,16 @@ class ProcessSupervisor(object):
         log.info("Starting process monitor")
 
         self.shutting_down = False
+        self.api_shutting_down = False
 
         self.start_time = datetime_now()
         self.tls_process_pool = []
+        self.api_process_pool = []
         self.cpu_count = multiprocessing.cpu_count()
 
         self.worker_path = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'worker_https.py')
+        self.api_worker_path = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'worker_api.py')
+        self.api_cfg = None
 
         self.tls_cfg = {
           'proxy_ip': proxy_ip,
@@ -82,8 +88,80 @@ class ProcessSupervisor(object):
 
         log.info('Launched: %s', pp)
 
+        def startup_callback(result):
+            self.broadcast_https_status()
+            return result
+
+        pp.startup_promise.addCallback(startup_callback)
+
+        return pp.startup_promise
+
+    def launch_api_workers(self, net_sockets, settings, count):
+        """
+        Launch the API workers serving the requests on the given sockets
+        together with the main process
+
+        :param settings: the settings to be applied by the workers
+        """
+        self.api_cfg = {
+          'debug': log.loglevel <= logging.DEBUG,
+          'api_socket_fds': [ns.fileno() for ns in net_sockets],
+          'control_in_fd': 43,
+          'control_out_fd': 44,
+          'settings': settings
+        }
+
+        return defer.DeferredList([self.launch_api_worker() for _ in range(count)])
+
+    def launch_api_worker(self):
+        pp = APIProcProtocol(self, self.api_cfg)
+        reactor.spawnProcess(pp, executable, [executable, self.api_worker_path], childFDs=pp.fd_map, env=os.environ)
+        self.api_process_pool.append(pp)
+
+        log.info('Launched: %s', pp)
+
+        pp.send(self.get_https_status_message())
+        pp.send(State.get_login_state_message())
+        pp.send(State.get_tor_exit_set_message())
+
         return pp.startup_promise
 
+    def broadcast(self, message, origin=None):
+        """
+        Send a message to the API workers except the one originating it
+        """
+        for pp in self.api_process_pool:
+            if pp is not origin:
+                pp.send(message)
+
+    def get_https_status_message(self):
+        return {'command': 'https_status',
+                'running': self.is_running(),
+                'status': self.get_status()}
+
+    def broadcast_https_status(self):
+        self.broadcast(self.get_https_status_message())
+
+    def handle_message(self, pp, message):
+        """
+        Handle a message received from an API worker
+        """
+        if message['command'] == 'refresh':
+            self.broadcast(message, pp)
+            return control.refresh(message['tid'])
+
+        elif message['command'] == 'call':
+            return control.call(message)
+
+        elif message['command'] == 'event':
+            return control.track_event(message)
+
+        elif message['command'] == 'hash':
+            return control.hash_password(pp, message)
+
+        elif message['command'] == 'failed_login':
+            return State.track_failed_login()
+
     def launch_https_workers(self):
         return defer.DeferredList([self.launch_worker() for _ in range(self.cpu_count)])
 
@@ -96,11 +174,21 @@ class ProcessSupervisor(object):
     def handle_worker_death(self, pp, reason):
         log.debug("Subprocess: %s exited with: %s", pp, reason)
 
+        if isinstance(pp, APIProcProtocol):
+            if pp in self.api_process_pool: self.api_process_pool.remove(pp)
+
+            if not self.api_shutting_down:
+                self.launch_api_worker()
+
+            return
+
         if pp in self.tls_process_pool: self.tls_process_pool.remove(pp)
 
         if self.should_spawn_child():
             self.launch_worker()
 
+        self.broadcast_https_status()
+
     def get_status(self):
         if self.is_running():
             msg = "Everything is running normally."
@@ -126,6 +214,18 @@ class ProcessSupervisor(object):
 
         self.launch_https_workers()
 
+    def shutdown_api_workers(self):
+        log.debug('Starting API workers shutdown')
+
+        self.api_shutting_down = True
+
+        while self.api_process_pool:
+            try:
+                pp = self.api_process_pool.pop(0)
+                pp.transport.signalProcess(signal.SIGUSR1)
+            except OSError as e:
+                log.debug('Tried to signal: %d got: %s', pp.transport.pid, e)
+
     def shutdown(self):
         log.debug('Starting HTTPS workes shutdown')
 
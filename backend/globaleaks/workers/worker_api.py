@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+import os
+import sys
+
+if os.path.dirname(__file__) != '/usr/lib/python2.7/dist-packages/globaleaks/workers':
+    sys.path.insert(1, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+
+from twisted.internet import reactor
+from twisted.internet.stdio import StandardIO
+from twisted.web.server import Site
+
+# this import seems unused but it is required in order to load the mocks
+import globaleaks.mocks.twisted_mocks # pylint: disable=W0611
+
+from globaleaks.settings import Settings
+from globaleaks.state import State
+from globaleaks.workers.process import Process
+
+
+class APIProcess(Process):
+    name = 'gl-api-worker'
+    ports = []
+
+    def __init__(self, *args, **kwargs):
+        super(APIProcess, self).__init__(*args, **kwargs)
+
+        for key, value in self.cfg['settings'].items():
+            setattr(Settings, key, value)
+
+        Settings.eval_paths()
+
+        os.umask(0o77)
+
+        # the modules reading the settings at import time are imported
+        # only once the settings of the main process have been applied
+        from globaleaks.db import sync_refresh_memory_variables
+        from globaleaks.rest.api import APIResourceWrapper
+        from globaleaks.sessions import Sessions
+        from globaleaks.utils.log import timedLogFormatter
+        from globaleaks.utils.sock import listen_tcp_on_sock
+        from globaleaks.utils.storage import get_storage
+        from globaleaks.utils.token import TokenList
+        from globaleaks.workers.control import ControlProtocol, RemoteHashingPool, RemoteObject, RemoteProcessSupervisor
+
+        State.storage = get_storage(Settings.storage_url, Settings.attachments_path)
+
+        Sessions.set_store_url(Settings.store_url, State.store_tp)
+        TokenList.set_store_url(Settings.store_url, State.store_tp)
+        State.TempUploadFiles.set_store_url(Settings.store_url, State.store_tp)
+        State.AcmeChallenges.set_store_url(Settings.store_url, State.store_tp)
+
+        sync_refresh_memory_variables()
+
+        State.orm_tp.start()
+        State.secure_delete_tp.start()
+        State.export_tp.start()
+        State.compress_tp.start()
+        State.store_tp.start()
+
+        State.control = ControlProtocol()
+        StandardIO(State.control, stdin=self.cfg['control_in_fd'], stdout=self.cfg['control_out_fd'])
+
+        State.process_supervisor = RemoteProcessSupervisor(State.control)
+        State.hashing_pool = RemoteHashingPool(State.control)
+        State.onion_service_job = RemoteObject(State.control, 'onion_service_job')
+
+        self.api_factory = Site(APIResourceWrapper(), logFormatter=timedLogFormatter)
+
+        if not Settings.devel_mode:
+            self.api_factory.displayTracebacks = False
+
+        for socket_fd in self.cfg['api_socket_fds']:
+            self.log("Opening socket: %d : %s" % (socket_fd, os.fstat(socket_fd)))
+
+            port = listen_tcp_on_sock(reactor, socket_fd, self.api_factory)
+
+            self.ports.append(port)
+
+    def sigusr1(self):
+        reactor.callFromThread(reactor.stop)
+
+    def shutdown(self):
+        for port in self.ports:
+            port.stopListening()
+
+        del self.ports[:]
+
+        if State.orm_tp.started:
+            State.orm_tp.stop()
+
+        for tp in [State.secure_delete_tp, State.export_tp, State.compress_tp, State.store_tp]:
+            if tp.started:
+                tp.stop()
+
+        Process.shutdown(self)
+
+
+if __name__ == '__main__':
+    APIProcess().start()
@@ -0,0 +1,44 @@
+# -*- coding: utf-8 -*-
+import json
+import os
+import sys
+
+if os.path.dirname(__file__) != '/usr/lib/python2.7/dist-packages/globaleaks/workers':
+    sys.path.insert(1, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+
+from twisted.internet import reactor
+from twisted.internet.stdio import StandardIO
+from twisted.protocols.basic import LineOnlyReceiver
+
+from globaleaks.utils.security import hash_password
+from globaleaks.workers.process import Process
+
+
+class HashingProtocol(LineOnlyReceiver):
+    delimiter = b'\n'
+
+    def lineReceived(self, line):
+        message = json.loads(line.decode())
+
+        try:
+            reply = {'hash': hash_password(message['password'], message['salt']).decode()}
+        except Exception as e:
+            reply = {'error': str(e)}
+
+        self.transport.write(json.dumps(reply).encode() + b'\n')
+
+
+class HashingProcess(Process):
+    name = 'gl-hashing-worker'
+
+    def __init__(self, *args, **kwargs):
+        super(HashingProcess, self).__init__(*args, **kwargs)
+
+        StandardIO(HashingProtocol(), stdin=self.cfg['control_in_fd'], stdout=self.cfg['control_out_fd'])
+
+    def sigusr1(self):
+        reactor.callFromThread(reactor.stop)
+
+
+if __name__ == '__main__':
+    HashingProcess().start()
@@ -554,8 +554,8 @@ var GLClient = angular.module('GLClient', [
     _flowFactoryProvider.defaults = {
         chunkSize: 1000 * 1024,
         forceChunkSize: true,
-        testChunks: false,
-        simultaneousUploads: 1,
+        testChunks: true,
+        simultaneousUploads: 3,
         generateUniqueIdentifier: function () {
           return Math.random() * 1000000 + 1000000;
         },
@@ -5,8 +5,8 @@ GLClient.controller('ReceiverCtrl', ['$scope', '$location', function($scope, $lo
   $scope.active = {};
   $scope.active[current_menu] = "active";
 }]).
-controller('ReceiverTipsCtrl', ['$scope',  '$filter', '$http', '$route', '$location', '$uibModal', 'RTipExport', 'ReceiverTips',
-  function($scope, $filter, $http, $route, $location, $uibModal, RTipExport, ReceiverTips) {
+controller('ReceiverTipsCtrl', ['$scope',  '$filter', '$http', '$route', '$location', '$uibModal', 'RTipExport', 'RTipsExport', 'ReceiverTips',
+  function($scope, $filter, $http, $route, $location, $uibModal, RTipExport, RTipsExport, ReceiverTips) {
   $scope.search = undefined;
   $scope.currentPage = 1;
   $scope.itemsPerPage = 20;
@@ -30,6 +30,10 @@ controller('ReceiverTipsCtrl', ['$scope',  '$filter', '$http', '$route', '$locat
 
   $scope.exportTip = RTipExport;
 
+  $scope.tip_export_all = function () {
+    RTipsExport($scope.selected_tips);
+  };
+
   $scope.selected_tips = [];
 
   $scope.select_all = function () {
@@ -35,14 +35,26 @@ angular.module('GLBrowserCrypto', [])
   };
 
   return {
-    proofOfWork: function(str) {
+    proofOfWork: function(str, difficulty) {
       var deferred = $q.defer();
 
       var i = 0;
 
+      // the hexadecimal digest has to end with difficulty zeros
+      var solved = function(hash) {
+        var j;
+        for (j = 0; j < Math.floor(difficulty / 2); j++) {
+          if (hash[31 - j] !== 0) {
+            return false;
+          }
+        }
+
+        return difficulty % 2 === 0 || (hash[31 - j] & 0x0f) === 0;
+      };
+
       var xxx = function (hash) {
         hash = new Uint8Array(hash);
-        if (hash[31] === 0) {
+        if (solved(hash)) {
           deferred.resolve(i);
         } else {
           i += 1;
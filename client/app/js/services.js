@@ -418,6 +418,18 @@ factory("Access", ["$q", "Authentication", function ($q, Authentication) {
         FileSaver.saveAs(response.data, filename);
       });
     };
+}]).
+  factory('RTipsExport', ['$http', 'FileSaver', function($http, FileSaver) {
+    return function(tips) {
+      $http({
+        method: 'POST',
+        url: 'rtip/export',
+        data: {'rtips': tips},
+        responseType: 'blob',
+      }).then(function (response) {
+        FileSaver.saveAs(response.data, 'submissions.zip');
+      });
+    };
 }]).
   factory('RTip', ['$rootScope', '$http', '$filter', 'RTipResource', 'RTipMessageResource', 'RTipCommentResource',
           function($rootScope, $http, $filter, RTipResource, RTipMessageResource, RTipCommentResource) {